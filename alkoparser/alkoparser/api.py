@@ -0,0 +1,26 @@
+from urllib.parse import urlsplit
+
+# Адрес web-api по умолчанию, переопределяется настройкой ALKOTEKA_BASE_URL
+DEFAULT_BASE_URL = "https://alkoteka.com"
+
+
+class ApiSpiderMixin:
+    """Строит адреса web-api от ALKOTEKA_BASE_URL вместо жёстко заданного домена."""
+
+    base_url = DEFAULT_BASE_URL
+    api_base = f"{DEFAULT_BASE_URL}/web-api/v1"
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.base_url = crawler.settings.get('ALKOTEKA_BASE_URL', DEFAULT_BASE_URL).rstrip('/')
+        spider.api_base = f"{spider.base_url}/web-api/v1"
+        # Аргументы запуска (-a) для журнала производительности
+        spider.arguments = dict(kwargs)
+
+        # Иначе OffsiteMiddleware отбросит запросы к локальной заглушке
+        host = urlsplit(spider.base_url).hostname
+        if host and spider.allowed_domains and host not in spider.allowed_domains:
+            spider.allowed_domains = [*spider.allowed_domains, host]
+        return spider
+
@@ -0,0 +1 @@
+# Собственные команды проекта для scrapy (COMMANDS_MODULE в settings.py)
@@ -0,0 +1,119 @@
+import json
+import socket
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.settings import SETTINGS_PRIORITIES
+from scrapy.utils.conf import arglist_to_dict
+from scrapy.utils.reactor import install_reactor
+
+from ..daemon import CrawlDaemon
+
+
+def parse_address(uri: str) -> tuple:
+    """``unix:///путь`` или ``tcp://хост:порт`` -> (семейство сокета, адрес)."""
+    parts = urlsplit(uri)
+    if parts.scheme == 'unix':
+        return socket.AF_UNIX, parts.path
+    if parts.scheme == 'tcp' and parts.port:
+        return socket.AF_INET, (parts.hostname or '127.0.0.1', parts.port)
+    raise UsageError(f"Неверный адрес {uri!r}: unix:///путь или tcp://хост:порт", print_help=False)
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    requires_crawler_process = True
+
+    # Настройки тёплого режима. Не default_settings: у тех приоритет ниже настроек проекта
+    warm_settings = {
+        'DAEMON_SHARE_STATE': True,
+        'DOWNLOAD_HANDLERS': {
+            'http': 'alkoparser.handlers.TunedDownloadHandler',
+            'https': 'alkoparser.handlers.TunedDownloadHandler',
+        },
+    }
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Долгоживущий процесс обходов с тёплым пулом, robots.txt и AutoThrottle"
+
+    def long_desc(self):
+        return (
+            "Без --submit слушает DAEMON_ADDRESS и выполняет присланные задания в одном процессе: "
+            "между заданиями остаются открытые соединения, разобранный robots.txt и задержки "
+            "AutoThrottle. С --submit отправляет задание работающему процессу, например: "
+            "scrapy daemon --submit products -a cities=<uuid> -a mode=sample --wait"
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--address", help="unix:///путь или tcp://хост:порт (по умолчанию DAEMON_ADDRESS)")
+        parser.add_argument("--submit", metavar="SPIDER", help="отправить задание с этим пауком")
+        parser.add_argument("-a", dest="spargs", action="append", default=[], metavar="NAME=VALUE",
+                            help="аргумент паука для --submit (можно несколько раз)")
+        parser.add_argument("--setting", dest="job_settings", action="append", default=[], metavar="NAME=VALUE",
+                            help="настройка задания для --submit (можно несколько раз)")
+        parser.add_argument("--wait", action="store_true", help="с --submit дождаться завершения задания")
+        parser.add_argument("--status", action="store_true", help="показать задания работающего процесса")
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        try:
+            opts.spargs = arglist_to_dict(opts.spargs)
+            opts.job_settings = arglist_to_dict(opts.job_settings)
+        except ValueError:
+            raise UsageError("Аргументы задаются как NAME=VALUE", print_help=False)
+
+    def run(self, args, opts):
+        address = opts.address or self.settings.get('DAEMON_ADDRESS')
+        family, target = parse_address(address)
+
+        if opts.submit or opts.status:
+            if opts.status:
+                message = {'command': 'status'}
+            else:
+                message = {'spider': opts.submit, 'args': opts.spargs, 'settings': opts.job_settings}
+            self.exitcode = self.send(family, target, message, opts.wait)
+            return
+
+        for name, value in self.warm_settings.items():
+            # -s в командной строке по-прежнему главнее
+            if self.settings.getpriority(name) < SETTINGS_PRIORITIES['cmdline']:
+                self.settings.set(name, value, priority='cmdline')
+
+        # CrawlerProcess ставит реактор только при первом обходе, а сокет нужен раньше
+        install_reactor(self.settings['TWISTED_REACTOR'])
+        from twisted.internet import reactor
+
+        daemon = CrawlDaemon(self.crawler_process, self.settings)
+        if family == socket.AF_UNIX:
+            # Сокет от прошлого запуска мешает bind
+            Path(target).unlink(missing_ok=True)
+            reactor.listenUNIX(target, daemon.factory())
+        else:
+            reactor.listenTCP(target[1], daemon.factory(), interface=target[0])
+        print(f"Жду заданий на {address}, одновременно до {self.settings.getint('DAEMON_MAX_JOBS', 1)}")
+        self.crawler_process.start(stop_after_crawl=False)
+
+    @staticmethod
+    def send(family, target, message: dict, wait: bool) -> int:
+        """Отправляет запрос и печатает ответы; код выхода 1, если задание не выполнено."""
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(target)
+            except OSError as e:
+                raise UsageError(f"Процесс обходов не отвечает на {target}: {e}", print_help=False)
+            sock.sendall(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+            for line in sock.makefile('r', encoding='utf-8'):
+                print(line.rstrip('\n'))
+                reply = json.loads(line)
+                status = reply.get('status')
+                if status in ('error', 'failed'):
+                    return 1
+                if status in ('ok', 'finished') or (status == 'queued' and not wait):
+                    return 0
+        return 1
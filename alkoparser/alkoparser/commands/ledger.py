@@ -0,0 +1,76 @@
+from pathlib import Path
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..ledger import compare, read_ledger
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    requires_crawler_process = False
+    default_settings = {'LOG_LEVEL': 'WARNING'}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Сравнение запуска с базой по журналу производительности"
+
+    def long_desc(self):
+        return (
+            "Показывает последние запуски из PERF_LEDGER_FILE и сравнивает выбранный "
+            "запуск (по умолчанию последний) с медианой предыдущих запусков того же паука с теми же аргументами: "
+            "товаров в минуту, пик памяти, байт на товар и p90 задержки карточек. "
+            "При регрессии завершается с кодом 1, так что годится для CI."
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("-f", "--file", help="журнал (по умолчанию PERF_LEDGER_FILE)")
+        parser.add_argument("--spider", help="только запуски этого паука")
+        parser.add_argument("--run", type=int, default=-1,
+                            help="номер запуска в журнале, отрицательный — с конца (по умолчанию: %(default)s)")
+        parser.add_argument("--window", type=int, help="размер базы (по умолчанию PERF_LEDGER_WINDOW)")
+        parser.add_argument("--threshold", type=float, help="порог регрессии (по умолчанию PERF_LEDGER_THRESHOLD)")
+        parser.add_argument("--last", type=int, default=10, help="сколько запусков показать в истории")
+
+    def run(self, args, opts):
+        path = Path(opts.file or self.settings.get('PERF_LEDGER_FILE') or '')
+        runs = read_ledger(path) if path.name else []
+        if opts.spider:
+            runs = [run for run in runs if run['spider'] == opts.spider]
+        if not runs:
+            raise UsageError(f"В журнале {path} нет запусков", print_help=False)
+
+        window = opts.window or self.settings.getint('PERF_LEDGER_WINDOW', 5)
+        threshold = opts.threshold or self.settings.getfloat('PERF_LEDGER_THRESHOLD', 0.15)
+
+        print(f"{'время':25} {'паук':10} {'настройки':12} {'товаров':>8} {'тов/мин':>8} {'память МБ':>9}  аргументы")
+        for run in runs[-opts.last:]:
+            stats = run['stats']
+            memory = (stats.get('memusage/max') or 0) / 2 ** 20
+            arguments = ' '.join(f"{key}={value}" for key, value in run.get('arguments', {}).items())
+            print(
+                f"{run['time']:25} {run['spider']:10} {run['settings_fingerprint']:12} "
+                f"{stats.get('item_scraped_count', 0):>8} {stats.get('items_per_minute') or 0:>8.0f} "
+                f"{memory:>9.1f}  {arguments}"
+            )
+
+        try:
+            index = opts.run if opts.run >= 0 else len(runs) + opts.run
+            run = runs[index]
+        except IndexError:
+            raise UsageError(f"Нет запуска с номером {opts.run}", print_help=False)
+
+        report = compare(run, runs[:index], window, threshold)
+        print(f"\nЗапуск {run['time']} против медианы {window} предыдущих, порог {threshold:.0%}:")
+        if not report:
+            print("  нет предыдущих запусков для сравнения")
+            return
+        for name, value, base, change, regression in report:
+            mark = 'РЕГРЕССИЯ' if regression else 'ок'
+            print(f"  {name:20} {value:>12} база {base:>12}  {change:+7.1%}  {mark}")
+
+        if any(row[4] for row in report):
+            self.exitcode = 1
@@ -0,0 +1,61 @@
+from scrapy.commands import ScrapyCommand
+
+from ..mockserver import MockApiServer, SyntheticCatalog, load_recorded
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    requires_crawler_process = False
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Запустить локальную заглушку web-api alkoteka.com"
+
+    def long_desc(self):
+        return (
+            "Запускает HTTP-сервер, который отдаёт записанные или синтетические ответы "
+            "web-api alkoteka.com. Пауки направляются на него настройкой "
+            "-s ALKOTEKA_BASE_URL=http://127.0.0.1:8089"
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--host", default="127.0.0.1", help="адрес (по умолчанию: %(default)s)")
+        parser.add_argument("--port", type=int, default=8089, help="порт (по умолчанию: %(default)s)")
+        parser.add_argument("--products", type=int, default=10000,
+                            help="размер синтетического каталога (по умолчанию: %(default)s)")
+        parser.add_argument("--seed", type=int, default=1, help="seed генератора каталога")
+        parser.add_argument("--record-dir", metavar="DIR",
+                            help="каталог HTTPCACHE_DIR с записанными ответами настоящего сайта")
+        parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+        parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, секунды")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 5xx, 0..1")
+        parser.add_argument("--burst-every", type=float, default=0.0,
+                            help="период всплесков 429, секунды (0 — без всплесков)")
+        parser.add_argument("--burst-length", type=float, default=0.0, help="длительность всплеска 429, секунды")
+        parser.add_argument("--verbose", action="store_true", help="логировать каждый запрос")
+
+    def run(self, args, opts):
+        catalog = SyntheticCatalog.from_project(products=opts.products, seed=opts.seed)
+        recorded = load_recorded(opts.record_dir) if opts.record_dir else {}
+
+        server = MockApiServer(
+            (opts.host, opts.port), catalog, recorded,
+            latency=opts.latency, jitter=opts.jitter, error_rate=opts.error_rate,
+            burst_every=opts.burst_every, burst_length=opts.burst_length, verbose=opts.verbose,
+        )
+        print(
+            f"Заглушка web-api на http://{opts.host}:{opts.port}: "
+            f"{catalog.size} товаров, {len(catalog.cities)} городов, "
+            f"{len(catalog.categories)} категорий, записанных ответов: {len(recorded)}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print(f"Ответы: {server.counters}")
@@ -0,0 +1,69 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..outbox import Outbox
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    requires_crawler_process = False
+    default_settings = {'LOG_LEVEL': 'WARNING'}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Потребители outbox изменений: отставание и чтение событий"
+
+    def long_desc(self):
+        return (
+            "Без --consume показывает потребителей OUTBOX_FILE, их смещения и сколько событий они ещё не "
+            "получили. С --consume выводит следующие события потребителя строками JSON и сдвигает его "
+            "смещение; с --follow продолжает ждать новых событий, пока идёт обход."
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("-f", "--file", help="база outbox (по умолчанию OUTBOX_FILE)")
+        parser.add_argument("--consume", metavar="ИМЯ", help="читать события от имени потребителя")
+        parser.add_argument("--limit", type=int, default=500, help="событий за одно чтение (по умолчанию: %(default)s)")
+        parser.add_argument("--follow", action="store_true", help="ждать новых событий")
+        parser.add_argument("--interval", type=float, default=1.0, help="пауза между опросами в --follow, с")
+
+    def run(self, args, opts):
+        path = Path(opts.file or self.settings.get('OUTBOX_FILE') or '')
+        if not path.name or not path.exists():
+            raise UsageError(f"Нет базы outbox {path}", print_help=False)
+
+        outbox = Outbox(path)
+        try:
+            if opts.consume:
+                self.consume(outbox, opts)
+            else:
+                last = outbox.last_id()
+                print(f"Последнее событие: {last}")
+                for consumer, offset in outbox.consumers().items():
+                    print(f"  {consumer}: смещение {offset}, не получено {last - offset}")
+        finally:
+            outbox.close()
+
+    def consume(self, outbox: Outbox, opts):
+        while True:
+            batch = outbox.read(opts.consume, opts.limit)
+            for _, event in batch:
+                sys.stdout.write(json.dumps(event, ensure_ascii=False) + '\n')
+            sys.stdout.flush()
+            if batch:
+                outbox.ack(opts.consume, batch[-1][0])
+            elif not opts.follow:
+                return
+            else:
+                try:
+                    time.sleep(opts.interval)
+                except KeyboardInterrupt:
+                    return
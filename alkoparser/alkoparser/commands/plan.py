@@ -0,0 +1,248 @@
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..planner import build_shards, default_page_size, pack, save_plan
+from ..query import mark_feed_done
+
+# Журналы процесса, которые рабочие пишут каждый в свой файл под --workdir
+WORKER_FILES = {
+    'VALIDATION_QUARANTINE_FILE': 'quarantine-{index}.jsonl',
+    'DEADLETTER_FILE': 'dead_letters-{index}.jsonl',
+    'PERF_LEDGER_FILE': 'perf_ledger-{index}.jsonl',
+    'PROFILER_DIR': 'profiles-{index}',
+}
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Спланировать обход товаров и запустить его в нескольких процессах"
+
+    def long_desc(self):
+        return (
+            "Собирает meta.total по всем парам (город, категория) пауком totals, разбивает "
+            "каталог на шарды, раскладывает их по N рабочим единицам с равной оценкой "
+            "стоимости, запускает N процессов паука products и склеивает их выгрузки. Процессы "
+            "работают в одном каталоге и делят файлы состояния конвейеров (SQLite): запись в них "
+            "идёт короткими транзакциями, свои пути рабочим не нужны. Карантин, dead-letter, журнал "
+            "производительности и профили каждый рабочий пишет в --workdir, после обхода они "
+            "дописываются в общие файлы. Задержки DOWNLOAD_DELAY и "
+            "AUTOTHROTTLE делятся между процессами, чтобы общий темп запросов к сайту остался как у "
+            "одного процесса; --full-rate оставляет каждому процессу свою задержку. Категория "
+            "skidki в all не входит: её товары есть в других категориях."
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="число процессов (по умолчанию: число ядер, %(default)s)")
+        parser.add_argument("--cities", default="all", help="UUID городов через запятую или all")
+        parser.add_argument("--categories", default="all", help="slug категорий через запятую или all")
+        parser.add_argument("--page-size", type=int, default=0,
+                            help="товаров в шарде (по умолчанию подбирается по размеру каталога)")
+        parser.add_argument("--concurrency", type=int, default=0,
+                            help="суммарный CONCURRENT_REQUESTS на все процессы "
+                                 "(по умолчанию: значение из настроек)")
+        parser.add_argument("--full-rate", action="store_true",
+                            help="не растягивать задержки по числу процессов: каждый процесс ходит "
+                                 "с темпом одного обхода, нагрузка на сайт растёт в N раз")
+        parser.add_argument("--workdir", default="plan", help="каталог для плана, логов и частей выгрузки")
+        parser.add_argument("-o", "--output", default="result.json",
+                            help="итоговая выгрузка: .json — JSON-массив, иначе jsonlines "
+                                 "(по умолчанию: %(default)s)")
+        parser.add_argument("--plan-only", action="store_true", help="только построить план, без запуска")
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        if opts.workers < 1:
+            raise UsageError("--workers должно быть не меньше 1")
+        # Переопределения -s передаются рабочим процессам как есть
+        self.forwarded_settings = opts.set
+
+    def run(self, args, opts):
+        workdir = Path(opts.workdir)
+        workdir.mkdir(parents=True, exist_ok=True)
+
+        totals = self._collect_totals(opts)
+        if self.exitcode:
+            return
+        if not totals:
+            print("Нет товаров для обхода")
+            return
+
+        page_size = opts.page_size or default_page_size(totals, opts.workers)
+        units = pack(build_shards(totals, page_size), opts.workers)
+        plan_path = workdir / 'plan.json'
+        save_plan(plan_path, units, page_size)
+
+        print(f"План: {sum(entry['total'] for entry in totals)} товаров, "
+              f"{sum(len(unit['shards']) for unit in units)} шардов по {page_size}, {len(units)} единиц")
+        for index, unit in enumerate(units):
+            print(f"  единица {index}: {len(unit['shards'])} шардов, стоимость {unit['cost']:.0f}")
+        if opts.plan_only:
+            return
+
+        concurrency = opts.concurrency or self.settings.getint('CONCURRENT_REQUESTS')
+        per_worker = max(1, math.ceil(concurrency / len(units)))
+        worker_settings = {'CONCURRENT_REQUESTS': per_worker}
+        if not opts.full_rate:
+            worker_settings.update(self._shared_rate(len(units)))
+        self._run_workers(plan_path, units, worker_settings, workdir, Path(opts.output))
+
+    def _collect_totals(self, opts) -> list:
+        """Запускает паука totals в этом процессе и собирает его выдачу."""
+        totals = []
+
+        def collect(item, response, spider):
+            if item['total'] > 0:
+                totals.append(dict(item))
+
+        crawler = self.crawler_process.create_crawler('totals')
+        crawler.signals.connect(collect, signal=signals.item_scraped)
+        self.crawler_process.crawl(crawler, cities=opts.cities, categories=opts.categories)
+        self.crawler_process.start()
+        if self.crawler_process.bootstrap_failed:
+            self.exitcode = 1
+        return totals
+
+    def _shared_rate(self, workers: int) -> dict:
+        """Задержки рабочего процесса, при которых N процессов вместе ходят на сайт как один.
+
+        Каждый процесс ждёт в N раз дольше между запросами, а AutoThrottle целится
+        в N-ю долю одновременных запросов.
+        """
+        settings = self.settings
+        rate = {'DOWNLOAD_DELAY': settings.getfloat('DOWNLOAD_DELAY') * workers}
+        if settings.getbool('AUTOTHROTTLE_ENABLED'):
+            rate['AUTOTHROTTLE_START_DELAY'] = settings.getfloat('AUTOTHROTTLE_START_DELAY') * workers
+            rate['AUTOTHROTTLE_MAX_DELAY'] = settings.getfloat('AUTOTHROTTLE_MAX_DELAY') * workers
+            rate['AUTOTHROTTLE_TARGET_CONCURRENCY'] = settings.getfloat('AUTOTHROTTLE_TARGET_CONCURRENCY') / workers
+        return rate
+
+    def _run_workers(self, plan_path: Path, units: list, worker_settings: dict, workdir: Path, output: Path):
+        ledger_seen = self._count_lines(self.settings.get('PERF_LEDGER_FILE'))
+        processes = []
+        started = time.monotonic()
+        for index in range(len(units)):
+            part = workdir / f'part-{index}.jsonl'
+            part.unlink(missing_ok=True)
+            command = [
+                sys.executable, '-m', 'scrapy', 'crawl', 'products',
+                '-a', f'plan={plan_path}', '-a', f'unit={index}',
+                '-o', f'{part}:jsonlines',
+                '--logfile', str(workdir / f'worker-{index}.log'),
+            ]
+            # Свои значения после -s пользователя: они уже посчитаны из его настроек
+            for setting in self.forwarded_settings:
+                command += ['-s', setting]
+            for name, value in {**worker_settings, **self._prepare_worker_files(workdir, index)}.items():
+                command += ['-s', f'{name}={value}']
+            processes.append((index, part, subprocess.Popen(command)))
+
+        failed = 0
+        finished = {}
+        # Ожидание в потоках: время каждой единицы фиксируется в момент её завершения
+        with ThreadPoolExecutor(max_workers=len(processes)) as waiters:
+            waits = {waiters.submit(process.wait): index for index, _, process in processes}
+            for done in as_completed(waits):
+                finished[waits[done]] = time.monotonic() - started
+                failed += done.result() != 0
+
+        for index in sorted(finished):
+            print(f"  единица {index}: завершена за {finished[index]:.1f} с")
+
+        items = self._merge_parts([part for _, part, _ in processes], output)
+        mark_feed_done(output, items=items, spider='products', reason='finished' if not failed else 'failed')
+        print(f"Выгрузка {output}: {items} товаров из {len(processes)} процессов")
+        for index in range(len(processes)):
+            self._merge_worker_files(workdir, index, ledger_seen)
+
+        if failed:
+            print(f"Процессов с ошибкой: {failed}, см. {workdir}/worker-*.log")
+            self.exitcode = 1
+
+    @staticmethod
+    def _merge_parts(parts: list, output: Path) -> int:
+        """Склеивает части jsonlines; для .json — в JSON-массив, как ``scrapy crawl -o``."""
+        as_array = output.suffix == '.json'
+        items = 0
+        with open(output, 'wb') as merged:
+            if as_array:
+                merged.write(b'[')
+            for part in parts:
+                if not part.exists():
+                    continue
+                with open(part, 'rb') as chunk:
+                    for line in chunk:
+                        if as_array:
+                            merged.write(b',\n' if items else b'\n')
+                            line = line.rstrip(b'\n')
+                        merged.write(line)
+                        items += 1
+            if as_array:
+                merged.write(b'\n]' if items else b']')
+        return items
+
+    def _worker_files(self, workdir: Path, index: int) -> dict:
+        """Настройка -> свой путь рабочего для включённых журналов процесса.
+
+        Строки из нескольких процессов в одном файле перемешиваются и рвутся, а
+        имена профилей с точностью до секунды совпадают; поэтому каждый рабочий
+        пишет в workdir, а после обхода файлы сливаются в общие.
+        """
+        return {
+            name: workdir / pattern.format(index=index)
+            for name, pattern in WORKER_FILES.items() if self.settings.get(name)
+        }
+
+    def _prepare_worker_files(self, workdir: Path, index: int) -> dict:
+        paths = self._worker_files(workdir, index)
+        for name, path in paths.items():
+            if name == 'PROFILER_DIR':
+                continue
+            path.unlink(missing_ok=True)
+        ledger = paths.get('PERF_LEDGER_FILE')
+        if ledger is not None and Path(self.settings.get('PERF_LEDGER_FILE')).exists():
+            # История запусков нужна рабочему для сравнения с базой
+            shutil.copyfile(self.settings.get('PERF_LEDGER_FILE'), ledger)
+        return {name: str(path) for name, path in paths.items()}
+
+    def _merge_worker_files(self, workdir: Path, index: int, ledger_seen: int):
+        for name, path in self._worker_files(workdir, index).items():
+            target = Path(self.settings.get(name))
+            if name == 'PROFILER_DIR':
+                if path.is_dir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    for profile in sorted(path.iterdir()):
+                        profile.replace(target / f'worker-{index}-{profile.name}')
+                continue
+            if not path.exists():
+                continue
+            # Из копии журнала — только строки, дописанные рабочим
+            skip = ledger_seen if name == 'PERF_LEDGER_FILE' else 0
+            with open(path, 'rb') as source, open(target, 'ab') as merged:
+                for number, line in enumerate(source):
+                    if number >= skip:
+                        merged.write(line)
+            path.unlink()
+
+    @staticmethod
+    def _count_lines(path) -> int:
+        if not path or not Path(path).exists():
+            return 0
+        with open(path, 'rb') as file:
+            return sum(1 for _ in file)
@@ -0,0 +1,96 @@
+import json
+import logging
+import time
+from pathlib import Path
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..query import ProductIndex, QueryServer, QueryService, SORT_KEYS, parse_query
+
+logger = logging.getLogger(__name__)
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    requires_crawler_process = False
+    default_settings = {'LOG_LEVEL': 'WARNING'}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Запросы к последней выгрузке товаров по индексам"
+
+    def long_desc(self):
+        return (
+            "Фильтрует выгрузку товаров по бренду, разделу, городу, цене, наличию и "
+            "маркетинговым тэгам. С --serve работает как HTTP-сервис "
+            "(GET /products?section=Виски&city=Краснодар&price_max=2000&in_stock=1) "
+            "и сам перечитывает файл после каждого обхода."
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("-f", "--file", default="result.json",
+                            help="выгрузка товаров (по умолчанию: %(default)s)")
+        parser.add_argument("--brand")
+        parser.add_argument("--section", help="раздел каталога (любой уровень section)")
+        parser.add_argument("--city", help="UUID или название города")
+        parser.add_argument("--tag", help="маркетинговый тэг")
+        parser.add_argument("--in-stock", dest="in_stock", action="store_const", const="1")
+        parser.add_argument("--price-min", dest="price_min")
+        parser.add_argument("--price-max", dest="price_max")
+        parser.add_argument("--sort", default="price", choices=SORT_KEYS)
+        parser.add_argument("--desc", action="store_const", const="1", help="по убыванию")
+        parser.add_argument("--page", default="1")
+        parser.add_argument("--per-page", dest="per_page", default="20")
+        parser.add_argument("--serve", action="store_true", help="запустить HTTP-сервис")
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+
+    def run(self, args, opts):
+        path = Path(opts.file)
+        if not path.exists():
+            raise UsageError(f"Файл {path} не найден", print_help=False)
+
+        if opts.serve:
+            self._serve(path, opts)
+            return
+
+        started = time.perf_counter()
+        index = ProductIndex.load(path)
+        loaded = time.perf_counter() - started
+
+        params = {key: getattr(opts, key) for key in (
+            'brand', 'section', 'city', 'tag', 'in_stock', 'price_min', 'price_max',
+            'sort', 'desc', 'page', 'per_page',
+        )}
+        started = time.perf_counter()
+        result = index.query(**parse_query(params))
+        took = time.perf_counter() - started
+
+        for product in result['results']:
+            print(json.dumps(product, ensure_ascii=False))
+        print(
+            f"# найдено {result['total']}, страница {result['page']}; "
+            f"индекс {len(index)} товаров построен за {loaded:.2f} с, запрос {took * 1000:.2f} мс"
+        )
+
+    def _serve(self, path: Path, opts):
+        service = QueryService(path)
+        try:
+            service.reload_if_changed(force=True)
+        except (OSError, ValueError) as e:
+            # Выгрузка ещё пишется: сервис начнёт с пустым индексом и дождётся отметки
+            logger.error(f"Ошибка загрузки {path}: {e}")
+        service.watch()
+
+        server = QueryServer((opts.host, opts.port), service)
+        print(f"Сервис запросов на http://{opts.host}:{opts.port}/products, файл {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
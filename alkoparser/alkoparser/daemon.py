@@ -0,0 +1,191 @@
+"""Долгоживущий процесс обходов: ``scrapy daemon``.
+
+Задания (паук, аргументы -a, настройки -s) приходят строками JSON в unix- или
+TCP-сокет DAEMON_ADDRESS и выполняются в одном процессе и одном реакторе по
+очереди или по DAEMON_MAX_JOBS одновременно. Между заданиями остаются тёплыми
+импорты и реактор, а при DAEMON_SHARE_STATE ещё и:
+
+    * пул соединений TunedDownloadHandler — новое задание сразу получает
+      открытые keep-alive соединения;
+    * разобранный robots.txt (WarmRobotsTxtMiddleware), не старше DAEMON_ROBOTS_TTL;
+    * задержка AutoThrottle по слоту загрузки (WarmAutoThrottle): новое задание
+      начинает с задержки, до которой дошло предыдущее, а не с AUTOTHROTTLE_START_DELAY.
+
+Протокол — строка JSON на запрос, строка JSON на ответ:
+
+    {"spider": "products", "args": {"cities": "...", "mode": "sample"}, "settings": {...}}
+    -> {"job": 3, "status": "queued", "position": 0}
+    -> {"job": 3, "status": "started"}
+    -> {"job": 3, "status": "finished", "reason": "finished", "items": 120, "seconds": 1.8, "stats": {...}}
+    {"command": "status"}
+    -> {"status": "ok", "running": [...], "queued": [...], "done": 12}
+"""
+
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+
+from scrapy.crawler import Crawler
+from scrapy.downloadermiddlewares.robotstxt import RobotsTxtMiddleware
+from scrapy.extensions.throttle import AutoThrottle
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.defer import DeferredSemaphore
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import LineReceiver
+from twisted.python.failure import Failure
+
+logger = logging.getLogger(__name__)
+
+# Статистика задания, которая возвращается клиенту
+JOB_STATS = (
+    'downloader/request_count', 'robotstxt/request_count', 'robotstxt/warm',
+    'downloader/connections/opened', 'downloader/connections/reused', 'log_count/ERROR',
+)
+
+
+class WarmRobotsTxtMiddleware(RobotsTxtMiddleware):
+    """RobotsTxtMiddleware, который при DAEMON_SHARE_STATE берёт robots.txt из кэша процесса."""
+
+    # netloc -> (время загрузки, парсер); общий для всех обходов процесса
+    warm = {}
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.shared = crawler.settings.getbool('DAEMON_SHARE_STATE')
+        self.ttl = crawler.settings.getfloat('DAEMON_ROBOTS_TTL', 86400)
+
+    def robot_parser(self, request, spider):
+        netloc = urlparse_cached(request).netloc
+        if self.shared and netloc not in self._parsers and netloc in self.warm:
+            fetched, parser = self.warm[netloc]
+            if time.monotonic() - fetched < self.ttl:
+                self._parsers[netloc] = parser
+                self.crawler.stats.inc_value('robotstxt/warm')
+        return super().robot_parser(request, spider)
+
+    def _parse_robots(self, response, netloc, spider):
+        super()._parse_robots(response, netloc, spider)
+        if self.shared:
+            self.warm[netloc] = (time.monotonic(), self._parsers[netloc])
+
+
+class WarmAutoThrottle(AutoThrottle):
+    """AutoThrottle, который при DAEMON_SHARE_STATE начинает с последней задержки слота."""
+
+    # Слот загрузки (хост) -> задержка, до которой дошёл последний обход
+    warm = {}
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.shared = crawler.settings.getbool('DAEMON_SHARE_STATE')
+
+    def _start_delay(self, spider):
+        start = super()._start_delay(spider)
+        if not self.shared:
+            return start
+        # Слот по умолчанию — хост, а весь трафик паука идёт на base_url
+        host = urlsplit(getattr(spider, 'base_url', '')).hostname
+        if host not in self.warm:
+            return start
+        return min(max(self.mindelay, self.warm[host]), self.maxdelay)
+
+    def _response_downloaded(self, response, request, spider):
+        super()._response_downloaded(response, request, spider)
+        key, slot = self._get_slot(request, spider)
+        if self.shared and slot is not None:
+            self.warm[key] = slot.delay
+
+
+class JobProtocol(LineReceiver):
+    delimiter = b'\n'
+
+    def lineReceived(self, line):
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise ValueError("ожидается объект JSON")
+            if message.get('command') == 'status':
+                self.reply(self.factory.daemon.status())
+            else:
+                self.factory.daemon.submit(message, self)
+        except Exception as e:
+            self.reply({'status': 'error', 'error': str(e)})
+
+    def reply(self, message: dict):
+        if self.transport is not None and self.connected:
+            self.sendLine(json.dumps(message, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class CrawlDaemon:
+    """Очередь заданий поверх одного CrawlerProcess."""
+
+    def __init__(self, crawler_process, settings):
+        self.process = crawler_process
+        self.settings = settings
+        self.semaphore = DeferredSemaphore(max(1, settings.getint('DAEMON_MAX_JOBS', 1)))
+        self.next_id = 0
+        self.queued = {}
+        self.running = {}
+        self.done = 0
+
+    def factory(self) -> Factory:
+        factory = Factory.forProtocol(JobProtocol)
+        factory.daemon = self
+        factory.noisy = False
+        return factory
+
+    def submit(self, message: dict, client=None) -> int:
+        """Ставит задание в очередь; ответы уходят клиенту, если он ещё подключён."""
+        spidercls = self.process.spider_loader.load(message['spider'])
+        args = {key: str(value) for key, value in (message.get('args') or {}).items()}
+        settings = self.settings.copy()
+        settings.setdict(message.get('settings') or {}, priority='cmdline')
+
+        self.next_id += 1
+        job = {'job': self.next_id, 'spider': spidercls.name, 'args': args}
+        self.queued[job['job']] = job
+        if client is not None:
+            client.reply({'job': job['job'], 'status': 'queued', 'position': len(self.running) + len(self.queued) - 1})
+        self.semaphore.run(self.run, job, spidercls, settings, client)
+        return job['job']
+
+    def run(self, job: dict, spidercls, settings, client):
+        del self.queued[job['job']]
+        self.running[job['job']] = job
+        crawler = Crawler(spidercls, settings)
+        started = time.monotonic()
+        logger.info(f"Задание {job['job']}: {job['spider']} {job['args']}")
+        if client is not None:
+            client.reply({'job': job['job'], 'status': 'started'})
+
+        d = self.process.crawl(crawler, **job['args'])
+        d.addBoth(self.finished, job, crawler, started, client)
+        return d
+
+    def finished(self, result, job: dict, crawler, started: float, client):
+        del self.running[job['job']]
+        self.done += 1
+        stats = crawler.stats.get_stats() if crawler.stats else {}
+        report = {
+            'job': job['job'],
+            'status': 'failed' if isinstance(result, Failure) else 'finished',
+            'reason': stats.get('finish_reason'),
+            'seconds': round(time.monotonic() - started, 2),
+            'items': stats.get('item_scraped_count', 0),
+            'stats': {key: stats[key] for key in JOB_STATS if key in stats},
+        }
+        if isinstance(result, Failure):
+            report['error'] = result.getErrorMessage()
+            logger.error(f"Задание {job['job']} упало: {report['error']}")
+        logger.info(f"Задание {job['job']} завершено за {report['seconds']} с")
+        if client is not None:
+            client.reply(report)
+
+    def status(self) -> dict:
+        return {
+            'status': 'ok',
+            'running': list(self.running.values()),
+            'queued': list(self.queued.values()),
+            'done': self.done,
+        }
@@ -0,0 +1,73 @@
+import json
+import time
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from .signals import card_failed
+
+
+class DeadLetterExtension:
+    """Записывает неудавшиеся карточки товаров в компактный файл jsonlines.
+
+    Одна строка на карточку: slug, город, категория, HTTP-статус, класс ошибки
+    и число попыток. Файл переигрывается аргументом паука ``-a replay=<файл>``.
+    """
+
+    def __init__(self, path: str, stats):
+        self.path = Path(path)
+        self.stats = stats
+        self.file = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('DEADLETTER_FILE')
+        if not path:
+            raise NotConfigured
+        ext = cls(path, crawler.stats)
+        crawler.signals.connect(ext.card_failed, signal=card_failed)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def card_failed(self, request, status, error, spider):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+
+        error_name = type(error).__name__ if isinstance(error, BaseException) else str(error)
+        record = {
+            'slug': request.meta.get('product_slug'),
+            'city': request.meta.get('city_uuid'),
+            'category': request.meta.get('category_slug'),
+            'status': status,
+            'error': error_name,
+            'attempts': request.meta.get('retry_times', 0) + 1,
+            'time': int(time.time()),
+        }
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+        self.stats.inc_value('deadletter/count', spider=spider)
+        self.stats.inc_value(f'deadletter/error/{error_name}', spider=spider)
+
+    def spider_closed(self, spider):
+        if self.file is not None:
+            self.file.close()
+            spider.logger.warning(
+                f"Неудавшиеся карточки: {self.stats.get_value('deadletter/count')}, "
+                f"записаны в {self.path}; повтор: scrapy crawl {spider.name} -a replay={self.path}"
+            )
+
+
+def read_dead_letters(path: str) -> list:
+    """Читает записи dead-letter, оставляя одну на пару (slug, город)."""
+    records = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get('slug') and record.get('city'):
+                records[(record['slug'], record['city'])] = record
+    return list(records.values())
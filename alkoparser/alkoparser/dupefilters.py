@@ -0,0 +1,180 @@
+"""Фильтр повторных запросов на масштабируемом фильтре Блума.
+
+RFPDupeFilter хранит каждый отпечаток запроса строкой в множестве: около
+130 байт на запрос, а при полном обходе всех городов карточек сотни тысяч.
+BloomDupeFilter хранит несколько бит на запрос ценой редких ложных
+срабатываний (запрос посчитан повтором, хотя не был): их долю задаёт
+DUPEFILTER_BLOOM_ERROR_RATE. Фильтр растёт цепочкой (Almeida et al., 2007):
+когда текущий заполнен до расчётной ёмкости, добавляется следующий вдвое
+больше и с меньшей в DUPEFILTER_BLOOM_TIGHTENING раз долей ошибок, так что
+общая доля ошибок остаётся ниже заданной при любом числе запросов.
+
+С JOBDIR фильтр сохраняется в ``requests.bloom`` при закрытии паука и
+загружается при продолжении обхода. Заполненность и оценка доли ложных
+срабатываний пишутся в статистику dupefilter/bloom/*.
+"""
+
+import json
+import math
+from pathlib import Path
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+
+class BloomFilter:
+    """Фильтр Блума на ``capacity`` элементов с долей ложных срабатываний ``error_rate``."""
+
+    def __init__(self, capacity: int, error_rate: float, count: int = 0, bits: bytearray | None = None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = count
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, fingerprint: bytes):
+        # Двойное хэширование: отпечаток уже равномерный, поэтому берём из него два числа
+        h1 = int.from_bytes(fingerprint[:8], 'little')
+        h2 = int.from_bytes(fingerprint[8:16], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint))
+
+    def add(self, fingerprint: bytes):
+        bits = self.bits
+        for position in self._positions(fingerprint):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def fill_ratio(self) -> float:
+        """Доля установленных бит."""
+        return int.from_bytes(self.bits, 'little').bit_count() / self.size
+
+    def false_positive_rate(self) -> float:
+        """Оценка доли ложных срабатываний по фактической заполненности."""
+        return self.fill_ratio() ** self.hashes
+
+
+class ScalableBloomFilter:
+    """Цепочка фильтров Блума, растущая вместе с числом элементов."""
+
+    def __init__(self, initial_capacity: int = 100000, error_rate: float = 1e-6,
+                 growth: int = 2, tightening: float = 0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+
+    def _grow(self):
+        index = len(self.filters)
+        self.filters.append(BloomFilter(
+            self.initial_capacity * self.growth ** index,
+            self.error_rate * (1 - self.tightening) * self.tightening ** index,
+        ))
+
+    def add(self, fingerprint: bytes) -> bool:
+        """Добавляет отпечаток; True, если он (вероятно) уже был."""
+        if any(fingerprint in bloom for bloom in self.filters):
+            return True
+        if not self.filters or self.filters[-1].full:
+            self._grow()
+        self.filters[-1].add(fingerprint)
+        return False
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        return any(fingerprint in bloom for bloom in self.filters)
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+    def false_positive_rate(self) -> float:
+        """Оценка вероятности, что новый отпечаток найдётся хотя бы в одном фильтре."""
+        # 1 - П(1 - p_i) через логарифмы: при малых p_i разность теряет точность
+        return -math.expm1(sum(math.log1p(-bloom.false_positive_rate()) for bloom in self.filters))
+
+    def save(self, path: Path):
+        """Заголовок JSON в первой строке, затем биты фильтров подряд."""
+        header = {
+            'initial_capacity': self.initial_capacity, 'error_rate': self.error_rate,
+            'growth': self.growth, 'tightening': self.tightening,
+            'filters': [{'capacity': bloom.capacity, 'error_rate': bloom.error_rate, 'count': bloom.count}
+                        for bloom in self.filters],
+        }
+        tmp = path.with_name(f"{path.name}.tmp")
+        with open(tmp, 'wb') as file:
+            file.write(json.dumps(header).encode('utf-8') + b'\n')
+            for bloom in self.filters:
+                file.write(bloom.bits)
+        # Замена целиком: прерванная запись не портит прошлый снимок
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path):
+        with open(path, 'rb') as file:
+            header = json.loads(file.readline())
+            sbf = cls(header['initial_capacity'], header['error_rate'], header['growth'], header['tightening'])
+            for spec in header['filters']:
+                bloom = BloomFilter(spec['capacity'], spec['error_rate'], spec['count'])
+                bloom.bits = bytearray(file.read(len(bloom.bits)))
+                sbf.filters.append(bloom)
+        return sbf
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """Фильтр повторов на ScalableBloomFilter вместо множества отпечатков."""
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, capacity=100000, error_rate=1e-6,
+                 tightening=0.5, stats=None):
+        # Родитель открыл бы requests.seen; его множество и файл здесь не нужны
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.stats = stats
+        self.path = Path(path, 'requests.bloom') if path else None
+        if self.path and self.path.exists():
+            self.bloom = ScalableBloomFilter.load(self.path)
+            self.logger.info(f"Фильтр повторов загружен из {self.path}: {len(self.bloom)} запросов")
+        else:
+            self.bloom = ScalableBloomFilter(capacity, error_rate, tightening=tightening)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            job_dir(settings),
+            settings.getbool('DUPEFILTER_DEBUG'),
+            fingerprinter=crawler.request_fingerprinter,
+            capacity=settings.getint('DUPEFILTER_BLOOM_CAPACITY', 100000),
+            error_rate=settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE', 1e-6),
+            tightening=settings.getfloat('DUPEFILTER_BLOOM_TIGHTENING', 0.5),
+            stats=crawler.stats,
+        )
+
+    def request_seen(self, request) -> bool:
+        return self.bloom.add(self.fingerprinter.fingerprint(request))
+
+    def close(self, reason):
+        if self.path:
+            self.bloom.save(self.path)
+        if self.stats is None:
+            return
+        filters = self.bloom.filters
+        self.stats.set_value('dupefilter/bloom/requests', len(self.bloom))
+        self.stats.set_value('dupefilter/bloom/filters', len(filters))
+        self.stats.set_value('dupefilter/bloom/capacity', sum(bloom.capacity for bloom in filters))
+        self.stats.set_value('dupefilter/bloom/memory_bytes', self.bloom.nbytes)
+        if filters:
+            self.stats.set_value('dupefilter/bloom/occupancy', round(filters[-1].count / filters[-1].capacity, 4))
+            self.stats.set_value('dupefilter/bloom/fill_ratio', round(filters[-1].fill_ratio(), 4))
+            self.stats.set_value('dupefilter/bloom/fp_rate_estimate', float(f"{self.bloom.false_positive_rate():.3g}"))
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.exporters import JsonLinesItemExporter
+
+from .state import StateStore, product_key
+
+logger = logging.getLogger(__name__)
+
+# Поля-словари, которые сравниваются поэлементно: metadata.Страна, price_data.current, ...
+NESTED_FIELDS = ('price_data', 'stock', 'assets', 'metadata')
+
+# Меняется при каждом обходе и изменением не считается
+IGNORED_FIELDS = ('timestamp',)
+
+
+def flatten(adapter) -> dict:
+    """Плоский словарь путь -> значение для сравнения товаров между запусками."""
+    flat = {}
+    for name, value in adapter.items():
+        if name in IGNORED_FIELDS:
+            continue
+        if name in NESTED_FIELDS and isinstance(value, dict):
+            for key, nested in value.items():
+                flat[f"{name}.{key}"] = nested
+        else:
+            flat[name] = value
+    return flat
+
+
+def fingerprint(value) -> str:
+    data = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class DeltaJsonLinesItemExporter(JsonLinesItemExporter):
+    """Выгрузка только изменений товара относительно прошлого запуска.
+
+    Для каждой пары (RPC, город) в ``state_path`` хранятся отпечатки полей
+    последней выгруженной версии. Новый товар выгружается целиком
+    (``"op": "full"``), изменённый — патчем с добавленными, изменёнными и
+    удалёнными полями (``"op": "patch"``), неизменный не выгружается вовсе.
+    Каждые ``full_every`` патчей товар выгружается целиком для ресинхронизации.
+
+    Отпечатки этого запуска копятся в таблице ``delta_pending`` и становятся
+    базой для следующего (``promote``) только после того, как хранилище выгрузки
+    её приняло (см. DeltaFeedCommitter). Если выгрузка не доставлена, следующий
+    запуск сравнивает с последней доставленной версией и повторяет те же
+    изменения: доставка не реже одного раза, патчи стоит применять идемпотентно.
+
+    Формат подключается как ``-o changes.jsonl:delta``; параметры задаются через
+    ``item_export_kwargs`` в FEEDS.
+    """
+
+    def __init__(self, file, state_path='delta_state.sqlite', full_every=20, **kwargs):
+        super().__init__(file, **kwargs)
+        # Файл состояния своей выгрузки пишет один процесс: фиксируем пачками
+        self.state = StateStore(state_path, table='delta', commit_every=1000)
+        self.pending = StateStore(state_path, table='delta_pending', commit_every=1000, db=self.state.db)
+        # Отпечатки недоставленной выгрузки прошлого запуска базой не стали
+        self.state.db.execute('DELETE FROM delta_pending')
+        self.pending.commit()
+        self.full_every = int(full_every)
+        self.counts = {'full': 0, 'patch': 0, 'unchanged': 0}
+
+    def export_item(self, item):
+        adapter = ItemAdapter(item)
+        key = product_key(adapter)
+        if key is None:
+            # Не товар (например, справочник магазинов): выгружаем как есть
+            super().export_item(item)
+            return
+
+        flat = flatten(adapter)
+        hashes = {path: fingerprint(value) for path, value in flat.items()}
+        # Товар уже выгружался в этом запуске (например, из другой категории): сравниваем с той версией
+        previous = self.pending.get(key) or self.state.get(key)
+
+        if previous is None or previous['patches'] + 1 >= self.full_every:
+            record = {'op': 'full', 'item': dict(self._get_serialized_fields(item))}
+            patches = 0
+        else:
+            old = previous['hashes']
+            added = {path: flat[path] for path in hashes if path not in old}
+            changed = {path: flat[path] for path, digest in hashes.items()
+                       if path in old and old[path] != digest}
+            removed = [path for path in old if path not in hashes]
+            if not (added or changed or removed):
+                self.counts['unchanged'] += 1
+                return
+
+            record = {'op': 'patch', 'RPC': adapter.get('RPC'),
+                      'city': (adapter.get('metadata') or {}).get('Город UUID', ''),
+                      'timestamp': adapter.get('timestamp')}
+            if added:
+                record['added'] = added
+            if changed:
+                record['changed'] = changed
+            if removed:
+                record['removed'] = removed
+            patches = previous['patches'] + 1
+
+        self.counts[record['op']] += 1
+        self.file.write((self.encoder.encode(record) + '\n').encode(self.encoding or 'utf-8'))
+        self.pending.set(key, {'hashes': hashes, 'patches': patches})
+
+    def finish_exporting(self):
+        # Хранилище ещё не приняло файл: отпечатки остаются в delta_pending
+        self.pending.commit()
+        logger.info(
+            f"Дельта-выгрузка: целиком {self.counts['full']}, патчей {self.counts['patch']}, "
+            f"без изменений {self.counts['unchanged']}"
+        )
+
+    def promote(self):
+        """Выгрузка доставлена: её отпечатки — база следующего запуска."""
+        with self.state.db:
+            self.state.db.execute('INSERT OR REPLACE INTO delta SELECT key, value FROM delta_pending')
+            self.state.db.execute('DELETE FROM delta_pending')
+        self.state.close()
+
+    def discard(self):
+        self.state.close()
+
+
+class DeltaFeedCommitter:
+    """Расширение: фиксирует состояние дельта-выгрузки, когда хранилище приняло файл.
+
+    ``feed_slot_closed`` приходит и после ошибки хранилища; ошибку выдаёт
+    счётчик feedexport/failed_count/<хранилище>, который FeedExporter увеличивает
+    в той же цепочке непосредственно перед сигналом.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.failures = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler.stats)
+        crawler.signals.connect(ext.feed_slot_closed, signal=signals.feed_slot_closed)
+        return ext
+
+    def feed_slot_closed(self, slot):
+        storage = type(slot.storage).__name__
+        failures = self.stats.get_value(f'feedexport/failed_count/{storage}', 0)
+        failed = failures > self.failures.get(storage, 0)
+        self.failures[storage] = failures
+
+        if not isinstance(slot.exporter, DeltaJsonLinesItemExporter):
+            return
+        if failed:
+            logger.warning(f"Выгрузка {slot.uri} не доставлена: состояние дельты не обновлено")
+            self.stats.inc_value('delta/state_discarded')
+            slot.exporter.discard()
+        else:
+            slot.exporter.promote()
@@ -0,0 +1,137 @@
+"""Фасетные фильтры выдачи ``/web-api/v1/product`` для частичных обходов.
+
+Аргументы паука превращаются в параметры ``options[<код>]`` запроса выдачи с
+теми же кодами, что приходят в filter_labels карточки (brend, strana,
+tovary-so-skidkoi, v-nalicii, cena). Сервер отдаёт только подходящие товары,
+и карточки запрашиваются только для них. Незнакомый фильтр сервер может
+молча проигнорировать, поэтому строки выдачи и карточки ещё раз сверяются
+на клиенте (``Facets.mismatches``). Формат ``options[<код>]`` сверен только с
+заглушкой alkoparser.mockserver; если расхождений много (FACETS_IGNORED_RATIO),
+паук products закрывается с причиной facets_ignored.
+"""
+
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+TRUE_VALUES = ('1', 'true', 'yes', 'da')
+
+
+def _split(value: str | None) -> tuple:
+    return tuple(part.strip() for part in (value or '').split(',') if part.strip())
+
+
+def _flag(value) -> bool:
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def _number(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _labels(row: dict, code: str) -> list:
+    return [
+        (label.get('title') or '').casefold()
+        for label in row.get('filter_labels') or []
+        if label.get('filter') == code
+    ]
+
+
+@dataclass(frozen=True, slots=True)
+class Facets:
+    """Набор фильтров обхода; пустой набор ничего не отсекает."""
+
+    brands: tuple = ()
+    countries: tuple = ()
+    discounted: bool = False
+    in_stock: bool = False
+    price_min: float | None = None
+    price_max: float | None = None
+
+    @classmethod
+    def from_arguments(cls, brand=None, country=None, discounted=None, in_stock=None, price=None):
+        """Разбирает аргументы паука.
+
+        brand, country: названия через запятую (как в карточке: «Фанагория», «Франция»)
+        discounted, in_stock: 1/true/yes — только со скидкой / только в наличии
+        price: диапазон цены ``500-1500``, ``500-`` или ``-1500``
+        """
+        price_min = price_max = None
+        if price:
+            low, _, high = str(price).partition('-')
+            price_min, price_max = _number(low), _number(high)
+            if price_min is None and price_max is None:
+                raise ValueError(f"Неверный диапазон цены {price!r}: ожидается вида 500-1500")
+        return cls(
+            brands=_split(brand),
+            countries=_split(country),
+            discounted=_flag(discounted),
+            in_stock=_flag(in_stock),
+            price_min=price_min,
+            price_max=price_max,
+        )
+
+    @classmethod
+    def from_query(cls, query: dict):
+        """Обратное к ``query``: фильтры из разобранных параметров запроса выдачи."""
+
+        def values(key):
+            value = query.get(key) or ()
+            return (value,) if isinstance(value, str) else tuple(value)
+
+        return cls(
+            brands=values('options[brend][]'),
+            countries=values('options[strana][]'),
+            discounted=_flag(query.get('options[tovary-so-skidkoi]')),
+            in_stock=_flag(query.get('options[v-nalicii]')),
+            price_min=_number(query.get('options[cena][min]')),
+            price_max=_number(query.get('options[cena][max]')),
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.brands or self.countries or self.discounted or self.in_stock
+                    or self.price_min is not None or self.price_max is not None)
+
+    def query(self) -> str:
+        """Параметры запроса выдачи (без ведущего ``&``)."""
+        params = [('options[brend][]', brand) for brand in self.brands]
+        params += [('options[strana][]', country) for country in self.countries]
+        if self.discounted:
+            params.append(('options[tovary-so-skidkoi]', '1'))
+        if self.in_stock:
+            params.append(('options[v-nalicii]', '1'))
+        if self.price_min is not None:
+            params.append(('options[cena][min]', f'{self.price_min:g}'))
+        if self.price_max is not None:
+            params.append(('options[cena][max]', f'{self.price_max:g}'))
+        return urlencode(params)
+
+    def mismatches(self, row: dict) -> list:
+        """Фильтры, которым не соответствует строка выдачи или карточка.
+
+        Проверяются только те поля, что есть в строке: в выдаче нет бренда и
+        страны, они сверяются уже по карточке.
+        """
+        failed = []
+        price = _number(row.get('price'))
+        if price is not None:
+            if (self.price_min is not None and price < self.price_min) or \
+                    (self.price_max is not None and price > self.price_max):
+                failed.append('price')
+        if self.discounted and 'prev_price' in row:
+            prev_price = _number(row.get('prev_price'))
+            if not prev_price or price is None or prev_price <= price:
+                failed.append('discounted')
+        if self.in_stock and 'available' in row and not row['available']:
+            failed.append('in_stock')
+
+        brands = _labels(row, 'brend')
+        if self.brands and brands and not {brand.casefold() for brand in self.brands} & set(brands):
+            failed.append('brand')
+        countries = _labels(row, 'strana') or ([row['country_name'].casefold()] if row.get('country_name') else [])
+        if self.countries and countries and \
+                not {country.casefold() for country in self.countries} & set(countries):
+            failed.append('country')
+        return failed
@@ -0,0 +1,171 @@
+"""Настроенный обработчик загрузок для alkoteka.com.
+
+Весь трафик идёт на один хост, поэтому обработчик держит тёплый пул
+постоянных соединений (DOWNLOAD_POOL_SIZE, DOWNLOAD_POOL_IDLE_TIMEOUT) и, если
+установлен h2 (``pip install scrapy[http2]``) и DOWNLOAD_HTTP2 включён,
+мультиплексирует https-запросы поверх одного HTTP/2-соединения. Brotli и zstd
+объявляются в Accept-Encoding самим HttpCompressionMiddleware, когда
+установлены brotli и zstandard (backports.zstd).
+
+При DAEMON_SHARE_STATE (``scrapy daemon``) соединения пула общие для всех
+обходов процесса и не закрываются вместе с обходом: следующее задание
+начинает с тёплых keep-alive соединений.
+
+В статистику пишутся переиспользование соединений (downloader/connections/*)
+и коэффициент сжатия по каждой кодировке (compression/<кодировка>/*).
+Подключение — DOWNLOAD_HANDLERS в settings.py.
+"""
+
+import logging
+from weakref import WeakKeyDictionary
+
+from scrapy import signals
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from twisted.internet.defer import succeed
+from twisted.web.client import HTTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+def _protocol(connection):
+    # Соединение из кэша пула приходит в обёртке _RetryingHTTP11ClientProtocol
+    return getattr(connection, '_clientProtocol', connection)
+
+
+class CountingConnectionPool(HTTPConnectionPool):
+    """Пул HTTP/1.1, который считает запросы на каждое соединение за всю его жизнь."""
+
+    # Пул, общий для всех обходов процесса при DAEMON_SHARE_STATE
+    shared = None
+
+    def __init__(self, reactor, persistent=True):
+        super().__init__(reactor, persistent)
+        # Закрытые соединения выпадают из счётчика сами, вместе с протоколом
+        self.requests = WeakKeyDictionary()
+
+    @classmethod
+    def process_wide(cls, reactor):
+        if cls.shared is None:
+            cls.shared = cls(reactor)
+        return cls.shared
+
+    def count(self, connection) -> int:
+        """Отмечает запрос на соединении; возвращает, какой он по счёту."""
+        protocol = _protocol(connection)
+        count = self.requests.get(protocol, 0) + 1
+        self.requests[protocol] = count
+        return count
+
+
+class CrawlConnections:
+    """Пул глазами одного обхода: соединения берутся из пула, статистика — своя.
+
+    Остальное (persistent, retryAutomatically и т. п.) Agent читает у самого
+    пула; соединение возвращается в тот пул, который его открыл.
+    """
+
+    def __init__(self, pool: CountingConnectionPool, stats):
+        self.pool = pool
+        self.stats = stats
+        # Запросы этого обхода на соединение, для requests_max/avg
+        self.requests = WeakKeyDictionary()
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+    def getConnection(self, key, endpoint):
+        d = self.pool.getConnection(key, endpoint)
+        d.addCallback(self._count)
+        return d
+
+    def _count(self, connection):
+        # Соединение, открытое прошлым заданием, для этого обхода тоже переиспользованное
+        reused = self.pool.count(connection) > 1
+        self.stats.inc_value('downloader/connections/reused' if reused else 'downloader/connections/opened')
+        protocol = _protocol(connection)
+        self.requests[protocol] = self.requests.get(protocol, 0) + 1
+        return connection
+
+
+class TunedDownloadHandler(HTTP11DownloadHandler):
+    """HTTP/1.1 с настроенным пулом и счётчиками, HTTP/2 для https по желанию."""
+
+    def __init__(self, settings, crawler):
+        super().__init__(settings, crawler)
+        from twisted.internet import reactor
+
+        self.stats = crawler.stats
+        self.shared = settings.getbool('DAEMON_SHARE_STATE')
+        pool = CountingConnectionPool.process_wide(reactor) if self.shared else CountingConnectionPool(reactor)
+        pool.maxPersistentPerHost = (
+            settings.getint('DOWNLOAD_POOL_SIZE') or settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        )
+        pool.cachedConnectionTimeout = settings.getint('DOWNLOAD_POOL_IDLE_TIMEOUT', 240)
+        pool._factory.noisy = False
+        self._pool = CrawlConnections(pool, crawler.stats)
+
+        self.settings = settings
+        self.crawler = crawler
+        self.http2 = settings.getbool('DOWNLOAD_HTTP2')
+        self.h2 = None
+
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    def download_request(self, request, spider):
+        # HTTP/2 согласуется через ALPN, поэтому только для https
+        if self.http2 and request.url.startswith('https://') and self._get_h2() is not None:
+            self.stats.inc_value('downloader/http2/request_count')
+            d = self.h2.download_request(request, spider)
+        else:
+            d = super().download_request(request, spider)
+        d.addCallback(self._remember_wire_size, request)
+        return d
+
+    def _get_h2(self):
+        """Обработчик HTTP/2 создаётся при первом https-запросе, если установлен h2."""
+        if self.h2 is None:
+            try:
+                from scrapy.core.downloader.handlers.http2 import H2DownloadHandler
+            except ImportError:
+                logger.warning("HTTP/2 недоступен: не установлен h2, загрузка по HTTP/1.1")
+                self.http2 = False
+                return None
+            self.h2 = H2DownloadHandler(self.settings, self.crawler)
+        return self.h2
+
+    @staticmethod
+    def _remember_wire_size(response, request):
+        encoding = response.headers.get('Content-Encoding', b'identity').decode('latin-1').lower()
+        request.meta['_wire_size'] = (encoding, len(response.body))
+        return response
+
+    def response_received(self, response, request, spider):
+        # Сигнал приходит после HttpCompressionMiddleware: тело уже распаковано
+        encoding, wire_size = request.meta.pop('_wire_size', (None, 0))
+        if encoding is None:
+            return
+        self.stats.inc_value(f'compression/{encoding}/response_count')
+        self.stats.inc_value(f'compression/{encoding}/wire_bytes', wire_size)
+        self.stats.inc_value(f'compression/{encoding}/decoded_bytes', len(response.body))
+
+    def spider_closed(self, spider, reason):
+        stats = self.stats.get_stats()
+        for key in [key for key in stats if key.startswith('compression/') and key.endswith('/wire_bytes')]:
+            prefix = key.removesuffix('/wire_bytes')
+            if stats[key]:
+                ratio = stats.get(f'{prefix}/decoded_bytes', 0) / stats[key]
+                self.stats.set_value(f'{prefix}/ratio', round(ratio, 2))
+
+        counts = list(self._pool.requests.values())
+        if counts:
+            self.stats.set_value('downloader/connections/requests_max', max(counts))
+            self.stats.set_value('downloader/connections/requests_avg', round(sum(counts) / len(counts), 1))
+
+    def close(self):
+        if self.h2 is not None:
+            self.h2.close()
+        if self.shared:
+            # Общие соединения остаются следующему обходу и закроются по таймауту простоя
+            return succeed(None)
+        return super().close()
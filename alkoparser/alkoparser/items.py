@@ -3,6 +3,8 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+from dataclasses import dataclass, field
+
 import scrapy
 
 
@@ -20,6 +22,25 @@ class ProductItem(scrapy.Item):
     metadata = scrapy.Field()
     variants = scrapy.Field()
 
+@dataclass(slots=True)
+class ProductRecord:
+    """Облегчённый товар для горячего пути: без словаря полей на каждый экземпляр.
+
+    Поля совпадают с ProductItem, ItemAdapter работает с обоими одинаково.
+    """
+    timestamp: int = 0
+    RPC: str = ''
+    url: str = ''
+    title: str = ''
+    marketing_tags: list = field(default_factory=list)
+    brand: str = ''
+    section: list = field(default_factory=list)
+    price_data: dict = field(default_factory=dict)
+    stock: dict = field(default_factory=dict)
+    assets: dict = field(default_factory=dict)
+    metadata: dict = field(default_factory=dict)
+    variants: int = 1
+
 class CitiesItem(scrapy.Item):
     uuid = scrapy.Field()
     name = scrapy.Field()
@@ -27,4 +48,31 @@ class CitiesItem(scrapy.Item):
 
 class CategoriesItem(scrapy.Item):
     name = scrapy.Field()
-    slug = scrapy.Field()
\ No newline at end of file
+    slug = scrapy.Field()
+
+class StoresItem(scrapy.Item):
+    city_uuid = scrapy.Field()
+    stores = scrapy.Field()
+
+class CategoryTotalItem(scrapy.Item):
+    city_uuid = scrapy.Field()
+    category_slug = scrapy.Field()
+    total = scrapy.Field()
+
+class SampleStatsItem(scrapy.Item):
+    city_uuid = scrapy.Field()
+    category_slug = scrapy.Field()
+    population = scrapy.Field()
+    sample_size = scrapy.Field()
+    failed = scrapy.Field()
+    excluded = scrapy.Field()
+    partial = scrapy.Field()
+    confidence = scrapy.Field()
+    price_mean = scrapy.Field()
+    price_mean_error = scrapy.Field()
+    price_median = scrapy.Field()
+    price_median_interval = scrapy.Field()
+    discount_share = scrapy.Field()
+    discount_share_error = scrapy.Field()
+    availability_rate = scrapy.Field()
+    availability_rate_error = scrapy.Field()
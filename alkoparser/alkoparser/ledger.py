@@ -0,0 +1,191 @@
+"""Журнал производительности запусков и поиск регрессий.
+
+PerformanceLedger дописывает в PERF_LEDGER_FILE по строке на запуск:
+итоговую статистику Scrapy, отпечаток настроек, аргументы паука и
+перцентили задержки по эндпоинтам web-api. После записи запуск сравнивается
+с медианой предыдущих сопоставимых запусков; отчёт — ``scrapy ledger``.
+"""
+
+import hashlib
+import json
+import logging
+import random
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import SETTINGS_PRIORITIES
+
+logger = logging.getLogger(__name__)
+
+# Настройки, которые записываются в журнал явно (остальные — только в отпечатке)
+TRACKED_SETTINGS = (
+    'CONCURRENT_REQUESTS', 'CONCURRENT_REQUESTS_PER_DOMAIN', 'DOWNLOAD_DELAY',
+    'AUTOTHROTTLE_ENABLED', 'AUTOTHROTTLE_TARGET_CONCURRENCY', 'SCHEDULER',
+    'PRODUCT_ITEM_CLASS', 'HTTPCACHE_ENABLED', 'ALKOTEKA_BASE_URL',
+)
+
+# Не влияют на производительность и меняются от запуска к запуску
+UNTRACKED_SETTINGS = ('LOG_FILE', 'LOG_LEVEL', 'LOG_ENABLED', 'FEEDS', 'JOBDIR')
+
+# Метрика -> (как получить из записи, рост — это хорошо?)
+METRICS = {
+    'items_per_minute': (lambda run: run['stats'].get('items_per_minute'), True),
+    'memusage_max_mb': (lambda run: _mb(run['stats'].get('memusage/max')), False),
+    'bytes_per_item': (lambda run: run['derived'].get('bytes_per_item'), False),
+    'card_latency_p90': (lambda run: run['latency'].get('product_card', {}).get('p90'), False),
+}
+
+RESERVOIR_SIZE = 10000
+
+
+def _mb(value):
+    return round(value / 2 ** 20, 1) if value else None
+
+
+def endpoint_of(url: str) -> str | None:
+    """Эндпоинт web-api по адресу запроса."""
+    path = url.split('?', 1)[0]
+    if '/web-api/v1/' not in path:
+        return None
+    endpoint = path.split('/web-api/v1/', 1)[1]
+    if endpoint.startswith('product/'):
+        return 'product_card'
+    if endpoint == 'product':
+        return 'product_list'
+    return endpoint
+
+
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    n = len(values)
+
+    def at(q):
+        return round(values[min(n - 1, int(q * n))], 4)
+
+    return {'count': n, 'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': round(values[-1], 4)}
+
+
+def settings_overrides(settings) -> dict:
+    """Настройки, заданные проектом или командной строкой (не значения по умолчанию)."""
+    overrides = {}
+    for name, value in settings.copy_to_dict().items():
+        if name in UNTRACKED_SETTINGS:
+            continue
+        if settings.getpriority(name) >= SETTINGS_PRIORITIES['project']:
+            overrides[name] = value
+    return overrides
+
+
+def fingerprint(overrides: dict) -> str:
+    data = json.dumps(overrides, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:12]
+
+
+def read_ledger(path: Path) -> list:
+    if not path.exists():
+        return []
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare(run: dict, history: list, window: int = 5, threshold: float = 0.15) -> list:
+    """Сравнивает запуск с медианой предыдущих ``window`` сопоставимых запусков.
+
+    Сопоставимы запуски того же паука с теми же аргументами (-a): обход одного
+    города с полным обходом сравнивать бессмысленно. Настройки не учитываются —
+    их изменение как раз и бывает причиной регрессии. В базу идут только
+    завершённые запуски (``reason == 'finished'``): прерванный обход с его
+    неполной статистикой сдвинул бы медиану.
+
+    Возвращает строки отчёта: (метрика, значение, база, изменение, регрессия ли).
+    """
+    baseline_runs = [
+        past for past in history
+        if past['spider'] == run['spider'] and past.get('arguments') == run.get('arguments')
+        and past.get('reason') == 'finished'
+    ][-window:]
+    report = []
+    for name, (get, higher_is_better) in METRICS.items():
+        value = get(run)
+        past = [get(past) for past in baseline_runs]
+        past = [v for v in past if v]
+        if value is None or not past:
+            continue
+        base = round(median(past), 4)
+        change = (value - base) / base
+        regression = change < -threshold if higher_is_better else change > threshold
+        report.append((name, round(value, 4), base, change, regression))
+    return report
+
+
+class PerformanceLedger:
+    """Расширение: пишет запуск в журнал и предупреждает о регрессиях."""
+
+    def __init__(self, crawler, path: Path):
+        self.crawler = crawler
+        self.path = path
+        self.window = crawler.settings.getint('PERF_LEDGER_WINDOW', 5)
+        self.threshold = crawler.settings.getfloat('PERF_LEDGER_THRESHOLD', 0.15)
+        self.latency = {}
+        self.seen = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('PERF_LEDGER_FILE')
+        if not path:
+            raise NotConfigured
+        ext = cls(crawler, Path(path))
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        endpoint = endpoint_of(request.url)
+        if latency is None or endpoint is None:
+            return
+
+        # Reservoir sampling: память ограничена при любом числе запросов
+        samples = self.latency.setdefault(endpoint, [])
+        seen = self.seen[endpoint] = self.seen.get(endpoint, 0) + 1
+        if len(samples) < RESERVOIR_SIZE:
+            samples.append(latency)
+        else:
+            slot = random.randrange(seen)
+            if slot < RESERVOIR_SIZE:
+                samples[slot] = latency
+
+    def spider_closed(self, spider, reason):
+        stats = self.crawler.stats.get_stats()
+        settings = self.crawler.settings
+        overrides = settings_overrides(settings)
+
+        items = stats.get('item_scraped_count') or 0
+        run = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'spider': spider.name,
+            'reason': reason,
+            'arguments': getattr(spider, 'arguments', {}),
+            'settings_fingerprint': fingerprint(overrides),
+            'settings': {name: settings.get(name) for name in TRACKED_SETTINGS if name in settings},
+            'stats': {key: value for key, value in stats.items() if not isinstance(value, datetime)},
+            'derived': {
+                'bytes_per_item': round(stats.get('downloader/response_bytes', 0) / items) if items else None,
+                'decompressed_bytes_per_item': (
+                    round(stats.get('httpcompression/response_bytes', 0) / items) if items else None
+                ),
+            },
+            'latency': {endpoint: percentiles(values) for endpoint, values in self.latency.items() if values},
+        }
+
+        history = read_ledger(self.path)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(run, ensure_ascii=False, default=str) + '\n')
+
+        regressions = [row for row in compare(run, history, self.window, self.threshold) if row[4]]
+        self.crawler.stats.set_value('ledger/regressions', len(regressions), spider=spider)
+        for name, value, base, change, _ in regressions:
+            logger.warning(f"Регрессия {name}: {value} против базы {base} ({change:+.1%})")
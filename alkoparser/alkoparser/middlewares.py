@@ -3,7 +3,11 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+from collections import defaultdict
+
 from scrapy import signals
+from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.utils.httpobj import urlparse_cached
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
@@ -101,3 +105,49 @@ class AlkoparserDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class RetryBudgetMiddleware(RetryMiddleware):
+    """RetryMiddleware с бюджетом повторов на хост.
+
+    Каждый новый (не повторный) запрос пополняет бюджет хоста на RETRY_BUDGET_RATIO,
+    каждый повтор тратит единицу, запас ограничен RETRY_BUDGET_BURST. Во время
+    шквала ошибок повторы быстро кончаются и не вытесняют новые запросы, а
+    неудавшиеся запросы уходят в errback (и в dead-letter).
+    """
+
+    def __init__(self, settings, stats):
+        super().__init__(settings)
+        self.stats = stats
+        self.ratio = settings.getfloat('RETRY_BUDGET_RATIO', 0.1)
+        self.burst = settings.getfloat('RETRY_BUDGET_BURST', 10)
+        self.tokens = defaultdict(lambda: self.burst)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def _deposit(self, request):
+        if not request.meta.get('retry_times'):
+            host = urlparse_cached(request).hostname
+            self.tokens[host] = min(self.tokens[host] + self.ratio, self.burst)
+
+    def process_response(self, request, response, spider):
+        self._deposit(request)
+        return super().process_response(request, response, spider)
+
+    def process_exception(self, request, exception, spider):
+        self._deposit(request)
+        return super().process_exception(request, exception, spider)
+
+    def _retry(self, request, reason, spider):
+        host = urlparse_cached(request).hostname
+        if self.tokens[host] < 1:
+            self.stats.inc_value('retry/budget_exhausted', spider=spider)
+            spider.logger.debug(f"Бюджет повторов для {host} исчерпан, отказ от {request}: {reason}")
+            return None
+
+        retry_request = super()._retry(request, reason, spider)
+        if retry_request is not None:
+            self.tokens[host] -= 1
+        return retry_request
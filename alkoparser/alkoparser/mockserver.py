@@ -0,0 +1,526 @@
+"""Локальная заглушка web-api alkoteka.com для нагрузочного тестирования пауков.
+
+Отдаёт ответы эндпоинтов ``/web-api/v1/city``, ``/category``, ``/product`` и
+``/product/{slug}`` той же формы, что и настоящий сайт, и картинки товаров
+``/storage/products/{артикул}.png``. Ответы берутся из
+записанного HTTP-кэша Scrapy (``HTTPCACHE_ENABLED``), а всё, чего там нет,
+генерируется детерминированно из ``seed``: каталог не хранится в памяти,
+товар строится по своему номеру, поэтому размер каталога ограничен только
+терпением.
+"""
+
+import ast
+import gzip
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from .facets import Facets
+
+NAMESPACE = uuid.UUID("8b0c6f4e-4d7a-4a57-9a44-3f0e6b1c2d10")
+
+# Первый номер артикула, по нему же из slug восстанавливается номер товара
+VENDOR_CODE_BASE = 10000
+
+DEFAULT_PER_PAGE = 20
+
+BRANDS = [
+    'Шато дю Брей', 'Фанагория', 'Абрау-Дюрсо', 'Кубань-Вино', 'Гран Вина',
+    'Инкерман', 'Массандра', 'Лефкадия', 'Золотая Балка', 'Мысхако',
+]
+
+COUNTRIES = [
+    ('Россия', 'RU'), ('Франция', 'FR'), ('Италия', 'IT'), ('Испания', 'ES'),
+    ('Португалия', 'PT'), ('Германия', 'DE'), ('Чили', 'CL'), ('Грузия', 'GE'),
+]
+
+COLORS = ['Белое', 'Красное', 'Розовое']
+
+VOLUMES = [0.33, 0.5, 0.7, 0.75, 1.0, 1.5]
+
+STREETS = ['ул. Красная', 'ул. Северная', 'ул. Ставропольская', 'ул. Мира', 'пр. Чекистов']
+
+
+class SyntheticCatalog:
+    """Детерминированный синтетический каталог заданного размера."""
+
+    def __init__(self, products: int = 10000, cities: list | None = None,
+                 categories: list | None = None, seed: int = 1):
+        self.size = products
+        self.seed = seed
+        # Адрес картинок; MockApiServer подставляет свой, чтобы их можно было скачать
+        self.image_base = 'https://alkoteka.com'
+        self.cities = cities or [
+            {'uuid': str(uuid.uuid5(NAMESPACE, f'city-{i}')), 'name': f'Город {i}', 'slug': f'gorod-{i}'}
+            for i in range(60)
+        ]
+        self.categories = categories or [
+            {'name': f'Категория {i}', 'slug': f'kategoriya-{i}'} for i in range(10)
+        ]
+        self._city_index = {city['uuid']: index for index, city in enumerate(self.cities)}
+        self._category_index = {category['slug']: index for index, category in enumerate(self.categories)}
+
+        # Категории неравного размера: крупные занимают большую часть каталога
+        weights = [1 / (index + 1) ** 0.8 for index in range(len(self.categories))]
+        total_weight = sum(weights)
+        self._bounds = []
+        start = 0
+        for index, weight in enumerate(weights):
+            count = round(products * weight / total_weight)
+            if index == len(weights) - 1:
+                count = products - start
+            self._bounds.append((start, start + count))
+            start += count
+
+    @classmethod
+    def from_project(cls, products: int = 10000, seed: int = 1):
+        """Строит каталог на городах и категориях из файлов проекта, если они есть."""
+        cities = categories = None
+        cities_file = Path('cities_uuid.json')
+        categories_file = Path('categories.json')
+        if cities_file.exists():
+            cities = json.loads(cities_file.read_text(encoding='utf-8'))
+        if categories_file.exists():
+            # В categories.json категории повторяются для каждого города
+            seen = {}
+            for category in json.loads(categories_file.read_text(encoding='utf-8')):
+                seen.setdefault(category['slug'], category)
+            categories = list(seen.values())
+        return cls(products=products, cities=cities, categories=categories, seed=seed)
+
+    def _rng(self, *parts) -> random.Random:
+        # Строковый seed не зависит от PYTHONHASHSEED, в отличие от hash()
+        return random.Random(':'.join(map(str, (self.seed, *parts))))
+
+    def category_range(self, category_slug: str) -> tuple:
+        """Диапазон номеров товаров корневой категории."""
+        index = self._category_index.get(category_slug)
+        if index is None:
+            return 0, 0
+        return self._bounds[index]
+
+    def product_index(self, slug: str) -> int | None:
+        """Восстанавливает номер товара по его slug."""
+        match = re.search(r'_(\d+)$', slug)
+        if not match:
+            return None
+        index = int(match.group(1)) - VENDOR_CODE_BASE
+        if 0 <= index < self.size:
+            return index
+        return None
+
+    def _root_of(self, index: int) -> int:
+        for root, (start, end) in enumerate(self._bounds):
+            if start <= index < end:
+                return root
+        return 0
+
+    def _category(self, index: int) -> dict:
+        root = self._root_of(index)
+        parent = self.categories[root]
+        sub = index % 3
+        return {
+            'uuid': str(uuid.uuid5(NAMESPACE, f"category-{parent['slug']}-{sub}")),
+            'name': f"{parent['name']}: подкатегория {sub + 1}",
+            'slug': f"{parent['slug']}-{sub + 1}",
+            'background_color': '#ffe6b3',
+            'parent': {
+                'uuid': str(uuid.uuid5(NAMESPACE, f"category-{parent['slug']}")),
+                'name': parent['name'],
+                'slug': parent['slug'],
+            },
+        }
+
+    def stores(self, city_uuid: str) -> list:
+        """Магазины города."""
+        city = self._city_index.get(city_uuid, 0)
+        rng = self._rng('stores', city)
+        return [
+            {
+                'uuid': str(uuid.uuid5(NAMESPACE, f'store-{city}-{number}')),
+                'title': f'Алкотека №{city * 100 + number}',
+                'address': f'{rng.choice(STREETS)}, {rng.randint(1, 250)}',
+            }
+            for number in range(rng.randint(3, 15))
+        ]
+
+    def _offer(self, index: int, city_uuid: str) -> dict:
+        """Цена и остатки товара в конкретном городе."""
+        rng = self._rng('price', index)
+        base_price = round(rng.lognormvariate(6.8, 0.7), -1) or 90.0
+        city_rng = self._rng('offer', index, self._city_index.get(city_uuid, 0))
+        price = round(base_price * city_rng.uniform(0.95, 1.1))
+        prev_price = round(price * city_rng.uniform(1.1, 1.6)) if city_rng.random() < 0.3 else None
+
+        stores = []
+        for store in self.stores(city_uuid):
+            if city_rng.random() < 0.4:
+                stores.append({**store, 'quantity': f'{city_rng.randint(1, 40)} шт'})
+        quantity_total = sum(int(store['quantity'].split()[0]) for store in stores)
+        return {
+            'price': price,
+            'prev_price': prev_price,
+            'quantity_total': quantity_total,
+            'stores': stores,
+        }
+
+    def _base(self, index: int) -> dict:
+        rng = self._rng('product', index)
+        category = self._category(index)
+        vendor_code = VENDOR_CODE_BASE + index
+        slug = f"{category['slug']}-tovar_{vendor_code}"
+        volume = rng.choice(VOLUMES)
+        brand = rng.choice(BRANDS)
+        name = f"{category['parent']['name']} {brand} {volume:g}л №{vendor_code}"
+        return {
+            'uuid': str(uuid.uuid5(NAMESPACE, f'product-{index}')),
+            'name': name,
+            'slug': slug,
+            'vendor_code': vendor_code,
+            'product_url': f"https://alkoteka.com/product/{category['slug']}/{slug}",
+            'image_url': f'{self.image_base}/storage/products/{vendor_code}.png',
+            'category': category,
+            'new': rng.random() < 0.05,
+            'recomended': rng.random() < 0.05,
+            'volume': volume,
+            'brand': brand,
+        }
+
+    def listing_row(self, index: int, city_uuid: str) -> dict:
+        """Строка товара в выдаче ``/web-api/v1/product``."""
+        product = self._base(index)
+        offer = self._offer(index, city_uuid)
+        volume = product.pop('volume')
+        product.pop('brand')
+        product.update({
+            'price': offer['price'],
+            'prev_price': offer['prev_price'],
+            'quantity_total': offer['quantity_total'],
+            'available': offer['quantity_total'] > 0,
+            'filter_labels': [
+                {'filter': 'obem', 'title': f'{volume:g}', 'type': 'range'},
+            ],
+            'action_labels': [],
+        })
+        return product
+
+    def card(self, index: int, city_uuid: str) -> dict:
+        """Карточка товара ``/web-api/v1/product/{slug}``."""
+        rng = self._rng('card', index)
+        product = self._base(index)
+        offer = self._offer(index, city_uuid)
+        volume = product.pop('volume')
+        brand = product.pop('brand')
+        country_name, country_code = rng.choice(COUNTRIES)
+        color = rng.choice(COLORS)
+        in_stock = offer['quantity_total'] > 0
+        prev_price = offer['prev_price']
+
+        filter_labels = [
+            {'filter': 'brend', 'title': brand, 'type': 'select'},
+            {'filter': 'strana', 'title': country_name, 'type': 'select'},
+            {'filter': 'cvet', 'title': color, 'type': 'select'},
+            {'filter': 'obem', 'title': f'{volume:g}', 'type': 'range',
+             'values': {'min': volume, 'max': volume}},
+        ]
+        if prev_price:
+            filter_labels.append({'filter': 'tovary-so-skidkoi', 'title': 'Скидка', 'type': 'select'})
+        if in_stock:
+            filter_labels.append({'filter': 'v-nalicii', 'title': 'Да', 'type': 'select'})
+
+        product.update({
+            'subname': '',
+            'price': offer['price'],
+            'prev_price': prev_price,
+            'offline_price': offer['price'],
+            'quantity_total': offer['quantity_total'],
+            'quantity': offer['quantity_total'],
+            'available': in_stock,
+            'warning': '' if in_stock else 'Нет в наличии',
+            'availability_title': 'В наличии' if in_stock else 'Нет в наличии',
+            'availability': {'stores': offer['stores']},
+            'country_name': country_name,
+            'country_code': country_code,
+            'status': 'active',
+            'has_online_price': False,
+            'enogram': False,
+            'axioma': False,
+            'gift_package': False,
+            'favorite': False,
+            'filter_labels': filter_labels,
+            'description_blocks': [
+                {'code': 'brend', 'title': 'Бренд', 'type': 'select',
+                 'values': [{'name': brand, 'slug': f'brand-{BRANDS.index(brand)}', 'enabled': True}]},
+                {'code': 'obem', 'title': 'Объем', 'type': 'range', 'unit': ' л.',
+                 'min': volume, 'max': volume},
+                {'code': 'krepost', 'title': 'Крепость', 'type': 'range', 'unit': '%',
+                 'min': round(rng.uniform(4, 45), 1), 'max': None},
+            ],
+            'action_labels': [{'title': 'Скидка'}] if prev_price else [],
+            'price_details': None,
+            'text_blocks': [
+                {'title': 'Описание', 'content': f'<p>{product["name"]}. ' + 'Синтетическое описание товара. ' * 8 + '</p>'},
+            ],
+            'gastronomics': {},
+        })
+        return product
+
+    def image(self, vendor_code: int) -> bytes | None:
+        """Картинка товара: у товаров одного бренда и объёма одна и та же бутылка."""
+        index = vendor_code - VENDOR_CODE_BASE
+        if not 0 <= index < self.size:
+            return None
+        product = self._base(index)
+        return _png(64, 64, self._rng('image', product['brand'], product['volume']).randbytes(3))
+
+    def city_page(self, page: int, per_page: int = 20) -> dict:
+        start = (page - 1) * per_page
+        results = self.cities[start:start + per_page]
+        return {
+            'success': True,
+            'results': results,
+            'meta': {
+                'current_page': page,
+                'per_page': per_page,
+                'total': len(self.cities),
+                'has_more_pages': start + per_page < len(self.cities),
+            },
+        }
+
+    def category_list(self) -> dict:
+        return {'success': True, 'results': self.categories}
+
+    def product_page(self, city_uuid: str, category_slug: str, page: int, per_page: int,
+                     facets: Facets = Facets()) -> dict:
+        if facets:
+            indexes = self.matching(city_uuid, category_slug, facets)
+        else:
+            indexes = range(*self.category_range(category_slug))
+        first = (page - 1) * per_page
+        last = min(first + per_page, len(indexes))
+        return {
+            'success': True,
+            'results': [self.listing_row(index, city_uuid) for index in indexes[first:last]],
+            'meta': {
+                'current_page': page,
+                'per_page': per_page,
+                'total': len(indexes),
+                'has_more_pages': last < len(indexes),
+            },
+        }
+
+    @lru_cache(maxsize=64)
+    def matching(self, city_uuid: str, category_slug: str, facets: Facets) -> tuple:
+        """Номера товаров категории, подходящих под фильтры (сверка по полной карточке)."""
+        return tuple(
+            index for index in range(*self.category_range(category_slug))
+            if not facets.mismatches(self.card(index, city_uuid))
+        )
+
+    def product_card(self, slug: str, city_uuid: str) -> dict | None:
+        index = self.product_index(slug)
+        if index is None:
+            return None
+        return {'success': True, 'results': self.card(index, city_uuid)}
+
+    def route(self, path: str, query: dict) -> dict | None:
+        """Ответ web-api на запрос по пути и параметрам; None — такого эндпоинта нет."""
+        page = _int(query.get('page'), 1)
+        per_page = _int(query.get('per_page'), DEFAULT_PER_PAGE)
+
+        if path == '/web-api/v1/city':
+            return self.city_page(page)
+        if path == '/web-api/v1/category':
+            return self.category_list()
+        if path == '/web-api/v1/product':
+            return self.product_page(
+                query.get('city_uuid', ''), query.get('root_category_slug', ''), page, per_page,
+                Facets.from_query(query),
+            )
+        if path.startswith('/web-api/v1/product/'):
+            return self.product_card(path.rsplit('/', 1)[-1], query.get('city_uuid', ''))
+        return None
+
+
+def parse_query(query: str) -> dict:
+    """Параметры запроса: последнее значение, а для ``name[]`` — список всех значений."""
+    return {key: values if key.endswith('[]') else values[-1] for key, values in parse_qs(query).items()}
+
+
+def _png(width: int, height: int, color: bytes) -> bytes:
+    """Одноцветный RGB PNG без сторонних библиотек."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows = b''.join(b'\x00' + color * width for _ in range(height))
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(rows))
+        + chunk(b'IEND', b'')
+    )
+
+
+def load_recorded(cache_dir: str) -> dict:
+    """Читает записанные ответы из каталога ``FilesystemCacheStorage``.
+
+    Ключ — путь с отсортированной строкой запроса, значение — кортеж
+    (статус, заголовки, тело) ровно в том виде, в каком их отдал сайт.
+    """
+    recorded = {}
+    for meta_path in Path(cache_dir).rglob('meta'):
+        folder = meta_path.parent
+        try:
+            meta = ast.literal_eval(_read_cached(meta_path).decode('utf-8'))
+            raw_headers = _read_cached(folder / 'response_headers')
+            body = _read_cached(folder / 'response_body')
+        except (OSError, ValueError, SyntaxError):
+            continue
+
+        headers = []
+        for line in raw_headers.decode('latin-1').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name and value and name.lower() not in ('content-length', 'transfer-encoding', 'connection'):
+                headers.append((name, value.strip()))
+        recorded[_request_key(meta['url'])] = (meta['status'], headers, body)
+    return recorded
+
+
+def _read_cached(path: Path) -> bytes:
+    data = path.read_bytes()
+    # HTTPCACHE_GZIP сжимает каждый файл кэша
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    return data
+
+
+def _request_key(url: str) -> str:
+    parts = urlsplit(url)
+    query = '&'.join(sorted(parts.query.split('&'))) if parts.query else ''
+    return f'{parts.path}?{query}'
+
+
+class MockApiServer(ThreadingHTTPServer):
+    """HTTP-сервер заглушки с настраиваемыми задержками и ошибками."""
+
+    daemon_threads = True
+
+    def __init__(self, address, catalog: SyntheticCatalog, recorded: dict | None = None,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 burst_every: float = 0.0, burst_length: float = 0.0, verbose: bool = False):
+        super().__init__(address, MockApiHandler)
+        self.catalog = catalog
+        host, port = self.server_address[:2]
+        catalog.image_base = f'http://{host}:{port}'
+        self.recorded = recorded or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.verbose = verbose
+        self.started = time.monotonic()
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def in_burst(self) -> bool:
+        """Находится ли сервер сейчас в окне ответов 429."""
+        if not self.burst_every or not self.burst_length:
+            return False
+        return (time.monotonic() - self.started) % self.burst_every < self.burst_length
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: MockApiServer
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        parts = urlsplit(self.path)
+        if parts.path == '/robots.txt':
+            self._send(200, b'User-agent: *\nAllow: /\n', content_type='text/plain')
+            return
+
+        if server.in_burst():
+            server.count('429')
+            self._send_json(429, {'success': False, 'message': 'Too Many Requests'},
+                            headers=[('Retry-After', '1')])
+            return
+
+        if server.error_rate and random.random() < server.error_rate:
+            status = random.choice([500, 502, 503])
+            server.count(str(status))
+            self._send_json(status, {'success': False, 'message': 'Server Error'})
+            return
+
+        recorded = server.recorded.get(_request_key(self.path))
+        if recorded:
+            status, headers, body = recorded
+            server.count('recorded')
+            self._send(status, body, headers=headers)
+            return
+
+        image = re.fullmatch(r'/storage/products/(\d+)\.png', parts.path)
+        if image:
+            body = server.catalog.image(int(image.group(1)))
+            server.count('image' if body else '404')
+            if body:
+                self._send(200, body, content_type='image/png')
+            else:
+                self._send_json(404, {'success': False, 'message': 'Not Found'})
+            return
+
+        payload = server.catalog.route(parts.path, parse_query(parts.query))
+        if payload is None:
+            server.count('404')
+            self._send_json(404, {'success': False, 'message': 'Not Found'})
+            return
+
+        server.count('200')
+        self._send_json(200, payload)
+
+    def _send_json(self, status: int, payload: dict, headers: list | None = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = list(headers or [])
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            headers.append(('Content-Encoding', 'gzip'))
+        self._send(status, body, content_type='application/json', headers=headers)
+
+    def _send(self, status: int, body: bytes, content_type: str | None = None, headers: list | None = None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in headers or []:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _int(value, default: int) -> int:
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,163 @@
+"""Исходящая очередь событий об изменениях товаров (outbox).
+
+События пишутся в SQLite-журнал с возрастающими номерами; каждый потребитель
+хранит в той же базе номер последнего обработанного события (смещение), так
+что доставка «хотя бы один раз» переживает падение обхода и потребителя.
+Приёмники (sinks) получают события пачками; приёмник задаётся адресом, как
+выгрузка в FEEDS:
+
+    file://changes_stream.jsonl        дописывает строки JSON в файл
+    unix:///tmp/alkoparser.sock        строки JSON в unix-сокет
+    tcp://127.0.0.1:9000               строки JSON в TCP-сокет
+    http://127.0.0.1:8000/hook         POST {"events": [...]} (и https://)
+
+Потребители без приёмника читают журнал сами: ``scrapy outbox --consume имя``.
+"""
+
+import json
+import socket
+import sqlite3
+import time
+import urllib.request
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from scrapy.utils.misc import load_object
+
+
+class Outbox:
+    """Журнал событий и смещения потребителей в одной SQLite-базе."""
+
+    def __init__(self, path: str | Path, timeout: float = 30.0):
+        self.path = Path(path)
+        # Журнал пишут и читают несколько процессов: обходы, рабочие scrapy plan, scrapy outbox
+        self.db = sqlite3.connect(self.path, timeout=timeout)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL)'
+        )
+        self.db.execute('CREATE TABLE IF NOT EXISTS offsets (consumer TEXT PRIMARY KEY, offset INTEGER NOT NULL)')
+
+    def append(self, event: dict):
+        """Добавляет событие; видно потребителям оно станет после ``commit``."""
+        self.db.execute(
+            'INSERT INTO events (event) VALUES (?)',
+            (json.dumps(event, ensure_ascii=False, separators=(',', ':'), default=str),),
+        )
+
+    def commit(self):
+        self.db.commit()
+
+    def offset(self, consumer: str) -> int:
+        row = self.db.execute('SELECT offset FROM offsets WHERE consumer = ?', (consumer,)).fetchone()
+        return row[0] if row else 0
+
+    def read(self, consumer: str, limit: int = 500) -> list:
+        """Следующие необработанные события потребителя: [(номер, событие), ...]."""
+        rows = self.db.execute(
+            'SELECT id, event FROM events WHERE id > ? ORDER BY id LIMIT ?', (self.offset(consumer), limit)
+        ).fetchall()
+        return [(event_id, json.loads(event)) for event_id, event in rows]
+
+    def ack(self, consumer: str, offset: int):
+        """Сдвигает смещение потребителя: события до ``offset`` включительно обработаны."""
+        # Смещение не откатывается, если подтверждения пришли не по порядку
+        self.db.execute(
+            'INSERT INTO offsets (consumer, offset) VALUES (?, ?) '
+            'ON CONFLICT (consumer) DO UPDATE SET offset = MAX(offset, excluded.offset)',
+            (consumer, offset),
+        )
+        self.db.commit()
+
+    def last_id(self) -> int:
+        return self.db.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+
+    def consumers(self) -> dict:
+        return dict(self.db.execute('SELECT consumer, offset FROM offsets ORDER BY consumer').fetchall())
+
+    def prune(self, consumers: list, max_age: float = 0) -> int:
+        """Удаляет события, обработанные всеми перечисленными потребителями, и старше ``max_age`` секунд.
+
+        Без потребителей журнал иначе только рос бы; потребитель, отставший
+        больше чем на ``max_age``, пропустит удалённые события.
+        """
+        deleted = 0
+        if consumers:
+            done = min(self.offset(consumer) for consumer in consumers)
+            deleted += self.db.execute('DELETE FROM events WHERE id <= ?', (done,)).rowcount
+        if max_age:
+            deleted += self.db.execute(
+                "DELETE FROM events WHERE json_extract(event, '$.time') < ?", (time.time() - max_age,)
+            ).rowcount
+        self.db.commit()
+        return deleted
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+def _lines(events: list) -> bytes:
+    return ''.join(json.dumps(event, ensure_ascii=False, default=str) + '\n' for event in events).encode('utf-8')
+
+
+class FileSink:
+    """Дописывает события строками JSON в файл."""
+
+    def __init__(self, uri: str, settings=None):
+        parts = urlsplit(uri)
+        self.path = Path(parts.netloc + parts.path)
+
+    def send(self, events: list):
+        with open(self.path, 'ab') as file:
+            file.write(_lines(events))
+
+
+class SocketSink:
+    """Отправляет события строками JSON в unix- или TCP-сокет; соединение на каждую пачку."""
+
+    def __init__(self, uri: str, settings=None):
+        parts = urlsplit(uri)
+        if parts.scheme == 'unix':
+            self.family, self.address = socket.AF_UNIX, parts.path
+        else:
+            self.family, self.address = socket.AF_INET, (parts.hostname, parts.port)
+        self.timeout = settings.getfloat('OUTBOX_SINK_TIMEOUT', 10) if settings else 10
+
+    def send(self, events: list):
+        with socket.socket(self.family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+            sock.sendall(_lines(events))
+
+
+class WebhookSink:
+    """POST пачки событий JSON-ом; любой ответ кроме 2xx — ошибка доставки."""
+
+    def __init__(self, uri: str, settings=None):
+        self.url = uri
+        self.timeout = settings.getfloat('OUTBOX_SINK_TIMEOUT', 10) if settings else 10
+
+    def send(self, events: list):
+        body = json.dumps({'events': events}, ensure_ascii=False, default=str).encode('utf-8')
+        request = urllib.request.Request(
+            self.url, data=body, method='POST', headers={'Content-Type': 'application/json'}
+        )
+        # urlopen сам поднимает HTTPError на 4xx/5xx
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def build_sink(uri: str, settings):
+    """Приёмник по схеме адреса из OUTBOX_SINK_SCHEMES."""
+    scheme = urlsplit(uri).scheme
+    schemes = settings.getdict('OUTBOX_SINK_SCHEMES')
+    if scheme not in schemes:
+        raise ValueError(f"Неизвестная схема приёмника {uri!r}: {', '.join(schemes)}")
+    return load_object(schemes[scheme])(uri, settings)
+
+
+def event_lag(events: list) -> float:
+    """Сколько секунд прошло с появления самого старого события пачки."""
+    return max(0.0, time.time() - min(event['time'] for event in events))
@@ -3,11 +3,542 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import hashlib
+import json
+import logging
+import math
+import re
+import time
+from io import BytesIO
+from pathlib import PurePosixPath
+from urllib.parse import urlsplit
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.pipelines.files import FilesPipeline
+from scrapy.http.request import NO_CALLBACK
+from twisted.internet import threads
+from twisted.internet.defer import Deferred, DeferredList, inlineCallbacks, succeed
+from twisted.internet.task import LoopingCall
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+from .exporters import flatten
+from .outbox import Outbox, build_sink, event_lag
+from .state import StateStore, product_key
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
 
 
 class AlkoparserPipeline:
     def process_item(self, item, spider):
         return item
+
+
+# Поле товара (вложенные через точку) -> (допустимые типы, обязательное ли)
+PRODUCT_SCHEMA = {
+    'RPC': (str, True),
+    'url': (str, True),
+    'title': (str, True),
+    'brand': (str, False),
+    'section': (list, True),
+    'marketing_tags': (list, False),
+    'price_data.current': ((int, float), True),
+    'price_data.original': ((int, float), False),
+    'price_data.sale_tag': (str, False),
+    'stock.in_stock': (bool, True),
+    'stock.count': (int, False),
+    'metadata.Город UUID': (str, True),
+}
+
+SALE_TAG_RE = re.compile(r'Скидка (\d+(?:\.\d+)?)%')
+
+
+def _getter(path: str):
+    keys = path.split('.')
+
+    def get(row):
+        value = row.get(keys[0])
+        for key in keys[1:]:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    return get
+
+
+def compile_schema(schema: dict) -> list:
+    """Превращает схему в список проверок (код причины, функция товар -> нарушено ли).
+
+    Проверки получают товар обычным словарем: так на порядок быстрее, чем через ItemAdapter.
+    """
+    checks = []
+    for path, (types, required) in schema.items():
+        get = _getter(path)
+        if required:
+            checks.append((f'{path}:missing', lambda row, get=get: get(row) in (None, '', [])))
+        # bool — подкласс int, для числовых полей его не пропускаем
+        checks.append((f'{path}:type', lambda row, get=get, types=types: (
+            (value := get(row)) is not None
+            and (not isinstance(value, types) or (types is not bool and isinstance(value, bool)))
+        )))
+    return checks
+
+
+def _price(row, key: str) -> float:
+    value = (row.get('price_data') or {}).get(key)
+    return value if isinstance(value, (int, float)) else 0.0
+
+
+def _sale_tag_mismatch(row) -> bool:
+    match = SALE_TAG_RE.search((row.get('price_data') or {}).get('sale_tag') or '')
+    current, original = _price(row, 'current'), _price(row, 'original')
+    if not match or not original > current > 0:
+        return False
+    return abs(float(match.group(1)) - (1 - current / original) * 100) > 0.1
+
+
+# Смысловые правила поверх типов: (код причины, функция товар -> нарушено ли)
+PRODUCT_RULES = [
+    ('price:zero', lambda row: _price(row, 'current') <= 0),
+    ('price:original_below_current',
+     lambda row: 0 < _price(row, 'original') < _price(row, 'current')),
+    ('sale_tag:without_discount', lambda row: bool((row.get('price_data') or {}).get('sale_tag'))
+     and not _price(row, 'original') > _price(row, 'current') > 0),
+    ('sale_tag:mismatch', _sale_tag_mismatch),
+    ('stock:negative', lambda row: ((row.get('stock') or {}).get('count') or 0) < 0),
+]
+
+
+class ValidationPipeline:
+    """Проверка товаров на лету: схема, смысловые правила и скачки цен.
+
+    Схема и правила компилируются один раз в список функций, так что проверка
+    товара — несколько обращений к словарям. Скачок цены ищется по прошлой цене
+    того же товара в том же городе (VALIDATION_STATE_FILE): логарифм отношения
+    цен сравнивается со средним и разбросом таких изменений по категории,
+    которые считаются потоково (Уэлфорд) только по настоящим изменениям:
+    товары с прежней ценой разброс не занижают. Снижение до цены со скидкой
+    (есть ``price_data.original`` не ниже прошлой цены или метка скидки) и
+    возврат к прошлой цене без скидки скачком не считаются.
+
+    Товары с нарушенной схемой или правилами пишутся в
+    VALIDATION_QUARANTINE_FILE с кодами причин и в выгрузку не попадают.
+    Скачки цен по умолчанию только отмечаются: копия в карантин и
+    validation/flagged/*, а сам товар идёт дальше; с
+    VALIDATION_QUARANTINE_ANOMALIES они отбрасываются как нарушения. Новая цена
+    запоминается в любом случае: настоящее изменение цены будет отмечено один
+    раз, а не в каждом следующем запуске.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.checks = compile_schema(PRODUCT_SCHEMA) + PRODUCT_RULES
+        self.state_path = settings.get('VALIDATION_STATE_FILE', 'validation_state.sqlite')
+        self.quarantine_path = settings.get('VALIDATION_QUARANTINE_FILE', 'quarantine.jsonl')
+        self.zscore = settings.getfloat('VALIDATION_PRICE_ZSCORE', 4.0)
+        self.min_jump = settings.getfloat('VALIDATION_PRICE_MIN_JUMP', 0.3)
+        self.min_samples = settings.getint('VALIDATION_PRICE_MIN_SAMPLES', 30)
+        self.quarantine_anomalies = settings.getbool('VALIDATION_QUARANTINE_ANOMALIES', False)
+        # Категория -> [число, среднее, сумма квадратов отклонений] логарифмов изменения цены
+        self.moments = {}
+        # Открываются по первому товару: пауки справочников (cities, categories, totals) их не трогают
+        self.state = None
+        self.quarantine = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def close_spider(self, spider):
+        if self.quarantine is not None:
+            self.quarantine.close()
+        if self.state is not None:
+            self.state.close()
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        row = dict(adapter)
+        if 'price_data' not in row:
+            # Не товар: справочник магазинов, сводка выборки
+            return item
+
+        if self.state is None:
+            self.state = StateStore(self.state_path, table='prices')
+
+        reasons = [code for code, violated in self.checks if violated(row)]
+        key = product_key(row)
+        if key and not reasons:
+            anomalies = self.price_anomalies(row, key)
+            if self.quarantine_anomalies:
+                reasons += anomalies
+            elif anomalies:
+                for code in anomalies:
+                    self.stats.inc_value(f'validation/flagged/{code}')
+                self.write_quarantine(adapter, anomalies, flagged=True)
+
+        if not reasons:
+            self.stats.inc_value('validation/ok')
+            return item
+
+        self.stats.inc_value('validation/quarantined')
+        for code in reasons:
+            self.stats.inc_value(f'validation/reason/{code}')
+        self.write_quarantine(adapter, reasons)
+        raise DropItem(f"Товар {adapter.get('RPC') or adapter.get('url')} в карантине: {', '.join(reasons)}")
+
+    def write_quarantine(self, adapter, reasons: list, flagged: bool = False):
+        if self.quarantine is None:
+            self.quarantine = open(self.quarantine_path, 'a', encoding='utf-8')
+        record = {'time': int(time.time()), 'reasons': reasons, 'item': adapter.asdict()}
+        if flagged:
+            # Товар ушёл дальше, в карантине только копия для разбора
+            record['flagged'] = True
+        self.quarantine.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def price_anomalies(self, row: dict, key: str) -> list:
+        price = _price(row, 'current')
+        original = _price(row, 'original')
+        previous = self.state.get(key)
+        if not previous or previous['price'] != price or previous.get('original', 0.0) != original:
+            self.state.set(key, {'price': price, 'original': original, 'time': row.get('timestamp')})
+        if not previous or not previous['price'] or price <= 0 or price == previous['price']:
+            # Неизменная цена — не изменение: иначе разброс категории стремится к нулю
+            return []
+
+        change = math.log(price / previous['price'])
+        section = row.get('section') or ['']
+        moments = self.moments.setdefault(section[0], [0, 0.0, 0.0])
+        count, mean, m2 = moments
+        std = math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+        # Пока изменений по категории мало, скачком считается любое изменение больше порога
+        jump = abs(change) >= self.min_jump and (
+            count < self.min_samples or not std or abs(change - mean) / std >= self.zscore
+        )
+        if jump and self.explained(row, price, original, previous):
+            self.stats.inc_value('validation/price_change/explained')
+            jump = False
+
+        # Уэлфорд: моменты категории обновляются после сравнения
+        count += 1
+        delta = change - mean
+        mean += delta / count
+        moments[:] = [count, mean, m2 + delta * (change - mean)]
+        return ['price:jump'] if jump else []
+
+    @staticmethod
+    def explained(row: dict, price: float, original: float, previous: dict) -> bool:
+        """Изменение объясняется началом или концом скидки."""
+        if price < previous['price']:
+            # Началась скидка: прежняя цена стала зачёркнутой или есть метка скидки
+            return original >= previous['price'] * 0.99 or bool((row.get('price_data') or {}).get('sale_tag'))
+        # Скидка закончилась: цена вернулась не выше прошлой зачёркнутой
+        return 0 < previous['price'] < previous.get('original', 0.0) and price <= previous['original'] * 1.01
+
+
+class ProductImagesPipeline(FilesPipeline):
+    """Картинки товаров: скачиваются во время обхода, хранятся по хэшу содержимого.
+
+    Включается непустым FILES_STORE. Берёт ``assets.main_image`` и
+    ``assets.set_images``. Один адрес скачивается один раз за запуск (кэш
+    MediaPipeline) и не скачивается повторно в следующих запусках (индекс
+    адрес -> файл в IMAGES_INDEX_FILE). Файл называется по MD5 содержимого,
+    поэтому одна и та же бутылка под разными адресами хранится один раз, и
+    все её адреса ведут на первый сохранённый файл. Миниатюры IMAGES_THUMBS
+    строятся в пуле из IMAGES_THUMB_WORKERS потоков (нужен Pillow), пути
+    пишутся обратно в ``assets``.
+    """
+
+    MEDIA_NAME = 'image'
+
+    def __init__(self, store_uri, download_func=None, settings=None, *, crawler=None):
+        super().__init__(store_uri, download_func, settings, crawler=crawler)
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.index = StateStore(settings.get('IMAGES_INDEX_FILE', 'images_index.sqlite'), table='images')
+
+        self.thumb_sizes = settings.getdict('IMAGES_THUMBS')
+        if self.thumb_sizes and Image is None:
+            logger.warning("Миниатюры отключены: не установлен Pillow")
+            self.thumb_sizes = {}
+        self.pool = ThreadPool(0, settings.getint('IMAGES_THUMB_WORKERS', 4), name='thumbnails')
+
+        # MD5 содержимого -> путь файла, сохранённого в этом запуске
+        self.stored = {}
+        self.thumbs = {}
+        self.waiters = {}
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        if self.thumb_sizes:
+            self.pool.start()
+
+    def close_spider(self, spider):
+        if self.thumb_sizes:
+            self.pool.stop()
+        self.index.close()
+
+    def get_media_requests(self, item, info):
+        assets = ItemAdapter(item).get('assets') or {}
+        urls = [assets.get('main_image'), *(assets.get('set_images') or [])]
+        return [Request(url, callback=NO_CALLBACK) for url in dict.fromkeys(urls) if url]
+
+    def file_path(self, request, response=None, info=None, *, item=None):
+        if response is not None:
+            return self.stored_path(hashlib.md5(response.body).hexdigest(), request.url)
+        # До загрузки содержимое неизвестно: путь из индекса прошлых запусков
+        known = self.index.get(request.url)
+        if known:
+            return known['path']
+        return super().file_path(request, info=info, item=item)
+
+    def stored_path(self, checksum: str, url: str) -> str:
+        """Путь файла с таким содержимым: уже сохранённого, если он есть, иначе новый."""
+        if checksum in self.stored:
+            return self.stored[checksum]
+        known = self.index.get(f'md5:{checksum}')
+        if known and known.get('path'):
+            return known['path']
+        return self.content_path(checksum, url)
+
+    @staticmethod
+    def content_path(checksum: str, url: str) -> str:
+        extension = PurePosixPath(urlsplit(url).path).suffix or '.jpg'
+        return f"full/{checksum[:2]}/{checksum}{extension}"
+
+    def media_to_download(self, request, info, *, item=None):
+        if self.index.get(request.url) is None:
+            return None
+        return super().media_to_download(request, info, item=item)
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        checksum = hashlib.md5(response.body).hexdigest()
+        if checksum in self.stored or self.index.get(f'md5:{checksum}'):
+            # Тот же файл под другим адресом: ссылаемся на уже сохранённый
+            path = self.stored_path(checksum, request.url)
+            self.stats.inc_value('images/duplicate_content')
+        else:
+            path = self.content_path(checksum, request.url)
+            self.store.persist_file(path, BytesIO(response.body), info,
+                                    headers={'Content-Type': response.headers.get('Content-Type', b'').decode()})
+            self.stats.inc_value('images/stored')
+            self.index.set(f'md5:{checksum}', {'path': path, 'thumbs': {}})
+            if self.thumb_sizes:
+                self._schedule_thumbnails(checksum, response.body, info)
+        self.stored[checksum] = path
+        self.index.set(request.url, {'path': path, 'checksum': checksum})
+        return checksum
+
+    def _schedule_thumbnails(self, checksum: str, body: bytes, info):
+        from twisted.internet import reactor
+
+        self.waiters[checksum] = []
+        d = threads.deferToThreadPool(reactor, self.pool, self.make_thumbnails, body)
+        d.addCallback(self._persist_thumbnails, checksum, info)
+        d.addErrback(self._thumbnails_failed, checksum)
+        d.addCallback(self._thumbnails_done, checksum)
+
+    def make_thumbnails(self, body: bytes) -> dict:
+        """Выполняется в пуле потоков: Pillow отпускает GIL на декодировании и сжатии."""
+        image = Image.open(BytesIO(body))
+        image.load()
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        thumbs = {}
+        for name, size in self.thumb_sizes.items():
+            thumb = image.copy()
+            thumb.thumbnail(tuple(size))
+            buffer = BytesIO()
+            thumb.save(buffer, 'JPEG', quality=85)
+            thumbs[name] = buffer.getvalue()
+        return thumbs
+
+    def _persist_thumbnails(self, thumbs: dict, checksum: str, info) -> dict:
+        paths = {}
+        for name, data in thumbs.items():
+            paths[name] = f"thumbs/{name}/{checksum}.jpg"
+            self.store.persist_file(paths[name], BytesIO(data), info, headers={'Content-Type': 'image/jpeg'})
+        self.stats.inc_value('images/thumbnails', len(paths))
+        return paths
+
+    def _thumbnails_failed(self, failure, checksum: str) -> dict:
+        logger.warning(f"Не удалось построить миниатюры для {checksum}: {failure.getErrorMessage()}")
+        return {}
+
+    def _thumbnails_done(self, paths: dict, checksum: str):
+        self.thumbs[checksum] = paths
+        self.index.set(f'md5:{checksum}', {'path': self.stored[checksum], 'thumbs': paths})
+        for waiter in self.waiters.pop(checksum, []):
+            waiter.callback(paths)
+
+    def thumbnails_for(self, checksum: str) -> Deferred:
+        """Пути миниатюр; если они ещё строятся — Deferred сработает по готовности."""
+        if checksum in self.waiters:
+            waiter = Deferred()
+            self.waiters[checksum].append(waiter)
+            return waiter
+        if checksum not in self.thumbs:
+            known = self.index.get(f'md5:{checksum}') or {}
+            self.thumbs[checksum] = known.get('thumbs', {})
+        return succeed(self.thumbs[checksum])
+
+    def item_completed(self, results, item, info):
+        images = [result for ok, result in results if ok]
+        if not images:
+            return item
+
+        # Контрольная сумма uptodate-файла считается хранилищем по тому же MD5
+        pending = [self.thumbnails_for(image['checksum']) for image in images]
+
+        def write_back(thumbs):
+            assets = ItemAdapter(item)['assets']
+            assets['images'] = [
+                {'url': image['url'], 'path': image['path'], 'checksum': image['checksum'],
+                 'thumbs': paths}
+                for image, (_, paths) in zip(images, thumbs)
+            ]
+            main = next((image for image in images if image['url'] == assets.get('main_image')), None)
+            if main:
+                assets['main_image_path'] = main['path']
+            return item
+
+        return DeferredList(pending).addCallback(write_back)
+
+
+class ChangeOutboxPipeline:
+    """События об изменениях товаров в outbox сразу по мере обхода.
+
+    Поля OUTBOX_FIELDS каждого товара сравниваются с последним известным
+    состоянием того же товара в том же городе; новое состояние и событие
+    (``new`` или ``change`` со старым и новым значением изменённых полей)
+    пишутся в OUTBOX_FILE одной короткой транзакцией на товар, так что журнал
+    могут писать одновременно несколько процессов. Раз в OUTBOX_FLUSH_INTERVAL
+    секунд каждый приёмник из OUTBOX_SINKS получает
+    в потоке следующую пачку до OUTBOX_BATCH_SIZE событий. Смещение приёмника
+    сдвигается только после успешной отправки, недоставленное уйдёт на
+    следующем тике или в следующем запуске. При закрытии из журнала удаляются
+    события, полученные всеми потребителями, и события старше OUTBOX_RETENTION.
+    """
+
+    def __init__(self, crawler, path: str):
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.outbox = Outbox(path)
+        # Запись состояния фиксирует и событие: они в одной транзакции на том же соединении
+        self.state = StateStore(path, table='outbox_state', db=self.outbox.db)
+        self.fields = settings.getlist('OUTBOX_FIELDS')
+        self.interval = settings.getfloat('OUTBOX_FLUSH_INTERVAL', 1.0)
+        self.batch_size = settings.getint('OUTBOX_BATCH_SIZE', 500)
+        self.retention = settings.getfloat('OUTBOX_RETENTION', 7 * 86400)
+        self.sinks = {uri: build_sink(uri, settings) for uri in settings.getlist('OUTBOX_SINKS')}
+        # Приёмник -> Deferred отправки, которая ещё идёт
+        self.sending = {}
+        self.failing = set()
+        self.loop = LoopingCall(self.flush)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('OUTBOX_FILE')
+        if not path:
+            raise NotConfigured
+        return cls(crawler, path)
+
+    def open_spider(self, spider):
+        self.loop.start(self.interval, now=False)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        key = product_key(adapter)
+        if key is None:
+            return item
+
+        flat = flatten(adapter)
+        values = {path: flat.get(path) for path in self.fields}
+        previous = self.state.get(key)
+        if previous == values:
+            return item
+
+        kind = 'new' if previous is None else 'change'
+        previous = previous or {}
+        self.outbox.append({
+            'time': time.time(),
+            'kind': kind,
+            'key': key,
+            'RPC': adapter.get('RPC'),
+            'city': (adapter.get('metadata') or {}).get('Город UUID', ''),
+            'url': adapter.get('url'),
+            'changes': {
+                path: [previous.get(path), value] for path, value in values.items() if previous.get(path) != value
+            },
+        })
+        self.state.set(key, values)
+        self.stats.inc_value('outbox/events')
+        self.stats.inc_value(f'outbox/events/{kind}')
+        return item
+
+    def flush(self):
+        """Отправляет свободным приёмникам следующую пачку."""
+        for uri, sink in self.sinks.items():
+            if uri in self.sending:
+                continue
+            batch = self.outbox.read(uri, self.batch_size)
+            if not batch:
+                continue
+            d = threads.deferToThread(sink.send, [event for _, event in batch])
+            d.addCallbacks(self._delivered, self._failed, callbackArgs=(uri, batch), errbackArgs=(uri,))
+            d.addBoth(lambda _, uri=uri: self.sending.pop(uri, None))
+            self.sending[uri] = d
+
+    def _delivered(self, _, uri: str, batch: list):
+        events = [event for _, event in batch]
+        self.outbox.ack(uri, batch[-1][0])
+        self.stats.inc_value('outbox/delivered', len(events))
+        self.stats.max_value('outbox/lag_max', round(event_lag(events), 3))
+        if uri in self.failing:
+            self.failing.discard(uri)
+            logger.info(f"Приёмник {uri} снова доступен")
+
+    def _failed(self, failure, uri: str):
+        self.stats.inc_value('outbox/failed')
+        # Предупреждаем один раз до восстановления, а не на каждом тике
+        if uri not in self.failing:
+            self.failing.add(uri)
+            logger.warning(f"Приёмник {uri} недоступен, события ждут в outbox: {failure.getErrorMessage()}")
+
+    def close_spider(self, spider):
+        if self.loop.running:
+            self.loop.stop()
+        d = DeferredList(list(self.sending.values()))
+        d.addBoth(lambda _: self._drain())
+        return d
+
+    @inlineCallbacks
+    def _drain(self):
+        """Досылает остаток при закрытии и чистит журнал от событий, обработанных всеми."""
+        self.outbox.commit()
+        for uri, sink in self.sinks.items():
+            while batch := self.outbox.read(uri, self.batch_size):
+                # Отправка в потоке: реактор обслуживает другие обходы процесса (scrapy daemon)
+                try:
+                    yield threads.deferToThread(sink.send, [event for _, event in batch])
+                except Exception as e:
+                    self._failed(Failure(e), uri)
+                    break
+                self._delivered(None, uri, batch)
+
+        consumers = set(self.outbox.consumers()) | set(self.sinks)
+        pruned = self.outbox.prune(sorted(consumers), self.retention)
+        logger.info(
+            f"Outbox: событий {self.stats.get_value('outbox/events', 0)}, "
+            f"доставлено {self.stats.get_value('outbox/delivered', 0)}, удалено из журнала {pruned}"
+        )
+        self.outbox.close()
@@ -0,0 +1,75 @@
+"""Планирование обхода: разбиение каталога на шарды и упаковка их в рабочие единицы.
+
+Шард — одна страница выдачи ``/web-api/v1/product`` для пары (город, категория).
+Стоимость шарда оценивается в запросах: запрос страницы выдачи плюс по запросу
+на карточку каждого товара. Шарды раскладываются по N единицам жадным
+алгоритмом LPT (самый дорогой шард — в наименее загруженную единицу), что даёт
+разброс не больше стоимости одного шарда.
+"""
+
+import heapq
+import json
+import math
+from pathlib import Path
+
+# Стоимость запроса страницы выдачи относительно запроса карточки
+LISTING_COST = 1.0
+# Доля стоимости карточки, которую добавляет каждая строка в выдаче (размер ответа)
+LISTING_ROW_COST = 0.05
+
+
+def shard_cost(count: int) -> float:
+    return LISTING_COST + count * (1 + LISTING_ROW_COST)
+
+
+def build_shards(totals: list, page_size: int) -> list:
+    """Разбивает категории на шарды по page_size товаров.
+
+    totals — список словарей с ключами city_uuid, category_slug, total.
+    """
+    shards = []
+    for entry in totals:
+        total = entry['total']
+        for page in range(1, math.ceil(total / page_size) + 1):
+            count = min(page_size, total - (page - 1) * page_size)
+            shards.append({
+                'city_uuid': entry['city_uuid'],
+                'category_slug': entry['category_slug'],
+                'page': page,
+                'per_page': page_size,
+                'count': count,
+            })
+    return shards
+
+
+def default_page_size(totals: list, workers: int, minimum: int = 50) -> int:
+    """Размер страницы, при котором на каждую единицу приходится около восьми шардов."""
+    total = sum(entry['total'] for entry in totals)
+    return max(minimum, total // (workers * 8) or minimum)
+
+
+def pack(shards: list, workers: int) -> list:
+    """Раскладывает шарды по workers единицам с почти равной суммарной стоимостью."""
+    units = [{'cost': 0.0, 'shards': []} for _ in range(workers)]
+    heap = [(0.0, index) for index in range(workers)]
+
+    for shard in sorted(shards, key=lambda s: shard_cost(s['count']), reverse=True):
+        cost, index = heapq.heappop(heap)
+        cost += shard_cost(shard['count'])
+        units[index]['cost'] = cost
+        units[index]['shards'].append(shard)
+        heapq.heappush(heap, (cost, index))
+
+    return [unit for unit in units if unit['shards']]
+
+
+def save_plan(path: Path, units: list, page_size: int):
+    plan = {'page_size': page_size, 'units': units}
+    path.write_text(json.dumps(plan, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+def load_unit(path: str, unit: int) -> list:
+    """Шарды одной рабочей единицы из файла плана."""
+    with open(path, 'r', encoding='utf-8') as file:
+        plan = json.load(file)
+    return plan['units'][unit]['shards']
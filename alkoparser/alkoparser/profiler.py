@@ -0,0 +1,231 @@
+"""Сэмплирующий профилировщик для колбэков пауков.
+
+По таймеру (setitimer) обработчик сигнала запоминает стек главного потока —
+только кортеж code-объектов, без форматирования, поэтому накладные расходы
+пропорциональны частоте выборки и при PROFILER_INTERVAL = 0.05 незаметны.
+При закрытии паука пишутся свёрнутые стеки (формат flamegraph.pl / speedscope),
+SVG-флеймграф и сводка топ-N по функциям и по коду проекта.
+"""
+
+import html
+import logging
+import os
+import signal
+import time
+from collections import Counter
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TIMERS = {
+    # Настенное время: видно и ожидание в реакторе (select/epoll)
+    'wall': (signal.ITIMER_REAL, signal.SIGALRM) if hasattr(signal, 'setitimer') else None,
+    # Процессорное время: только работа интерпретатора
+    'cpu': (signal.ITIMER_PROF, signal.SIGPROF) if hasattr(signal, 'setitimer') else None,
+}
+
+
+def frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(PROJECT_DIR):
+        module = 'alkoparser' + filename[len(PROJECT_DIR):].replace(os.sep, '.').removesuffix('.py')
+    else:
+        module = os.path.basename(filename).removesuffix('.py')
+    return f"{module}:{code.co_name}"
+
+
+def area_of(stack: tuple) -> str:
+    """К какому слою относится выборка: ближайший к вершине код проекта или библиотека."""
+    for code in reversed(stack):
+        if code.co_filename.startswith(PROJECT_DIR):
+            return frame_label(code)
+    leaf = stack[-1].co_filename if stack else ''
+    for marker, name in (('selectors', 'реактор: ожидание'), ('asyncio', 'реактор: asyncio'),
+                         ('twisted', 'реактор: twisted'), ('json', 'json'), ('scrapy', 'scrapy')):
+        if marker in leaf:
+            return name
+    return 'прочее'
+
+
+class SamplingProfiler:
+    """Расширение-профилировщик: PROFILER_ENABLED или переключение сигналом PROFILER_TOGGLE_SIGNAL.
+
+    Обработчики сигналов и таймер — на весь процесс, поэтому профилируется один
+    обход за раз: остальные обходы того же процесса (scrapy daemon) работают без
+    профилировщика. При закрытии паука возвращаются прежние обработчики.
+    """
+
+    # Профилировщик, который сейчас держит сигналы процесса
+    active = None
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        clock = settings.get('PROFILER_CLOCK', 'wall')
+        if TIMERS.get(clock) is None:
+            raise NotConfigured(f"Таймер {clock!r} недоступен на этой платформе")
+
+        self.crawler = crawler
+        self.timer, self.timer_signal = TIMERS[clock]
+        self.interval = settings.getfloat('PROFILER_INTERVAL', 0.01)
+        self.output_dir = Path(settings.get('PROFILER_DIR', 'profiles'))
+        self.top = settings.getint('PROFILER_TOP', 20)
+        self.enabled_on_start = settings.getbool('PROFILER_ENABLED')
+        self.toggle_signal = getattr(signal, settings.get('PROFILER_TOGGLE_SIGNAL') or '', None)
+
+        self.samples = Counter()
+        self.previous_handlers = {}
+        self.running = False
+        self.closed = False
+        self.started = None
+        self.sampled_seconds = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        if not ext.enabled_on_start and ext.toggle_signal is None:
+            raise NotConfigured
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if SamplingProfiler.active is not None:
+            logger.warning(f"Профилировщик уже занят другим обходом процесса, {spider.name} не профилируется")
+            return
+        SamplingProfiler.active = self
+        self.previous_handlers[self.timer_signal] = signal.signal(self.timer_signal, self._sample)
+        if self.toggle_signal is not None:
+            self.previous_handlers[self.toggle_signal] = signal.signal(self.toggle_signal, self._toggle)
+        if self.enabled_on_start:
+            self.start()
+
+    def start(self):
+        self.running = True
+        self.started = time.monotonic()
+        signal.setitimer(self.timer, self.interval, self.interval)
+        logger.info(f"Профилировщик включён, интервал {self.interval} с")
+
+    def stop(self):
+        signal.setitimer(self.timer, 0, 0)
+        self.running = False
+        self.sampled_seconds += time.monotonic() - self.started
+        logger.info(f"Профилировщик выключен, выборок: {sum(self.samples.values())}")
+
+    def _toggle(self, signum, frame):
+        if self.closed:
+            return
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        self.samples[tuple(stack)] += 1
+
+    def spider_closed(self, spider, reason):
+        self.closed = True
+        if SamplingProfiler.active is not self:
+            return
+        if self.running:
+            self.stop()
+        for signum, handler in self.previous_handlers.items():
+            # None — обработчик поставлен не из Python; вернуть можно только поведение по умолчанию
+            signal.signal(signum, handler if handler is not None else signal.SIG_DFL)
+        SamplingProfiler.active = None
+        if not self.samples:
+            return
+
+        total = sum(self.samples.values())
+        self.crawler.stats.set_value('profiler/samples', total, spider=spider)
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        base = self.output_dir / f"{spider.name}-{time.strftime('%Y%m%d-%H%M%S')}"
+
+        collapsed = Counter()
+        for stack, count in self.samples.items():
+            collapsed[';'.join(frame_label(code) for code in stack)] += count
+
+        with open(f"{base}.collapsed", 'w', encoding='utf-8') as file:
+            for stack, count in collapsed.most_common():
+                file.write(f"{stack} {count}\n")
+
+        Path(f"{base}.svg").write_text(
+            render_flamegraph(collapsed, title=f"{spider.name}: {total} выборок"), encoding='utf-8'
+        )
+
+        summary = self.summary(total)
+        Path(f"{base}.txt").write_text(summary, encoding='utf-8')
+        logger.info(f"Профиль записан в {base}.collapsed/.svg/.txt\n{summary}")
+
+    def summary(self, total: int) -> str:
+        self_time = Counter()
+        areas = Counter()
+        for stack, count in self.samples.items():
+            if stack:
+                self_time[frame_label(stack[-1])] += count
+            areas[area_of(stack)] += count
+
+        lines = [f"Выборок: {total}, интервал {self.interval} с, профилировалось {self.sampled_seconds:.1f} с", '',
+                 'По коду проекта и слоям:']
+        for name, count in areas.most_common(self.top):
+            lines.append(f"  {count / total:7.1%}  {name}")
+        lines += ['', 'Собственное время функций:']
+        for name, count in self_time.most_common(self.top):
+            lines.append(f"  {count / total:7.1%}  {name}")
+        return '\n'.join(lines) + '\n'
+
+
+def render_flamegraph(collapsed: Counter, title: str = '', width: int = 1200, row: int = 16) -> str:
+    """Простой SVG-флеймграф из свёрнутых стеков."""
+    root = {'count': 0, 'children': {}}
+    for stack, count in collapsed.items():
+        node = root
+        node['count'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node['children'].values()), default=0)
+
+    height = (depth(root) + 1) * row
+    scale = width / max(root['count'], 1)
+    rects = []
+
+    def draw(node, name, x, level):
+        w = node['count'] * scale
+        if w < 0.5:
+            return
+        y = height - (level + 1) * row
+        # Цвет по имени, чтобы одна функция везде была одного цвета
+        hue = sum(map(ord, name)) % 60
+        label = html.escape(name)
+        share = node['count'] / max(root['count'], 1)
+        text = label if w > 7 * len(name) else (label[:int(w // 7) - 2] + '..' if w > 30 else '')
+        rects.append(
+            f'<g><title>{label} ({node["count"]}, {share:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="hsl({hue},80%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row - 4}">{text}</text></g>'
+        )
+        child_x = x
+        for child_name, child in sorted(node['children'].items()):
+            draw(child, child_name, child_x, level + 1)
+            child_x += child['count'] * scale
+
+    draw(root, 'all', 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height + row}" '
+        f'font-family="monospace" font-size="11">'
+        f'<text x="4" y="{row - 4}">{html.escape(title)}</text>'
+        + ''.join(rects) + '</svg>\n'
+    )
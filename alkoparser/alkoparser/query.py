@@ -0,0 +1,333 @@
+"""Индексированные запросы к последней выгрузке товаров.
+
+Выгрузка (jsonlines или JSON-массив ProductItem) загружается один раз, по
+полям brand, section, city, in_stock и marketing_tags строятся инвертированные
+индексы, по цене — отсортированный массив для поиска диапазона бисекцией.
+QueryService перечитывает файл, только когда обход его закончил, и подменяет
+индекс одной ссылкой, так что запросы всегда видят целую выгрузку.
+
+Конец обхода отмечает файл-спутник ``<выгрузка>.done`` (расширение
+FeedDoneMarker): в нём размер и время изменения законченной выгрузки. Пока
+файл пишется, он с отметкой не совпадает и не перечитывается — ни по паузам
+AutoThrottle, ни по обрывку JSON-массива.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from scrapy import signals
+from w3lib.url import file_uri_to_path
+
+from .targets import CITIES_FILE
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('price', 'title', 'timestamp', 'discount')
+
+
+def _norm(value) -> str:
+    return str(value).strip().lower()
+
+
+def marker_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.done")
+
+
+def file_signature(path: Path):
+    """(время изменения, размер) файла или None, если его нет."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def mark_feed_done(path: Path, **info):
+    """Пишет отметку о законченной выгрузке рядом с ней; замена целиком, без обрывков."""
+    signature = file_signature(path)
+    if signature is None:
+        return
+    marker = marker_path(path)
+    tmp = marker.with_name(f"{marker.name}.tmp")
+    record = {'mtime_ns': signature[0], 'size': signature[1], 'finished': time.time(), **info}
+    tmp.write_text(json.dumps(record, ensure_ascii=False), encoding='utf-8')
+    tmp.replace(marker)
+
+
+def read_marker(path: Path) -> dict | None:
+    try:
+        return json.loads(marker_path(path).read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class FeedDoneMarker:
+    """Расширение: после записи каждой локальной выгрузки кладёт рядом отметку ``.done``."""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.feed_slot_closed, signal=signals.feed_slot_closed)
+        return ext
+
+    def feed_slot_closed(self, slot):
+        uri = slot.uri
+        if uri.startswith('file://'):
+            path = file_uri_to_path(uri)
+        elif '://' in uri:
+            # S3, FTP и прочие: QueryService читает только локальные файлы
+            return
+        else:
+            path = uri
+        mark_feed_done(Path(path), items=slot.itemcount, spider=self.crawler.spider.name,
+                       reason=self.crawler.stats.get_value('finish_reason'))
+
+
+def read_feed(path: Path) -> list:
+    """Читает выгрузку: jsonlines или JSON-массив."""
+    with open(path, 'r', encoding='utf-8') as file:
+        head = file.read(1)
+        while head and head.isspace():
+            head = file.read(1)
+        file.seek(0)
+        if head == '[':
+            return json.load(file)
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class ProductIndex:
+    """Неизменяемый набор товаров с индексами для фильтрации, сортировки и страниц."""
+
+    def __init__(self, products: list, cities: dict | None = None):
+        self.products = products
+        # Название города -> UUID, чтобы можно было писать city=Краснодар
+        self.city_names = {_norm(name): uuid for name, uuid in (cities or {}).items()}
+
+        self.postings = {
+            'brand': {},
+            'section': {},
+            'city': {},
+            'in_stock': {},
+            'tag': {},
+        }
+        self.prices = []
+        for row, product in enumerate(products):
+            metadata = product.get('metadata') or {}
+            self._add('brand', product.get('brand'), row)
+            for section in product.get('section') or []:
+                self._add('section', section, row)
+            self._add('city', metadata.get('Город UUID'), row)
+            self._add('in_stock', bool((product.get('stock') or {}).get('in_stock')), row)
+            for tag in product.get('marketing_tags') or []:
+                self._add('tag', tag, row)
+            self.prices.append((product.get('price_data') or {}).get('current') or 0.0)
+
+        self.by_price = sorted(range(len(products)), key=self.prices.__getitem__)
+        self.sorted_prices = [self.prices[row] for row in self.by_price]
+
+    def _add(self, field: str, value, row: int):
+        if value is None or value == '':
+            return
+        self.postings[field].setdefault(_norm(value), set()).add(row)
+
+    def __len__(self):
+        return len(self.products)
+
+    @classmethod
+    def load(cls, path: Path, cities_file: Path = CITIES_FILE):
+        cities = {}
+        if cities_file.exists():
+            with open(cities_file, 'r', encoding='utf-8') as file:
+                cities = {city['name']: city['uuid'] for city in json.load(file)}
+        # В выгрузке бывают и не товары: справочник магазинов, сводки выборки
+        return cls([row for row in read_feed(path) if row.get('RPC')], cities)
+
+    def query(self, brand=None, section=None, city=None, in_stock=None, tag=None,
+              price_min=None, price_max=None, sort='price', desc=False, page=1, per_page=20) -> dict:
+        """Фильтрует, сортирует и возвращает одну страницу товаров."""
+        if city is not None:
+            city = self.city_names.get(_norm(city), city)
+
+        filters = [
+            ('brand', brand), ('section', section), ('city', city), ('in_stock', in_stock), ('tag', tag),
+        ]
+        candidates = [self.postings[field].get(_norm(value), set())
+                      for field, value in filters if value is not None]
+
+        low = -float('inf') if price_min is None else float(price_min)
+        high = float('inf') if price_max is None else float(price_max)
+        has_price = price_min is not None or price_max is not None
+
+        if candidates:
+            # Пересечение начиная с самого короткого списка
+            candidates.sort(key=len)
+            rows = set(candidates[0])
+            for other in candidates[1:]:
+                rows &= other
+            if has_price:
+                rows = {row for row in rows if low <= self.prices[row] <= high}
+        elif has_price:
+            rows = self.by_price[bisect_left(self.sorted_prices, low):bisect_right(self.sorted_prices, high)]
+        else:
+            rows = range(len(self.products))
+
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Неизвестная сортировка {sort!r}, допустимо: {', '.join(SORT_KEYS)}")
+        ordered = sorted(rows, key=self._sort_key(sort), reverse=desc)
+
+        start = (page - 1) * per_page
+        return {
+            'total': len(ordered),
+            'page': page,
+            'per_page': per_page,
+            'results': [self.products[row] for row in ordered[start:start + per_page]],
+        }
+
+    def _sort_key(self, sort: str):
+        if sort == 'price':
+            return self.prices.__getitem__
+        if sort == 'title':
+            return lambda row: self.products[row].get('title', '')
+        if sort == 'timestamp':
+            return lambda row: self.products[row].get('timestamp', 0)
+
+        def discount(row):
+            price_data = self.products[row].get('price_data') or {}
+            original = price_data.get('original') or 0
+            return 1 - price_data.get('current', 0) / original if original else 0.0
+        return discount
+
+
+class QueryService:
+    """Держит актуальный ProductIndex и перечитывает выгрузку после завершения обхода.
+
+    Файл перечитывается, когда его отметка ``.done`` совпадает с ним самим
+    (см. FeedDoneMarker), обход завершился с причиной ``finished`` и файл
+    отличается от загруженного. ``force`` загружает файл и без отметки — для
+    первой загрузки выгрузок, записанных не обходом; выгрузка, отмеченная как
+    незаконченная (shutdown, cancelled, failed), не загружается и так.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.index = ProductIndex([])
+        self.loaded_at = None
+        self._signature = None
+        # Подпись файла, уже отвергнутого по отметке: предупреждение один раз
+        self._rejected = None
+        self._lock = threading.Lock()
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        signature = file_signature(self.path)
+        if signature is None or (signature == self._signature and not force):
+            return False
+        marker = read_marker(self.path)
+        # Нет отметки или файл изменился после неё: обход ещё пишет выгрузку
+        current = marker is not None and (marker.get('mtime_ns'), marker.get('size')) == signature
+        if current and marker.get('reason') != 'finished':
+            if self._rejected != signature:
+                logger.warning(f"Выгрузка {self.path} не загружена: обход завершился с причиной {marker.get('reason')!r}")
+                self._rejected = signature
+            return False
+        if not current and not force:
+            return False
+
+        with self._lock:
+            started = time.perf_counter()
+            index = ProductIndex.load(self.path)
+            # Подмена одной ссылкой: текущие запросы дорабатывают на старом индексе
+            self.index = index
+            self._signature = signature
+            self.loaded_at = time.time()
+        logger.info(f"Загружено {len(index)} товаров из {self.path} за {time.perf_counter() - started:.2f} с")
+        return True
+
+    def watch(self, interval: float = 2.0):
+        """Фоновая проверка файла выгрузки."""
+        def loop():
+            while True:
+                try:
+                    self.reload_if_changed()
+                except (OSError, ValueError) as e:
+                    logger.error(f"Ошибка загрузки {self.path}: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name='query-reload', daemon=True)
+        thread.start()
+        return thread
+
+
+def parse_query(params: dict) -> dict:
+    """Переводит параметры запроса (строки) в аргументы ProductIndex.query."""
+    query = {}
+    for key in ('brand', 'section', 'city', 'tag', 'sort'):
+        if params.get(key):
+            query[key] = params[key]
+    for key in ('price_min', 'price_max'):
+        if params.get(key):
+            query[key] = float(params[key])
+    for key in ('page', 'per_page'):
+        if params.get(key):
+            query[key] = max(1, int(params[key]))
+    if params.get('in_stock'):
+        query['in_stock'] = _norm(params['in_stock']) in ('1', 'true', 'yes', 'да')
+    if params.get('desc'):
+        query['desc'] = _norm(params['desc']) in ('1', 'true', 'yes', 'да')
+    return query
+
+
+class QueryServer(ThreadingHTTPServer):
+    """HTTP-обёртка над QueryService: GET /products?brand=...&price_max=...&sort=price&page=1"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: QueryService):
+        super().__init__(address, QueryHandler)
+        self.service = service
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    server: QueryServer
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        service = self.server.service
+        index = service.index
+
+        if parts.path == '/stats':
+            self._send(200, {'products': len(index), 'file': str(service.path), 'loaded_at': service.loaded_at})
+            return
+        if parts.path != '/products':
+            self._send(404, {'error': 'not found'})
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        started = time.perf_counter()
+        try:
+            result = index.query(**parse_query(params))
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+            return
+        result['took_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        self._send(200, result)
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
@@ -0,0 +1,111 @@
+"""Стратифицированная выборка для быстрой оценки ценового индекса.
+
+Страта — пара (город, категория). Размер выборки считается по формуле
+Кокрана для доли с худшим случаем p = 0.5 и поправкой на конечную
+совокупность, так что одна выборка годится и для средней цены, и для долей
+(скидки, наличие). Ошибки — полуширина доверительного интервала.
+"""
+
+import math
+import random
+from statistics import NormalDist, mean, stdev
+
+
+def z_score(confidence: float) -> float:
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def sample_size(population: int, confidence: float = 0.95, margin: float = 0.05) -> int:
+    """Объём выборки из population для заданной доверительной вероятности и погрешности доли."""
+    if population <= 0:
+        return 0
+    n0 = z_score(confidence) ** 2 * 0.25 / margin ** 2
+    return min(population, math.ceil(n0 / (1 + (n0 - 1) / population)))
+
+
+def draw(rows: list, size: int, rng: random.Random) -> list:
+    """Простая случайная выборка без возвращения."""
+    if size >= len(rows):
+        return list(rows)
+    return rng.sample(rows, size)
+
+
+class Stratum:
+    """Наблюдения по одной страте и их сводка с погрешностями."""
+
+    def __init__(self, city_uuid: str, category_slug: str, population: int, expected: int, confidence: float):
+        self.city_uuid = city_uuid
+        self.category_slug = category_slug
+        self.population = population
+        self.expected = expected
+        self.confidence = confidence
+        self.prices = []
+        self.observed = 0
+        self.discounted = 0
+        self.in_stock = 0
+        self.failed = 0
+        # Карточки, которые по фильтрам выдачи не входят в совокупность
+        self.excluded = 0
+
+    def add(self, price: float, original: float, in_stock: bool):
+        self.observed += 1
+        if price > 0:
+            self.prices.append(price)
+        if original and original > price > 0:
+            self.discounted += 1
+        if in_stock:
+            self.in_stock += 1
+
+    @property
+    def complete(self) -> bool:
+        return self.observed + self.failed + self.excluded >= self.expected
+
+    def _fpc(self, n: int) -> float:
+        if self.population <= 1:
+            return 0.0
+        return max(0.0, (self.population - n) / (self.population - 1))
+
+    def _share(self, count: int) -> tuple:
+        n = self.observed
+        if not n:
+            return None, None
+        share = count / n
+        error = z_score(self.confidence) * math.sqrt(share * (1 - share) / n * self._fpc(n))
+        return round(share, 4), round(error, 4)
+
+    def summary(self) -> dict:
+        z = z_score(self.confidence)
+        prices = sorted(self.prices)
+        n = len(prices)
+
+        price_mean = price_mean_error = median = median_low = median_high = None
+        if n:
+            price_mean = mean(prices)
+            price_mean_error = z * stdev(prices) / math.sqrt(n) * math.sqrt(self._fpc(n)) if n > 1 else 0.0
+            median = prices[n // 2] if n % 2 else (prices[n // 2 - 1] + prices[n // 2]) / 2
+            # Доверительный интервал медианы по порядковым статистикам
+            half = z * math.sqrt(n) / 2
+            median_low = prices[max(0, math.floor(n / 2 - half))]
+            median_high = prices[min(n - 1, math.ceil(n / 2 + half) - 1)]
+
+        discount_share, discount_error = self._share(self.discounted)
+        availability, availability_error = self._share(self.in_stock)
+        return {
+            'city_uuid': self.city_uuid,
+            'category_slug': self.category_slug,
+            'population': self.population,
+            'sample_size': self.observed,
+            'failed': self.failed,
+            'excluded': self.excluded,
+            # Сводка выдана до того, как пришли все карточки выборки
+            'partial': not self.complete,
+            'confidence': self.confidence,
+            'price_mean': round(price_mean, 2) if price_mean is not None else None,
+            'price_mean_error': round(price_mean_error, 2) if price_mean_error is not None else None,
+            'price_median': median,
+            'price_median_interval': [median_low, median_high] if n else None,
+            'discount_share': discount_share,
+            'discount_share_error': discount_error,
+            'availability_rate': availability,
+            'availability_rate_error': availability_error,
+        }
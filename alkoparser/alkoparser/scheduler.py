@@ -0,0 +1,160 @@
+import heapq
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+from queuelib import FifoDiskQueue, PriorityQueue
+from scrapy.core.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class CardQueue:
+    """Очередь карточек товаров на диске с небольшим буфером в памяти.
+
+    Хранит только компактную запись (slug, город, категория, адрес, приоритет),
+    сам Request собирается заново при извлечении из очереди. Буфер и диск
+    упорядочены по приоритету, и ``pop`` берёт лучшую из двух голов: карточка
+    с высоким приоритетом не ждёт тех, что попали в буфер раньше неё.
+    """
+
+    def __init__(self, path: Path, buffer_size: int = 1000):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.buffer_size = buffer_size
+        # Куча (-приоритет, номер, запись): номер сохраняет порядок при равном приоритете
+        self.buffer = []
+        self.pushed = 0
+        self.disk = PriorityQueue(self._disk_queue, startprios=self._read_state())
+        for record in self._read_buffer():
+            self._push_buffer(tuple(record))
+
+    def _disk_queue(self, priority: int) -> FifoDiskQueue:
+        return FifoDiskQueue(self.path / f"p{priority}")
+
+    def _read_state(self) -> list:
+        state = self.path / 'active.json'
+        if not state.exists():
+            return []
+        return json.loads(state.read_text(encoding='utf-8'))
+
+    def _read_buffer(self) -> list:
+        state = self.path / 'buffer.json'
+        if not state.exists():
+            return []
+        records = json.loads(state.read_text(encoding='utf-8'))
+        state.unlink()
+        return records
+
+    def push(self, record: tuple):
+        # Пока диск пуст, записи копятся в буфере; иначе идут на диск, чтобы не нарушить порядок
+        if not len(self.disk) and len(self.buffer) < self.buffer_size:
+            self._push_buffer(record)
+            return
+        self._push_disk(record)
+
+    def _push_buffer(self, record: tuple):
+        self.pushed += 1
+        heapq.heappush(self.buffer, (-record[-1], self.pushed, record))
+
+    def _push_disk(self, record: tuple):
+        # В queuelib меньшее число означает более высокий приоритет
+        self.disk.push(json.dumps(record, ensure_ascii=False).encode('utf-8'), -record[-1])
+
+    def pop(self) -> tuple | None:
+        # При равном приоритете буфер раньше: на диск записи идут только после него
+        if len(self.disk) and (not self.buffer or self.disk.curprio < self.buffer[0][0]):
+            return tuple(json.loads(self.disk.pop()))
+        return heapq.heappop(self.buffer)[2] if self.buffer else None
+
+    def close(self):
+        """Сохраняет буфер и активные приоритеты для продолжения обхода.
+
+        Буфер пишется отдельным файлом, а не в конец дисковой очереди: его записи
+        старше дисковых и при продолжении должны выйти раньше них.
+        """
+        if self.buffer:
+            records = [record for _, _, record in sorted(self.buffer)]
+            (self.path / 'buffer.json').write_text(json.dumps(records, ensure_ascii=False), encoding='utf-8')
+        state = self.disk.close()
+        (self.path / 'active.json').write_text(json.dumps(state), encoding='utf-8')
+
+    def __len__(self):
+        return len(self.buffer) + len(self.disk)
+
+
+class CardScheduler(Scheduler):
+    """Планировщик, уводящий запросы карточек товаров в CardQueue.
+
+    Карточкой считается запрос с ``meta['product_slug']``; паук должен уметь
+    собрать его заново методом ``card_request(slug, city_uuid, category_slug, priority, product_url)``.
+    Повторы (retry_times) и запросы с dont_filter остаются в обычной очереди в памяти,
+    чтобы не потерять их состояние.
+    """
+
+    def open(self, spider):
+        result = super().open(spider)
+
+        settings = self.crawler.settings
+        jobdir = settings.get('JOBDIR')
+        if jobdir:
+            self.cards_dir = Path(jobdir, 'cards.queue')
+            self._cards_tmp = False
+        else:
+            self.cards_dir = Path(tempfile.mkdtemp(prefix='alkoparser-cards-'))
+            self._cards_tmp = True
+
+        self.cards = CardQueue(self.cards_dir, settings.getint('CARD_QUEUE_BUFFER', 1000))
+        if len(self.cards):
+            logger.info(f"Продолжение обхода: в очереди {len(self.cards)} карточек")
+        return result
+
+    def close(self, reason):
+        self.cards.close()
+        if self._cards_tmp:
+            shutil.rmtree(self.cards_dir, ignore_errors=True)
+        return super().close(reason)
+
+    def _is_card(self, request) -> bool:
+        return (
+            'product_slug' in request.meta
+            and not request.dont_filter
+            and not request.meta.get('retry_times')
+            and hasattr(self.spider, 'card_request')
+        )
+
+    def enqueue_request(self, request):
+        if not self._is_card(request):
+            return super().enqueue_request(request)
+
+        if self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return False
+
+        meta = request.meta
+        self.cards.push((meta['product_slug'], meta['city_uuid'], meta['category_slug'],
+                         meta.get('product_url', ''), request.priority))
+        self.stats.inc_value('scheduler/enqueued/cards', spider=self.spider)
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        return True
+
+    def next_request(self):
+        request = super().next_request()
+        if request is not None:
+            return request
+
+        record = self.cards.pop()
+        if record is None:
+            return None
+
+        # Записи без адреса — из очереди JOBDIR прежнего формата
+        slug, city_uuid, category_slug, *product_url, priority = record
+        self.stats.inc_value('scheduler/dequeued/cards', spider=self.spider)
+        self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return self.spider.card_request(slug, city_uuid, category_slug, priority=priority,
+                                        product_url=product_url[0] if product_url else '')
+
+    def __len__(self):
+        return super().__len__() + len(self.cards)
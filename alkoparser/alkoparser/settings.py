@@ -11,6 +11,16 @@ BOT_NAME = "alkoparser"
 
 SPIDER_MODULES = ["alkoparser.spiders"]
 NEWSPIDER_MODULE = "alkoparser.spiders"
+COMMANDS_MODULE = "alkoparser.commands"
+
+# Базовый адрес web-api. Для нагрузочного тестирования пауков на локальной заглушке:
+#   scrapy mockserver --products 100000 --latency 0.05
+#   scrapy crawl products -s ALKOTEKA_BASE_URL=http://127.0.0.1:8089
+ALKOTEKA_BASE_URL = "https://alkoteka.com"
+
+# Класс товара в ProductsSpider: слотовый dataclass без накладных расходов scrapy.Item.
+# Для прежнего поведения: "alkoparser.items.ProductItem"
+PRODUCT_ITEM_CLASS = "alkoparser.items.ProductRecord"
 
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -42,6 +52,19 @@ DOWNLOAD_DELAY = 1
 #    "Accept-Language": "en",
 #}
 
+# Карточки товаров хранятся в очереди на диске компактными записями,
+# в памяти остаётся только буфер из CARD_QUEUE_BUFFER записей.
+# С JOBDIR очередь переживает перезапуск вместе с остальным состоянием обхода.
+SCHEDULER = "alkoparser.scheduler.CardScheduler"
+CARD_QUEUE_BUFFER = 1000
+
+# Фильтр повторов на фильтре Блума: несколько бит на запрос вместо ~130 байт,
+# ценой доли ложных срабатываний DUPEFILTER_BLOOM_ERROR_RATE. С JOBDIR сохраняется в requests.bloom.
+#DUPEFILTER_CLASS = "alkoparser.dupefilters.BloomDupeFilter"
+DUPEFILTER_BLOOM_CAPACITY = 100000  # ёмкость первого фильтра, следующие вдвое больше
+DUPEFILTER_BLOOM_ERROR_RATE = 1e-6  # доля запросов, ошибочно принятых за повтор, на весь обход
+DUPEFILTER_BLOOM_TIGHTENING = 0.5
+
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 #SPIDER_MIDDLEWARES = {
@@ -53,18 +76,118 @@ DOWNLOAD_DELAY = 1
 #DOWNLOADER_MIDDLEWARES = {
 #    "alkoparser.middlewares.AlkoparserDownloaderMiddleware": 543,
 #}
+DOWNLOADER_MIDDLEWARES = {
+    "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
+    "alkoparser.middlewares.RetryBudgetMiddleware": 550,
+    # robots.txt из кэша процесса между заданиями scrapy daemon
+    "scrapy.downloadermiddlewares.robotstxt.RobotsTxtMiddleware": None,
+    "alkoparser.daemon.WarmRobotsTxtMiddleware": 100,
+}
+
+# Настроенный обработчик загрузок (по желанию): тёплый пул соединений к alkoteka.com,
+# статистика переиспользования соединений и сжатия, HTTP/2 для https при установленном h2
+#DOWNLOAD_HANDLERS = {
+#    "http": "alkoparser.handlers.TunedDownloadHandler",
+#    "https": "alkoparser.handlers.TunedDownloadHandler",
+#}
+DOWNLOAD_POOL_SIZE = 8  # постоянных соединений на хост; 0 — CONCURRENT_REQUESTS_PER_DOMAIN
+DOWNLOAD_POOL_IDLE_TIMEOUT = 240  # секунд простоя до закрытия соединения
+DOWNLOAD_HTTP2 = True
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
 #}
+EXTENSIONS = {
+    "alkoparser.deadletter.DeadLetterExtension": 500,
+    "alkoparser.profiler.SamplingProfiler": 500,
+    "alkoparser.ledger.PerformanceLedger": 500,
+    # Отметка <выгрузка>.done после записи выгрузки: по ней scrapy query --serve перечитывает файл
+    "alkoparser.query.FeedDoneMarker": 500,
+    # Состояние дельта-выгрузки фиксируется, только когда хранилище приняло файл
+    "alkoparser.exporters.DeltaFeedCommitter": 500,
+    # AutoThrottle, который в scrapy daemon продолжает с задержки прошлого задания
+    "scrapy.extensions.throttle.AutoThrottle": None,
+    "alkoparser.daemon.WarmAutoThrottle": 0,
+}
+
+# Долгоживущий процесс обходов: scrapy daemon, задания — scrapy daemon --submit products -a ...
+# DAEMON_SHARE_STATE команда включает сама: общие соединения, robots.txt и задержки AutoThrottle.
+DAEMON_ADDRESS = "unix:///tmp/alkoparser.sock"
+DAEMON_MAX_JOBS = 1
+DAEMON_SHARE_STATE = False
+DAEMON_ROBOTS_TTL = 86400  # секунд
+
+# Неудавшиеся карточки товаров; повтор только их: scrapy crawl products -a replay=dead_letters.jsonl
+DEADLETTER_FILE = "dead_letters.jsonl"
+
+# Фасетные фильтры (-a brand=... -a price=...): если на клиенте отсечено больше этой доли выдачи или
+# карточек (из хотя бы FACETS_IGNORED_MIN_ROWS), сервер фильтры не применяет и обход закрывается
+# с причиной facets_ignored; 0 — не закрывать, отсекать на клиенте
+FACETS_IGNORED_RATIO = 0.5
+FACETS_IGNORED_MIN_ROWS = 20
+
+# Сэмплирующий профилировщик: -s PROFILER_ENABLED=True на весь запуск
+# или -s PROFILER_TOGGLE_SIGNAL=SIGUSR2 и kill -USR2 <pid> для включения/выключения на ходу.
+# Результат (свёрнутые стеки, SVG-флеймграф, топ-N) пишется в PROFILER_DIR при закрытии паука.
+PROFILER_ENABLED = False
+PROFILER_TOGGLE_SIGNAL = ""  # например "SIGUSR2"; пустой — без переключения сигналом
+PROFILER_INTERVAL = 0.01  # в продакшене достаточно 0.05
+PROFILER_CLOCK = "wall"  # wall — с ожиданием реактора, cpu — только работа интерпретатора
+PROFILER_DIR = "profiles"
+PROFILER_TOP = 20
+
+# Журнал производительности запусков; отчёт и сравнение с базой: scrapy ledger
+PERF_LEDGER_FILE = "perf_ledger.jsonl"
+PERF_LEDGER_WINDOW = 5  # база — медиана последних N запусков того же паука
+PERF_LEDGER_THRESHOLD = 0.15  # допустимое ухудшение метрики
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 #ITEM_PIPELINES = {
 #    "alkoparser.pipelines.AlkoparserPipeline": 300,
 #}
+# Файлы состояния конвейеров (VALIDATION_STATE_FILE, IMAGES_INDEX_FILE, OUTBOX_FILE) — SQLite с записью
+# короткими транзакциями: их можно делить между процессами scrapy plan и заданиями scrapy daemon
+ITEM_PIPELINES = {
+    "alkoparser.pipelines.ValidationPipeline": 200,
+    "alkoparser.pipelines.ProductImagesPipeline": 300,
+    "alkoparser.pipelines.ChangeOutboxPipeline": 400,
+}
+
+# Проверка товаров: нарушения схемы уходят в карантин с кодами причин, скачки цен там же отмечаются копией
+VALIDATION_QUARANTINE_FILE = "quarantine.jsonl"
+VALIDATION_STATE_FILE = "validation_state.sqlite"  # прошлые цены товаров по городам
+VALIDATION_PRICE_MIN_JUMP = 0.3  # |ln(новая / прошлая)|, меньшие изменения не проверяются
+VALIDATION_PRICE_ZSCORE = 4.0  # отклонение от изменений цен по категории в стандартных отклонениях
+VALIDATION_PRICE_MIN_SAMPLES = 30
+VALIDATION_QUARANTINE_ANOMALIES = False  # True — отбрасывать скачки цен, а не только отмечать в validation/flagged/*
+
+# Картинки товаров скачиваются во время обхода, если задан FILES_STORE (например, "images")
+FILES_STORE = ""
+IMAGES_INDEX_FILE = "images_index.sqlite"  # адрес -> файл, чтобы не качать повторно между запусками
+# Миниатюры, нужен Pillow (pip install Pillow)
+#IMAGES_THUMBS = {"small": (100, 100), "medium": (300, 300)}
+IMAGES_THUMB_WORKERS = 4
+
+# События об изменениях цены и наличия по ходу обхода; включаются файлом журнала:
+# -s OUTBOX_FILE=outbox.sqlite. Приёмники — адреса file://, unix://, tcp://, http(s)://;
+# без них события читаются из журнала командой: scrapy outbox --consume <имя>
+OUTBOX_FILE = ""
+OUTBOX_SINKS = []  # например ["file://changes_stream.jsonl", "http://127.0.0.1:8000/hook"]
+OUTBOX_FIELDS = ["price_data.current", "price_data.original", "stock.in_stock", "stock.count"]
+OUTBOX_FLUSH_INTERVAL = 1.0  # секунд между пачками
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_RETENTION = 7 * 86400  # секунд; события старше удаляются из журнала, 0 — хранить всё
+OUTBOX_SINK_TIMEOUT = 10
+OUTBOX_SINK_SCHEMES = {
+    "file": "alkoparser.outbox.FileSink",
+    "unix": "alkoparser.outbox.SocketSink",
+    "tcp": "alkoparser.outbox.SocketSink",
+    "http": "alkoparser.outbox.WebhookSink",
+    "https": "alkoparser.outbox.WebhookSink",
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -92,7 +215,19 @@ TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 FEED_EXPORT_INDENT = 2
 
+# Дельта-выгрузка: только изменившиеся поля относительно прошлого запуска
+#   scrapy crawl products -o changes.jsonl:delta
+# Состояние и частота полных записей задаются в FEEDS через item_export_kwargs:
+#   {"state_path": "delta_state.sqlite", "full_every": 20}
+FEED_EXPORTERS = {
+    "delta": "alkoparser.exporters.DeltaJsonLinesItemExporter",
+}
+
 # Enable retry on most error responses
 RETRY_ENABLED = True
 RETRY_TIMES = 3  # Количество повторных попыток
-RETRY_HTTP_CODES = [429, 500, 502, 503, 504, 522, 524, 408, 403]
\ No newline at end of file
+# 403 не повторяем: это блокировка, повторы её только продлевают; такие карточки уходят в dead-letter
+RETRY_HTTP_CODES = [429, 500, 502, 503, 504, 522, 524, 408]
+# Бюджет повторов на хост: не больше 10% от новых запросов плюс запас на 10 повторов
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_BURST = 10
\ No newline at end of file
@@ -0,0 +1,4 @@
+# Собственные сигналы проекта, отправляются через crawler.signals
+
+# Карточка товара не получена или не разобрана: card_failed(request, status, error, spider)
+card_failed = object()
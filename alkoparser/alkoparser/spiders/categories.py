@@ -2,10 +2,11 @@ import json
 import scrapy
 from pathlib import Path
 
+from ..api import ApiSpiderMixin
 from ..items import CategoriesItem
 
 
-class CategoriesSpider(scrapy.Spider):
+class CategoriesSpider(ApiSpiderMixin, scrapy.Spider):
     """Паук для сбора категорий по городам"""
 
     name = "categories"
@@ -43,7 +44,7 @@ class CategoriesSpider(scrapy.Spider):
             city_uuid = city.get('uuid')
             city_name = city.get('name')
             url = (
-                f"https://alkoteka.com/web-api/v1/category?"
+                f"{self.api_base}/category?"
                 f"city_uuid={city_uuid}"
             )
             yield scrapy.Request(url, callback=self.parse, meta={'city_uuid': city_uuid})
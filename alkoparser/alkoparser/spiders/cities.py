@@ -1,9 +1,10 @@
 import scrapy
 
+from ..api import ApiSpiderMixin
 from ..items import CitiesItem
 
 
-class CitiesSpider(scrapy.Spider):
+class CitiesSpider(ApiSpiderMixin, scrapy.Spider):
     """Паук для сбора городов с alkoteka.com."""
 
     name = "cities"
@@ -12,7 +13,7 @@ class CitiesSpider(scrapy.Spider):
     def start_requests(self):
         """Формируем запрос с первой страницы"""
         page = 1
-        url = f"https://alkoteka.com/web-api/v1/city?page={page}"
+        url = f"{self.api_base}/city?page={page}"
         yield scrapy.Request(url, callback=self.parse, meta={'page': page})
 
     def parse(self, response):
@@ -42,7 +43,7 @@ class CitiesSpider(scrapy.Spider):
         meta = data.get('meta', {})
         if meta.get('has_more_pages', False):
             next_page = page + 1
-            next_url = f"https://alkoteka.com/web-api/v1/city?page={next_page}"
+            next_url = f"{self.api_base}/city?page={next_page}"
             yield scrapy.Request(
                 next_url,
                 callback=self.parse,
@@ -1,12 +1,32 @@
+import random
 import scrapy
 import time
 import re
+import hashlib
+from pathlib import Path
 
-from ..items import ProductItem
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.misc import load_object
 
+from itemadapter import ItemAdapter
 
-class ProductsSpider(scrapy.Spider):
-    """Паук для сбора товаров из категорий alkoteka.com для региона Краснодар."""
+from ..api import ApiSpiderMixin
+from ..deadletter import read_dead_letters
+from ..facets import Facets
+from ..items import ProductRecord, SampleStatsItem, StoresItem
+from ..planner import load_unit
+from ..sampling import Stratum, draw, sample_size
+from ..signals import card_failed
+from ..targets import resolve_categories, resolve_cities
+
+# Количество в магазине приходит строкой вида "5 шт"
+QUANTITY_RE = re.compile(r'\d+')
+
+
+class ProductsSpider(ApiSpiderMixin, scrapy.Spider):
+    """Паук для сбора товаров из категорий alkoteka.com (по умолчанию для региона Краснодар)."""
 
     name = "products"
     allowed_domains = ["alkoteka.com"]
@@ -14,11 +34,61 @@ class ProductsSpider(scrapy.Spider):
     # UUID Краснодара
     CITY_UUID = "4a70f9e0-46ae-11e7-83ff-00155d026416"
 
-    def __init__(self, *args, **kwargs):
+    # Класс товара, переопределяется настройкой PRODUCT_ITEM_CLASS
+    item_cls = ProductRecord
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.item_cls = load_object(crawler.settings.get('PRODUCT_ITEM_CLASS', ProductRecord))
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+
+    def __init__(self, *args, cities=None, categories=None, plan=None, unit=None, replay=None,
+                 mode='full', confidence='0.95', margin='0.05', seed=None,
+                 brand=None, country=None, discounted=None, in_stock=None, price=None, **kwargs):
         """Инициализация паука.
+
+        Аргументы (-a):
+            cities: UUID городов через запятую или all (по умолчанию Краснодар)
+            categories: slug корневых категорий через запятую или all
+            plan, unit: файл плана ``scrapy plan`` и номер рабочей единицы в нём
+            replay: файл dead-letter, запрашиваются только перечисленные в нём карточки
+            mode: full — все карточки; sample — случайная выборка по каждой паре
+                (город, категория) и сводка цен SampleStatsItem с погрешностями
+            confidence, margin: доверительная вероятность и погрешность долей для sample
+            seed: seed случайной выборки для воспроизводимости
+            brand, country, discounted, in_stock, price: фасетные фильтры выдачи
+                (см. alkoparser.facets), например ``-a brand=Фанагория -a discounted=1``
         """
         super().__init__(*args, **kwargs)
 
+        if mode not in ('full', 'sample'):
+            raise ValueError(f"Неизвестный режим {mode!r}: full или sample")
+        if mode == 'sample' and plan:
+            raise ValueError("Режим sample строит выборку по целой категории и не совместим с plan")
+        self.mode = mode
+        self.facets = Facets.from_arguments(brand, country, discounted, in_stock, price)
+        if self.facets and plan:
+            raise ValueError("План строится по целым категориям, фильтры с plan не совместимы")
+        # Параметры фильтров, дописываемые к запросам выдачи
+        self.facet_query = f"&{self.facets.query()}" if self.facets else ''
+        self.confidence = float(confidence)
+        self.margin = float(margin)
+        self.rng = random.Random(seed)
+        self.strata = {}
+        # (slug, город) -> страты, которые ждут эту карточку: один товар бывает в нескольких категориях
+        self.card_strata = {}
+        # (slug, город) -> наблюдение по уже полученной карточке, для страт, вытянувших её позже
+        self.card_observations = {}
+        # Город -> номер магазина -> uuid, уже выгруженные в справочник
+        self.known_stores = {}
+
+        self.cities = resolve_cities(cities, [self.CITY_UUID])
+        self.shards = load_unit(plan, int(unit or 0)) if plan else None
+        self.replay = replay
+
         # Список URL
         self.START_URLS = [
             # "https://alkoteka.com/catalog/slaboalkogolnye-napitki-2",
@@ -27,30 +97,83 @@ class ProductsSpider(scrapy.Spider):
             # "https://alkoteka.com/catalog/skidki",
             "https://alkoteka.com/catalog/krepkiy-alkogol"
         ]
+        if categories:
+            self.START_URLS = [
+                f"https://alkoteka.com/catalog/{slug}" for slug in resolve_categories(categories, [])
+            ]
 
     def start_requests(self):
         """Делает первый запрос для получения total количества товаров."""
+        if self.replay:
+            yield from self._replay_requests()
+            return
 
-        for url in self.START_URLS:
-            # Извлекаем slug категории
-            parts = url.rstrip('/').split('/')
-            category_slug = parts[-1] if parts else ''
-            if not category_slug:
-                continue
+        if self.shards is not None:
+            yield from self._shard_requests()
+            return
 
-            # Первый запрос: получаем total
-            first_url = (
-                f"https://alkoteka.com/web-api/v1/product?"
-                f"city_uuid={self.CITY_UUID}&"
-                f"root_category_slug={category_slug}"
-            )
+        for city_uuid in self.cities:
+            for url in self.START_URLS:
+                # Извлекаем slug категории
+                parts = url.rstrip('/').split('/')
+                category_slug = parts[-1] if parts else ''
+                if not category_slug:
+                    continue
+
+                # Первый запрос: получаем total
+                first_url = (
+                    f"{self.api_base}/product?"
+                    f"city_uuid={city_uuid}&"
+                    f"root_category_slug={category_slug}"
+                    f"{self.facet_query}"
+                )
+
+                yield scrapy.Request(
+                    url=first_url,
+                    callback=self.get_total_and_request_all,
+                    meta={
+                        'category_url': url,
+                        'category_slug': category_slug,
+                        'city_uuid': city_uuid,
+                    }
+                )
+
+    def _replay_requests(self):
+        """Запросы карточек из файла dead-letter.
 
+        Файл переименовывается в ``*.replayed``, чтобы новые отказы записались в чистый файл.
+        """
+        path = Path(self.replay)
+        if not path.exists():
+            self.logger.error(f"Файл {path} не найден!")
+            return
+
+        records = read_dead_letters(path)
+        path.replace(path.with_name(f"{path.name}.replayed"))
+        self.logger.info(f"Повтор {len(records)} карточек из {path}")
+
+        for record in records:
+            yield self.card_request(record['slug'], record['city'], record['category'])
+
+    def _shard_requests(self):
+        """Запросы страниц выдачи по шардам из плана: total уже известен планировщику."""
+        for shard in self.shards:
+            category_slug = shard['category_slug']
+            url = (
+                f"{self.api_base}/product?"
+                f"city_uuid={shard['city_uuid']}&"
+                f"root_category_slug={category_slug}&"
+                f"page={shard['page']}&"
+                f"per_page={shard['per_page']}"
+            )
             yield scrapy.Request(
-                url=first_url,
-                callback=self.get_total_and_request_all,
+                url=url,
+                callback=self.parse_product_list,
                 meta={
-                    'category_url': url,
+                    'category_url': f"https://alkoteka.com/catalog/{category_slug}",
                     'category_slug': category_slug,
+                    'city_uuid': shard['city_uuid'],
+                    'total_items': shard['count'],
                 }
             )
 
@@ -58,6 +181,7 @@ class ProductsSpider(scrapy.Spider):
         """Получает total (количество товаров в категории) и забирает все товары сразу."""
         category_url = response.meta['category_url']
         category_slug = response.meta['category_slug']
+        city_uuid = response.meta['city_uuid']
 
         try:
             data = response.json()
@@ -66,10 +190,11 @@ class ProductsSpider(scrapy.Spider):
             if total > 0:
                 # Второй запрос: забираем все товары
                 all_url = (
-                    f"https://alkoteka.com/web-api/v1/product?"
-                    f"city_uuid={self.CITY_UUID}&"
+                    f"{self.api_base}/product?"
+                    f"city_uuid={city_uuid}&"
                     f"root_category_slug={category_slug}&"
                     f"per_page={total}"
+                    f"{self.facet_query}"
                 )
 
                 yield scrapy.Request(
@@ -78,6 +203,7 @@ class ProductsSpider(scrapy.Spider):
                     meta={
                         'category_url': category_url,
                         'category_slug': category_slug,
+                        'city_uuid': city_uuid,
                         'total_items': total
                     }
                 )
@@ -90,8 +216,8 @@ class ProductsSpider(scrapy.Spider):
 
     def parse_product_list(self, response):
         """Парсит список всех товаров категории."""
-        category_url = response.meta['category_url']
         category_slug = response.meta['category_slug']
+        city_uuid = response.meta['city_uuid']
 
         try:
             data = response.json()
@@ -99,103 +225,354 @@ class ProductsSpider(scrapy.Spider):
 
             self.logger.info(f"Получено {len(products)} товаров из категории {category_slug}")
 
+            if self.facets:
+                products = self._facet_filter(products, 'listing')
+
+            if self.mode == 'sample':
+                products = self._draw_sample(products, city_uuid, category_slug)
+
             # Для каждого товара делаем запрос на его карточку
             for product in products:
                 product_slug = product.get('slug')
                 if not product_slug:
                     continue
-
-                # URL карточки товара
-                product_url = f"https://alkoteka.com/web-api/v1/product/{product_slug}?city_uuid={self.CITY_UUID}"
-
-                yield scrapy.Request(
-                    url=product_url,
-                    callback=self.parse_product_page,
-                    meta={
-                        'category_url': category_url,
-                        'category_slug': category_slug,
-                        'list_product_data': product  # Базовые данные из списка
-                    }
+                if self.mode == 'sample':
+                    shared = self._share_card(product_slug, city_uuid, category_slug)
+                    if shared is not None:
+                        yield from shared
+                        continue
+
+                # Запрос карточки товара; url из списка избавляет от его вычисления по карточке
+                yield self.card_request(
+                    product_slug,
+                    city_uuid,
+                    category_slug,
+                    product_url=product.get('product_url', ''),
                 )
 
+        except CloseSpider:
+            raise
         except Exception as e:
             self.logger.error(f"Ошибка парсинга списка товаров: {e}")
 
+    def _facet_filter(self, rows: list, stage: str) -> list:
+        """Отсекает строки, не подходящие под фильтры, если сервер их не применил.
+
+        Единичные расхождения отсекаются на клиенте. Если отсечено больше
+        FACETS_IGNORED_RATIO из хотя бы FACETS_IGNORED_MIN_ROWS проверенных на
+        этом этапе строк, сервер фильтры не применяет (например, изменился
+        формат ``options[...]``) и обход закрывается с причиной facets_ignored:
+        иначе он молча запросил бы карточки всего каталога.
+        """
+        stats = self.crawler.stats
+        stats.inc_value(f'facets/checked/{stage}', len(rows))
+        matching = []
+        for row in rows:
+            failed = self.facets.mismatches(row)
+            if not failed:
+                matching.append(row)
+                continue
+            stats.inc_value(f'facets/filtered/{stage}')
+            for name in failed:
+                stats.inc_value(f'facets/mismatch/{name}')
+        # По карточкам предупреждение было бы на каждый товар, там хватает статистики
+        if stage == 'listing' and len(matching) < len(rows):
+            self.logger.warning(
+                f"Сервер не применил фильтры: {len(rows) - len(matching)} из {len(rows)} отсечены на клиенте"
+            )
+
+        ratio = self.settings.getfloat('FACETS_IGNORED_RATIO', 0.5)
+        checked = stats.get_value(f'facets/checked/{stage}')
+        filtered = stats.get_value(f'facets/filtered/{stage}', 0)
+        if ratio and checked >= self.settings.getint('FACETS_IGNORED_MIN_ROWS', 20) and filtered > ratio * checked:
+            mismatches = {
+                key.rsplit('/', 1)[1]: value for key, value in stats.get_stats().items()
+                if key.startswith('facets/mismatch/')
+            }
+            self.logger.error(
+                f"Сервер игнорирует фильтры: на этапе {stage} отсечено {filtered} из {checked} ({mismatches})"
+            )
+            raise CloseSpider('facets_ignored')
+        return matching
+
+    def _draw_sample(self, products: list, city_uuid: str, category_slug: str) -> list:
+        """Случайная выборка строк списка для страты (город, категория)."""
+        # Повторы строк в выдаче — один товар; его вторую карточку отбросил бы фильтр повторов
+        rows = list({product['slug']: product for product in products if product.get('slug')}.values())
+        size = sample_size(len(rows), self.confidence, self.margin)
+        if size:
+            self.strata[(city_uuid, category_slug)] = Stratum(
+                city_uuid, category_slug, len(rows), size, self.confidence
+            )
+        self.logger.info(f"Выборка {category_slug}: {size} из {len(rows)} товаров")
+        return draw(rows, size, self.rng)
+
+    def _share_card(self, product_slug: str, city_uuid: str, category_slug: str) -> list | None:
+        """Карточка страты, которую уже запросила другая страта; None — карточку нужно запросить.
+
+        Повторный запрос отбросил бы фильтр повторов, и страта не дождалась бы
+        карточки, поэтому она учитывается по ответу на первый запрос.
+        """
+        key = (product_slug, city_uuid)
+        stratum_key = (city_uuid, category_slug)
+        if key in self.card_observations:
+            self.crawler.stats.inc_value('sample/shared_cards')
+            return self._observe_in(stratum_key, self.card_observations[key])
+        waiting = self.card_strata.setdefault(key, [])
+        waiting.append(stratum_key)
+        if len(waiting) == 1:
+            return None
+        self.crawler.stats.inc_value('sample/shared_cards')
+        return []
+
+    def _sample_observe(self, meta: dict, item=None, excluded: bool = False) -> list:
+        """Учитывает карточку в ждущих её стратах; после последней карточки страты — её сводка."""
+        if self.mode != 'sample':
+            return []
+        if excluded:
+            observation = ('excluded',)
+        elif item is None:
+            observation = ('failed',)
+        else:
+            adapter = ItemAdapter(item)
+            price_data = adapter.get('price_data') or {}
+            observation = ('observed', price_data.get('current', 0.0), price_data.get('original', 0.0),
+                           (adapter.get('stock') or {}).get('in_stock', False))
+
+        key = (meta.get('product_slug'), meta.get('city_uuid'))
+        self.card_observations[key] = observation
+        strata = self.card_strata.pop(key, None) or [(meta.get('city_uuid'), meta.get('category_slug'))]
+        return [summary for stratum_key in strata for summary in self._observe_in(stratum_key, observation)]
+
+    def _observe_in(self, stratum_key: tuple, observation: tuple) -> list:
+        stratum = self.strata.get(stratum_key)
+        if stratum is None:
+            return []
+        kind, *values = observation
+        if kind == 'excluded':
+            stratum.excluded += 1
+        elif kind == 'failed':
+            stratum.failed += 1
+        else:
+            stratum.add(*values)
+
+        if not stratum.complete:
+            return []
+        del self.strata[stratum_key]
+        return [SampleStatsItem(**stratum.summary())]
+
+    def spider_idle(self, spider):
+        """Выдаёт сводки страт, карточки которых так и не пришли.
+
+        Запросы больше не идут, значит недостающие карточки отброшены раньше
+        колбэка (например, фильтром повторов при продолжении обхода с JOBDIR).
+        Сводки выдаются запросом-пустышкой: из обработчика сигнала товар не выдать.
+        """
+        if not self.strata:
+            return
+        self.crawler.engine.crawl(
+            scrapy.Request('data:,', callback=self._flush_strata, dont_filter=True)
+        )
+        raise DontCloseSpider
+
+    def _flush_strata(self, response):
+        for key, stratum in list(self.strata.items()):
+            del self.strata[key]
+            self.crawler.stats.inc_value('sample/partial_strata')
+            self.logger.warning(
+                f"Выборка {stratum.category_slug} в {stratum.city_uuid} неполная: "
+                f"{stratum.observed + stratum.failed + stratum.excluded} из {stratum.expected} карточек"
+            )
+            yield SampleStatsItem(**stratum.summary())
+
+    def spider_closed(self, spider, reason):
+        # Обход прерван до простоя: сводки уже не выдать, только отметить потерю
+        for stratum in self.strata.values():
+            self.crawler.stats.inc_value('sample/lost_strata')
+            self.logger.warning(
+                f"Выборка {stratum.category_slug} в {stratum.city_uuid} не выгружена: обход закрыт ({reason})"
+            )
+
+    def card_request(self, product_slug: str, city_uuid: str, category_slug: str, priority: int = 0,
+                     product_url: str = '') -> scrapy.Request:
+        """Собирает запрос карточки товара.
+
+        Всё состояние запроса выводится из (slug, город, категория, адрес товара,
+        приоритет), поэтому CardScheduler хранит на диске только эти поля.
+        """
+        meta = {
+            'category_url': f"https://alkoteka.com/catalog/{category_slug}",
+            'category_slug': category_slug,
+            'city_uuid': city_uuid,
+            'product_slug': product_slug,
+        }
+        if product_url:
+            meta['product_url'] = product_url
+
+        return scrapy.Request(
+            url=f"{self.api_base}/product/{product_slug}?city_uuid={city_uuid}",
+            callback=self.parse_product_page,
+            errback=self.card_error,
+            priority=priority,
+            meta=meta,
+        )
+
+    def card_error(self, failure):
+        """Карточка не получена: исчерпаны повторы, ошибка HTTP или сети."""
+        status = failure.value.response.status if failure.check(HttpError) else None
+        return self._dead_letter(failure.request, status, failure.value)
+
+    def _dead_letter(self, request, status, error) -> list:
+        """Сообщает о неудавшейся карточке (её записывает DeadLetterExtension).
+
+        Возвращает сводку выборки, если карточка была последней в своей страте.
+        """
+        self.crawler.signals.send_catch_log(
+            card_failed, request=request, status=status, error=error, spider=self
+        )
+        return self._sample_observe(request.meta)
+
     def parse_product_page(self, response):
         """Парсит полную информацию о товаре с его страницы."""
         category_slug = response.meta['category_slug']
         category_url = response.meta['category_url']
-        list_product_data = response.meta.get('list_product_data', {})
+        city_uuid = response.meta['city_uuid']
 
         try:
             data = response.json()
             if not data.get('success'):
                 self.logger.warning(f"Неуспешный запрос для {response.url}")
+                yield from self._dead_letter(response.request, response.status, 'Unsuccessful')
                 return
 
             product = data.get('results', {})
             if not product:
                 self.logger.warning(f"Нет данных о товаре в {response.url}")
+                yield from self._dead_letter(response.request, response.status, 'EmptyResult')
                 return
 
         except Exception as e:
             self.logger.error(f"Ошибка парсинга JSON: {e}")
+            yield from self._dead_letter(response.request, response.status, e)
             return
 
-        try:
-            # Формируем ProductItem
-            item = ProductItem()
-
-            # 1. timestamp - Unix timestamp в секундах
-            item['timestamp'] = int(time.time())
-
-            # 2. RPC - уникальный идентификатор
-            item['RPC'] = product.get('uuid', '')
-
-            # 3. url - ссылка на товар
-            item['url'] = list_product_data.get('product_url', '')
-
-            # 4. title - с добавлением характеристик если они не указаны в названии
-            item['title'] = self._build_title(product)
-
-            # 5. marketing_tags - маркетинговые тэги
-            item['marketing_tags'] = self._get_marketing_tags(product)
-
-            # 6. brand - бренд товара
-            item['brand'] = self._extract_brand(product)
-
-            # 7. section - иерархия категорий
-            item['section'] = [
-                product.get('category', {}).get('parent', {}).get('name', ''),
-                product.get('category', {}).get('name', '')
-            ]
+        # Бренд и страна есть только в карточке; такой товар не входит в отфильтрованную совокупность
+        if self.facets and not self._facet_filter([product], 'card'):
+            yield from self._sample_observe(response.meta, excluded=True)
+            return
 
-            # 8. price_data - информация о цене
-            item['price_data'] = {
-                'current': float(product.get('price')) if product.get('price') is not None else 0.0,
-                'original': float(product.get('prev_price', product.get('price', 0))) if product.get(
-                    'prev_price') is not None else 0.0,
-                'sale_tag': f"Скидка {round((1 - product['price'] / product.get('prev_price', product['price'])) * 100, 1)}%" if product.get(
-                    'prev_price') and product.get('prev_price') > product.get('price') else ""
-            }
+        try:
+            stores, new_stores = self._parse_stores(product, city_uuid)
+            # Формируем товар одним вызовом конструктора (ProductRecord или ProductItem)
+            item = self.item_cls(
+                # 1. timestamp - Unix timestamp в секундах
+                timestamp=int(time.time()),
+                # 2. RPC - уникальный идентификатор
+                RPC=product.get('uuid', ''),
+                # 3. url - ссылка на товар
+                url=response.meta.get('product_url') or self._product_url(product),
+                # 4. title - с добавлением характеристик если они не указаны в названии
+                title=self._build_title(product),
+                # 5. marketing_tags - маркетинговые тэги
+                marketing_tags=self._get_marketing_tags(product),
+                # 6. brand - бренд товара
+                brand=self._extract_brand(product),
+                # 7. section - иерархия категорий
+                section=[
+                    product.get('category', {}).get('parent', {}).get('name', ''),
+                    product.get('category', {}).get('name', '')
+                ],
+                # 8. price_data - информация о цене
+                price_data={
+                    'current': float(product.get('price')) if product.get('price') is not None else 0.0,
+                    'original': float(product.get('prev_price', product.get('price', 0))) if product.get(
+                        'prev_price') is not None else 0.0,
+                    'sale_tag': f"Скидка {round((1 - product['price'] / product.get('prev_price', product['price'])) * 100, 1)}%" if product.get(
+                        'prev_price') and product.get('prev_price') > product.get('price') else ""
+                },
+                # 9. stock - информация о наличии
+                stock=self._get_stock_info(product, stores),
+                # 10. assets - изображения
+                assets=self._get_assets(product),
+                # 11. metadata - все характеристики товара
+                metadata=self._get_metadata(product, category_url, category_slug, city_uuid, stores),
+                # 12. variants - количество вариантов
+                variants=self._count_variants(product),
+            )
 
-            # 9. stock - информация о наличии
-            item['stock'] = self._get_stock_info(product)
+        except Exception as e:
+            self.logger.error(f"Ошибка при парсинге продукта {product.get('uuid', 'unknown')}: {e!r}")
+            yield from self._dead_letter(response.request, response.status, e)
+            return
 
-            # 10. assets - изображения
-            item['assets'] = self._get_assets(product)
+        # Справочник магазинов раньше товара, который на него ссылается
+        yield from self._new_stores(city_uuid, new_stores)
+        yield item
+        yield from self._sample_observe(response.meta, item)
 
-            # 11. metadata - все характеристики товара
-            item['metadata'] = self._get_metadata(product, category_url, category_slug)
+    @staticmethod
+    def store_id(store_uuid: str, salt: int = 0) -> int:
+        """Целочисленный номер магазина: стабилен между запусками и процессами плана.
 
-            # 12. variants - количество вариантов
-            item['variants'] = self._count_variants(product)
+        53 бита blake2b — столько JSON-потребители читают без потери точности.
+        """
+        key = store_uuid if not salt else f'{store_uuid}#{salt}'
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') >> 11
 
-            yield item
+    def _parse_stores(self, product: dict, city_uuid: str) -> tuple:
+        """Магазины из availability.stores: [(номер, магазин, количество)] и новые для справочника.
 
-        except Exception as e:
-            self.logger.error(f"Ошибка при парсинге продукта {product.get('uuid', 'unknown')}: {e}")
-            self.logger.error(f"Данные продукта: {product}")
+        Магазин без uuid пропускается: номера у всех таких магазинов совпали бы.
+        Номер, уже занятый другим магазином города, заменяется номером с солью;
+        первый занявший номер магазин его сохраняет.
+        """
+        known = self.known_stores.setdefault(city_uuid, {})
+        stores = []
+        new = []
+        for store in (product.get('availability') or {}).get('stores') or []:
+            store_uuid = store.get('uuid')
+            if not store_uuid:
+                self.crawler.stats.inc_value('stores/missing_uuid')
+                continue
+            store_id, salt = self.store_id(store_uuid), 0
+            while known.get(store_id, store_uuid) != store_uuid:
+                salt += 1
+                store_id = self.store_id(store_uuid, salt)
+            if store_id not in known:
+                if salt:
+                    self.crawler.stats.inc_value('stores/id_collisions')
+                    self.logger.warning(f"Номер магазина {store_uuid} в городе {city_uuid} занят, взят {store_id}")
+                known[store_id] = store_uuid
+                new.append((store_id, store))
+            match = QUANTITY_RE.search(store.get('quantity') or '')
+            quantity = int(match.group()) if match else 0
+            stores.append((store_id, store, quantity))
+        return stores, new
+
+    def _new_stores(self, city_uuid: str, new: list):
+        """Выгружает магазины города, которых ещё не было в справочнике.
+
+        Каждый магазин попадает в выгрузку один раз за запуск; обычно весь
+        справочник города набирается по первым нескольким карточкам.
+        """
+        if not new:
+            return
+        yield StoresItem(
+            city_uuid=city_uuid,
+            stores=[
+                {'id': store_id, 'uuid': store['uuid'], 'title': store.get('title', ''),
+                 'address': store.get('address', '')}
+                for store_id, store in new
+            ],
+        )
+
+    def _product_url(self, product: dict) -> str:
+        """Ссылка на товар по данным карточки, если её не было в списке."""
+        if product.get('product_url'):
+            return product['product_url']
+        category_slug = product.get('category', {}).get('slug', '')
+        return f"https://alkoteka.com/product/{category_slug}/{product.get('slug', '')}"
 
     def _build_title(self, product: dict) -> str:
         """Строит заголовок товара с добавлением характеристик если их нет в названии."""
@@ -395,21 +772,22 @@ class ProductsSpider(scrapy.Spider):
         if prev_price and price and prev_price > price > 0:
             tags.append('Скидка')
 
-        return list(set(tags))
+        # Без дублей, в порядке появления: порядок set() меняется от запуска к запуску
+        return list(dict.fromkeys(tags))
+
+    def _get_stock_info(self, product: dict, stores: list) -> dict:
+        """Формирует информацию о наличии.
 
-    def _get_stock_info(self, product: dict) -> dict:
-        """Формирует информацию о наличии."""
+        ``stores`` — остатки по магазинам парами [номер магазина, количество],
+        номера расшифровываются справочником StoresItem.
+        """
         quantity_total = product.get('quantity_total', 0)
         available = product.get('available', False)
         warning = product.get('warning', '')
         availability_title = product.get('availability_title', '')
 
         # Проверяем наличие в магазинах
-        has_stores = False
-        availability = product.get('availability', {})
-        if availability:
-            stores = availability.get('stores', [])
-            has_stores = len(stores) > 0
+        has_stores = len(stores) > 0
 
         # Определяем есть ли товар в наличии
         in_stock = False
@@ -435,7 +813,8 @@ class ProductsSpider(scrapy.Spider):
 
         return {
             'in_stock': in_stock,
-            'count': quantity_total
+            'count': quantity_total,
+            'stores': [[store_id, quantity] for store_id, _, quantity in stores],
         }
 
     def _get_assets(self, product: dict) -> dict:
@@ -449,7 +828,8 @@ class ProductsSpider(scrapy.Spider):
             'video': []
         }
 
-    def _get_metadata(self, product: dict, category_url: str, category_slug: str) -> dict:
+    def _get_metadata(self, product: dict, category_url: str, category_slug: str, city_uuid: str,
+                      stores: list) -> dict:
         """Собирает все характеристики товара."""
         description_parts = []
 
@@ -488,6 +868,7 @@ class ProductsSpider(scrapy.Spider):
             'Доступное количество': product.get('quantity_total'),
             'Категория URL': category_url,
             'Категория slug': category_slug,
+            'Город UUID': city_uuid,
             'Новинка': 'Да' if product.get('new') else 'Нет',
             'Рекомендуемое': 'Да' if product.get('recomended') else 'Нет',
             'Енограмма': 'Да' if product.get('enogram') else 'Нет',
@@ -633,22 +1014,13 @@ class ProductsSpider(scrapy.Spider):
                 metadata['Детали цен'] = '; '.join(price_info)
 
         # Информация о наличии в магазинах
-        availability = product.get('availability', {})
-        if availability:
-            stores = availability.get('stores', [])
-            if stores:
-                metadata['Количество магазинов'] = len(stores)
-
-                # Считаем общее количество товара по магазинах
-                total_in_stores = 0
-                for store in stores:
-                    quantity_str = store.get('quantity', '0 шт')
-                    match = re.search(r'(\d+)', quantity_str)
-                    if match:
-                        total_in_stores += int(match.group(1))
-
-                if total_in_stores > 0:
-                    metadata['Количество во всех магазинах'] = total_in_stores
+        if stores:
+            metadata['Количество магазинов'] = len(stores)
+
+            # Считаем общее количество товара по магазинам
+            total_in_stores = sum(quantity for _, _, quantity in stores)
+            if total_in_stores > 0:
+                metadata['Количество во всех магазинах'] = total_in_stores
 
         # Гастрономические сочетания
         gastronomics = product.get('gastronomics', {})
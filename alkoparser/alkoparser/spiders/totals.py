@@ -0,0 +1,51 @@
+import scrapy
+
+from ..api import ApiSpiderMixin
+from ..items import CategoryTotalItem
+from ..targets import resolve_categories, resolve_cities
+
+
+class TotalsSpider(ApiSpiderMixin, scrapy.Spider):
+    """Паук для сбора количества товаров (meta.total) по городам и категориям.
+
+    Используется командой ``scrapy plan`` для оценки стоимости обхода.
+    """
+
+    name = "totals"
+    allowed_domains = ["alkoteka.com"]
+
+    def __init__(self, *args, cities='all', categories='all', **kwargs):
+        """Инициализирует паука списками городов и категорий (UUID/slug через запятую или all)."""
+        super().__init__(*args, **kwargs)
+        self.cities = resolve_cities(cities, [])
+        self.categories = resolve_categories(categories, [])
+
+    def start_requests(self):
+        """Запрашивает по одному товару на пару (город, категория): нужен только meta.total"""
+        for city_uuid in self.cities:
+            for category_slug in self.categories:
+                url = (
+                    f"{self.api_base}/product?"
+                    f"city_uuid={city_uuid}&"
+                    f"root_category_slug={category_slug}&"
+                    f"per_page=1"
+                )
+                yield scrapy.Request(
+                    url,
+                    callback=self.parse,
+                    meta={'city_uuid': city_uuid, 'category_slug': category_slug}
+                )
+
+    def parse(self, response):
+        """Возвращает total для пары (город, категория)."""
+        try:
+            data = response.json()
+        except ValueError:
+            self.logger.error(f"Invalid JSON response for {response.url}")
+            return
+
+        yield CategoryTotalItem(
+            city_uuid=response.meta['city_uuid'],
+            category_slug=response.meta['category_slug'],
+            total=data.get('meta', {}).get('total', 0),
+        )
@@ -0,0 +1,60 @@
+import json
+import sqlite3
+from pathlib import Path
+
+
+class StateStore:
+    """Персистентное состояние между запусками: таблица ключ -> JSON в SQLite.
+
+    По умолчанию каждая запись фиксируется сразу: в WAL без fsync это десятки
+    микросекунд, зато блокировка записи не держится между товарами и одну базу
+    могут писать несколько процессов (рабочие ``scrapy plan``); конкурент ждёт
+    освобождения до ``timeout`` секунд. ``commit_every`` > 1 копит записи в
+    одной транзакции — только для базы, которую пишет один процесс.
+    Открытое соединение ``db`` можно передать, чтобы состояние фиксировалось
+    в одной транзакции с другими таблицами той же базы.
+    """
+
+    def __init__(self, path: str | Path, table: str = 'state', commit_every: int = 1,
+                 db: sqlite3.Connection | None = None, timeout: float = 30.0):
+        self.path = Path(path)
+        self.table = table
+        self.commit_every = commit_every
+        self._pending = 0
+        self.db = db or sqlite3.connect(self.path, timeout=timeout)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def get(self, key: str):
+        row = self.db.execute(f'SELECT value FROM {self.table} WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value):
+        self.db.execute(
+            f'INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)',
+            (key, json.dumps(value, ensure_ascii=False, separators=(',', ':'))),
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self._pending = 0
+
+    def __len__(self):
+        return self.db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+def product_key(adapter) -> str | None:
+    """Ключ товара в состоянии: RPC и город (товар в разных городах — разные записи)."""
+    rpc = adapter.get('RPC')
+    if not rpc:
+        return None
+    city = (adapter.get('metadata') or {}).get('Город UUID', '')
+    return f"{rpc}|{city}"
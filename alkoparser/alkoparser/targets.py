@@ -0,0 +1,40 @@
+import json
+from pathlib import Path
+
+CITIES_FILE = Path('cities_uuid.json')
+CATEGORIES_FILE = Path('categories.json')
+
+# Витрины из товаров других корневых категорий: в ``all`` они дали бы те же карточки второй раз
+OVERLAPPING_CATEGORIES = frozenset({'skidki'})
+
+
+def resolve_cities(value: str | None, default: list) -> list:
+    """Разбирает аргумент паука ``cities``: UUID через запятую или ``all``.
+
+    ``all`` берёт все города из cities_uuid.json (результат паука cities).
+    """
+    if not value:
+        return list(default)
+    if value == 'all':
+        with open(CITIES_FILE, 'r', encoding='utf-8') as file:
+            return [city['uuid'] for city in json.load(file) if city.get('uuid')]
+    return [uuid.strip() for uuid in value.split(',') if uuid.strip()]
+
+
+def resolve_categories(value: str | None, default: list) -> list:
+    """Разбирает аргумент паука ``categories``: slug корневых категорий через запятую или ``all``.
+
+    ``all`` берёт уникальные категории из categories.json (результат паука categories),
+    кроме OVERLAPPING_CATEGORIES; явно перечисленные категории берутся как есть.
+    """
+    if not value:
+        return list(default)
+    if value == 'all':
+        with open(CATEGORIES_FILE, 'r', encoding='utf-8') as file:
+            slugs = [
+                category['slug'] for category in json.load(file)
+                if category.get('slug') and category['slug'] not in OVERLAPPING_CATEGORIES
+            ]
+        # В categories.json категории повторяются для каждого города
+        return list(dict.fromkeys(slugs))
+    return [slug.strip() for slug in value.split(',') if slug.strip()]
@@ -0,0 +1,30 @@
+import threading
+
+import pytest
+
+from alkoparser.mockserver import MockApiServer, SyntheticCatalog
+
+from .helpers import PRODUCTS
+
+
+@pytest.fixture
+def catalog():
+    return SyntheticCatalog(products=PRODUCTS)
+
+
+@pytest.fixture
+def mock_api():
+    """Запускает MockApiServer на свободном порту в потоке; возвращает адрес для ALKOTEKA_BASE_URL."""
+    servers = []
+
+    def start(catalog: SyntheticCatalog) -> str:
+        server = MockApiServer(('127.0.0.1', 0), catalog)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        host, port = server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
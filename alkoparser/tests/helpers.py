@@ -0,0 +1,151 @@
+"""Общие части нагрузочных тестов: подменённый загрузчик, прогон паука и запуск scrapy на заглушке.
+
+Масштаб и бюджеты задаются переменными окружения, чтобы один и тот же набор
+тестов гонять и быстро в CI, и на полном каталоге:
+
+    ALKO_TEST_PRODUCTS=100000 ALKO_TEST_CITIES=60 python -m pytest -q
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from scrapy import Request
+from scrapy.http import TextResponse
+from scrapy.utils.reactor import install_reactor
+from scrapy.utils.test import get_crawler
+
+from alkoparser.mockserver import SyntheticCatalog, parse_query
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+
+# Обход заглушки без пауз: задержки и AutoThrottle нужны настоящему сайту
+FAST_SETTINGS = {
+    'AUTOTHROTTLE_ENABLED': 'False',
+    'DOWNLOAD_DELAY': '0',
+    'CONCURRENT_REQUESTS': '32',
+    'CONCURRENT_REQUESTS_PER_DOMAIN': '32',
+    'FILES_STORE': '',
+    'LOG_LEVEL': 'INFO',
+}
+
+# get_crawler сверяет реактор с TWISTED_REACTOR проекта
+install_reactor('twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+
+
+def env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+# Товаров в каталоге и городов в обходе товаров на малом шаге проверки роста
+PRODUCTS = env_int('ALKO_TEST_PRODUCTS', 1000)
+CITIES = env_int('ALKO_TEST_CITIES', 2)
+# Во сколько раз больше большой шаг
+GROWTH_FACTOR = env_int('ALKO_TEST_GROWTH_FACTOR', 4)
+# Насколько удельные затраты на большом шаге могут превышать малый
+GROWTH_TOLERANCE = env_float('ALKO_TEST_GROWTH_TOLERANCE', 1.5)
+# Бюджеты: время паука на карточку и пик памяти на товар категории
+MAX_MS_PER_CARD = env_float('ALKO_TEST_MAX_MS_PER_CARD', 2.0)
+MAX_KB_PER_PRODUCT = env_float('ALKO_TEST_MAX_KB_PER_PRODUCT', 32.0)
+
+
+class MockDownloader:
+    """Отвечает на запросы пауков из SyntheticCatalog без сети и реактора."""
+
+    def __init__(self, catalog: SyntheticCatalog):
+        self.catalog = catalog
+        self.requests = Counter()
+
+    def fetch(self, request: Request) -> TextResponse:
+        parts = urlsplit(request.url)
+        payload = self.catalog.route(parts.path, parse_query(parts.query))
+        assert payload is not None, f"Заглушка не знает адрес {request.url}"
+        self.requests[parts.path.rsplit('/', 1)[0] if '/product/' in parts.path else parts.path] += 1
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        return TextResponse(request.url, body=body, encoding='utf-8', request=request)
+
+
+@dataclass
+class CrawlResult:
+    items: Counter = field(default_factory=Counter)
+    requests: int = 0
+    spider_seconds: float = 0.0
+    peak_bytes: int = 0
+
+
+def run_spider(spider, downloader: MockDownloader, trace_memory: bool = False) -> CrawlResult:
+    """Прогоняет паука в глубину: карточки создаются лениво, как их отдаёт колбэк.
+
+    Учитывается только время внутри кода паука; генерация ответов заглушкой и
+    сам обход в счёт не идут. Товары считаются и сразу отбрасываются.
+    """
+    result = CrawlResult()
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    stack = [iter(spider.start_requests())]
+    while stack:
+        started = time.perf_counter()
+        try:
+            output = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        finally:
+            result.spider_seconds += time.perf_counter() - started
+
+        if isinstance(output, Request):
+            response = downloader.fetch(output)
+            result.requests += 1
+            callback = output.callback or spider.parse
+            stack.append(iter(callback(response) or ()))
+        else:
+            result.items[type(output).__name__] += 1
+
+    if trace_memory:
+        result.peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def make_spider(spider_cls, **kwargs):
+    crawler = get_crawler(spider_cls, {'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'})
+    return spider_cls.from_crawler(crawler, **kwargs)
+
+
+def scrapy_command(cwd: Path, *args: str, settings: dict | None = None) -> list:
+    """Команда scrapy проекта для запуска в каталоге ``cwd``: файлы состояния остаются в нём."""
+    command = [sys.executable, '-m', 'scrapy', *args]
+    for name, value in {**FAST_SETTINGS, **(settings or {})}.items():
+        command += ['-s', f'{name}={value}']
+    return command
+
+
+def scrapy_env() -> dict:
+    return {
+        **os.environ,
+        'SCRAPY_SETTINGS_MODULE': 'alkoparser.settings',
+        'PYTHONPATH': os.pathsep.join(filter(None, [str(PROJECT_DIR), os.environ.get('PYTHONPATH')])),
+    }
+
+
+def run_scrapy(cwd: Path, *args: str, settings: dict | None = None, timeout: float = 300) -> dict:
+    """Запускает scrapy настоящим движком и возвращает итоговую статистику из журнала производительности."""
+    ledger = cwd / 'perf_ledger.jsonl'
+    ledger.unlink(missing_ok=True)
+    command = scrapy_command(cwd, *args, settings={'PERF_LEDGER_FILE': str(ledger), **(settings or {})})
+    completed = subprocess.run(command, cwd=cwd, env=scrapy_env(), capture_output=True, text=True, timeout=timeout)
+    assert completed.returncode == 0, completed.stderr[-3000:]
+    return json.loads(ledger.read_text(encoding='utf-8').splitlines()[-1])['stats']
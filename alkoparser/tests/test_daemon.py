@@ -0,0 +1,66 @@
+import json
+import signal
+import socket
+import subprocess
+import time
+
+import pytest
+
+from alkoparser.mockserver import SyntheticCatalog
+
+from .helpers import scrapy_command, scrapy_env
+
+
+def submit(path, message: dict, timeout: float = 120) -> dict:
+    """Отправляет задание и ждёт его итогового ответа."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        for line in sock.makefile('r', encoding='utf-8'):
+            reply = json.loads(line)
+            if reply['status'] in ('finished', 'failed', 'error'):
+                return reply
+    raise AssertionError("Процесс обходов закрыл соединение без ответа")
+
+
+@pytest.fixture
+def daemon(mock_api, tmp_path):
+    catalog = SyntheticCatalog(products=300)
+    address = tmp_path / 'daemon.sock'
+    process = subprocess.Popen(
+        scrapy_command(tmp_path, 'daemon', '--address', f'unix://{address}',
+                       # Не больше соединений, чем пул держит между заданиями
+                       settings={'ALKOTEKA_BASE_URL': mock_api(catalog), 'CONCURRENT_REQUESTS': 4,
+                                 'DOWNLOAD_POOL_SIZE': 8}),
+        cwd=tmp_path, env=scrapy_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while not address.exists():
+        assert process.poll() is None and time.monotonic() < deadline, "scrapy daemon не запустился"
+        time.sleep(0.1)
+    yield address, catalog
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def test_second_job_starts_warm(daemon):
+    address, catalog = daemon
+    job = {'spider': 'products', 'args': {'cities': catalog.cities[0]['uuid'],
+                                          'categories': catalog.categories[0]['slug']}}
+
+    first = submit(address, job)
+    second = submit(address, job)
+
+    assert first['status'] == second['status'] == 'finished'
+    assert first['items'] == second['items'] > 0
+    assert first['stats']['robotstxt/request_count'] == 1
+    # robots.txt из кэша процесса, соединения — открытые первым заданием
+    assert 'robotstxt/request_count' not in second['stats']
+    assert second['stats']['robotstxt/warm'] >= 1
+    assert first['stats']['downloader/connections/opened'] > 0
+    assert 'downloader/connections/opened' not in second['stats']
+    assert second['stats']['downloader/connections/reused'] == second['stats']['downloader/request_count']
@@ -0,0 +1,99 @@
+import json
+
+from scrapy import Request
+from scrapy.http import Response, TextResponse
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TimeoutError
+from twisted.python.failure import Failure
+
+from alkoparser.deadletter import DeadLetterExtension
+from alkoparser.middlewares import RetryBudgetMiddleware
+from alkoparser.spiders.products import ProductsSpider
+
+REACTOR = {'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'}
+
+
+def spider_with(**settings):
+    crawler = get_crawler(ProductsSpider, {**REACTOR, **settings})
+    return ProductsSpider.from_crawler(crawler)
+
+
+def failed(request: Request, error: Exception) -> Failure:
+    failure = Failure(error)
+    # Так errback получает отказ от Scrapy
+    failure.request = request
+    return failure
+
+
+def test_record_per_failure_kind(tmp_path):
+    path = tmp_path / 'dead_letters.jsonl'
+    spider = spider_with(DEADLETTER_FILE=str(path))
+    extension = DeadLetterExtension.from_crawler(spider.crawler)
+    card = spider.card_request('vino-1', 'city', 'vino')
+
+    exhausted = card.replace(meta={**card.meta, 'retry_times': 3})
+    spider.card_error(failed(exhausted, HttpError(Response(card.url, status=503, request=exhausted))))
+    spider.card_error(failed(card, TimeoutError()))
+    for body in ('{"success": false}', '{"success": true, "results": {}}', 'не JSON'):
+        list(spider.parse_product_page(TextResponse(card.url, body=body, encoding='utf-8', request=card)))
+    extension.spider_closed(spider)
+
+    records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [(record['status'], record['error'], record['attempts']) for record in records] == [
+        (503, 'HttpError', 4),
+        (None, 'TimeoutError', 1),
+        (200, 'Unsuccessful', 1),
+        (200, 'EmptyResult', 1),
+        (200, 'JSONDecodeError', 1),
+    ]
+    assert all((record['slug'], record['city'], record['category']) == ('vino-1', 'city', 'vino')
+               for record in records)
+    assert spider.crawler.stats.get_value('deadletter/count') == 5
+    assert spider.crawler.stats.get_value('deadletter/error/HttpError') == 1
+
+
+def test_replay_requests_each_card_once_and_renames_file(tmp_path):
+    path = tmp_path / 'dead_letters.jsonl'
+    records = [
+        {'slug': 'a', 'city': 'c1', 'category': 'vino', 'status': 503},
+        {'slug': 'b', 'city': 'c1', 'category': 'vino', 'status': None},
+        {'slug': 'a', 'city': 'c1', 'category': 'vino', 'status': 500},
+        {'slug': 'a', 'city': 'c2', 'category': 'vino', 'status': 503},
+    ]
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+    spider = spider_with()
+    spider.replay = str(path)
+
+    requests = list(spider.start_requests())
+
+    assert sorted((r.meta['product_slug'], r.meta['city_uuid']) for r in requests) == [
+        ('a', 'c1'), ('a', 'c2'), ('b', 'c1'),
+    ]
+    assert all(r.callback == spider.parse_product_page for r in requests)
+    assert not path.exists() and (tmp_path / 'dead_letters.jsonl.replayed').exists()
+
+
+def test_retry_budget_runs_out_per_host():
+    spider = spider_with(RETRY_TIMES=10, RETRY_BUDGET_BURST=2, RETRY_BUDGET_RATIO=0.5)
+    middleware = RetryBudgetMiddleware.from_crawler(spider.crawler)
+
+    def fail(request):
+        return middleware.process_response(request, Response(request.url, status=503), spider)
+
+    request = Request('https://alkoteka.com/web-api/v1/product/a')
+    # Запас — два повтора, дальше отказ: ответ уходит дальше как есть
+    first = fail(request)
+    second = fail(first)
+    assert isinstance(first, Request) and isinstance(second, Request)
+    assert isinstance(fail(second), Response)
+    assert spider.crawler.stats.get_value('retry/budget_exhausted') == 1
+
+    # Бюджет свой у каждого хоста
+    assert isinstance(fail(Request('https://cdn.alkoteka.com/a.jpg')), Request)
+
+    # Новые запросы пополняют бюджет: два успешных по 0.5 — ещё один повтор
+    for slug in ('b', 'c'):
+        fresh = Request(f'https://alkoteka.com/web-api/v1/product/{slug}')
+        middleware.process_response(fresh, Response(fresh.url, status=200), spider)
+    assert isinstance(fail(second), Request)
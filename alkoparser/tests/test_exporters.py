@@ -0,0 +1,83 @@
+import json
+from io import BytesIO
+from types import SimpleNamespace
+
+from scrapy.extensions.feedexport import FileFeedStorage
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+from alkoparser.exporters import DeltaFeedCommitter, DeltaJsonLinesItemExporter
+
+
+def product(rpc: str, price: float = 100.0, **extra) -> dict:
+    return {'RPC': rpc, 'timestamp': 1, 'title': rpc, 'price_data': {'current': price, **extra},
+            'metadata': {'Город UUID': 'city'}}
+
+
+def export(state_path, items: list, delivered: bool = True, **kwargs) -> list:
+    """Один запуск выгрузки; возвращает записанные строки."""
+    file = BytesIO()
+    exporter = DeltaJsonLinesItemExporter(file, state_path=str(state_path), **kwargs)
+    exporter.start_exporting()
+    for item in items:
+        exporter.export_item(item)
+    exporter.finish_exporting()
+    exporter.promote() if delivered else exporter.discard()
+    return [json.loads(line) for line in file.getvalue().decode('utf-8').splitlines()]
+
+
+def test_new_changed_and_unchanged_products(tmp_path):
+    state = tmp_path / 'delta.sqlite'
+    first = export(state, [product('a'), product('b', original=120.0)])
+    assert [record['op'] for record in first] == ['full', 'full']
+    assert first[0]['item']['RPC'] == 'a'
+
+    second = export(state, [product('a'), product('b', 90.0, sale_tag='Скидка'), product('c')])
+    assert [record['op'] for record in second] == ['patch', 'full']
+    patch = second[0]
+    assert (patch['RPC'], patch['city']) == ('b', 'city')
+    assert patch['changed'] == {'price_data.current': 90.0}
+    assert patch['added'] == {'price_data.sale_tag': 'Скидка'}
+    assert patch['removed'] == ['price_data.original']
+
+
+def test_full_record_every_n_patches(tmp_path):
+    state = tmp_path / 'delta.sqlite'
+    ops = [export(state, [product('a', price)], full_every=3)[0]['op'] for price in (1.0, 2.0, 3.0, 4.0, 5.0)]
+
+    # Каждая full_every-я запись о товаре — целиком
+    assert ops == ['full', 'patch', 'patch', 'full', 'patch']
+
+
+def test_undelivered_feed_does_not_advance_state(tmp_path):
+    state = tmp_path / 'delta.sqlite'
+    export(state, [product('a')])
+    assert export(state, [product('a', 90.0)], delivered=False)[0]['op'] == 'patch'
+
+    # Потребитель патча не получил: изменение выгружается ещё раз
+    again = export(state, [product('a', 90.0)])
+    assert again[0]['changed'] == {'price_data.current': 90.0}
+    assert export(state, [product('a', 90.0)]) == []
+
+
+def test_committer_promotes_only_stored_feeds(tmp_path):
+    crawler = get_crawler(settings_dict={'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'})
+    stats = MemoryStatsCollector(crawler)
+    committer = DeltaFeedCommitter(stats)
+    storage = FileFeedStorage(str(tmp_path / 'changes.jsonl'))
+
+    def close_slot(state_path, failed: bool):
+        exporter = DeltaJsonLinesItemExporter(BytesIO(), state_path=str(state_path))
+        exporter.export_item(product('a'))
+        exporter.finish_exporting()
+        if failed:
+            # Так FeedExporter отмечает ошибку хранилища перед сигналом
+            stats.inc_value('feedexport/failed_count/FileFeedStorage')
+        committer.feed_slot_closed(SimpleNamespace(storage=storage, exporter=exporter, uri='changes.jsonl'))
+
+    close_slot(tmp_path / 'failed.sqlite', failed=True)
+    close_slot(tmp_path / 'stored.sqlite', failed=False)
+
+    assert stats.get_value('delta/state_discarded') == 1
+    assert export(tmp_path / 'failed.sqlite', [product('a')])[0]['op'] == 'full'
+    assert export(tmp_path / 'stored.sqlite', [product('a')]) == []
@@ -0,0 +1,78 @@
+import pytest
+from scrapy.exceptions import CloseSpider
+from scrapy.utils.test import get_crawler
+
+from alkoparser.facets import Facets
+from alkoparser.mockserver import SyntheticCatalog, parse_query
+from alkoparser.spiders.products import ProductsSpider
+
+from .helpers import MockDownloader, run_spider
+
+FILTERS = {'brand': 'Фанагория', 'discounted': '1', 'price': '-3000'}
+
+
+class IgnoringFiltersCatalog(SyntheticCatalog):
+    """Сервер, который не знает фильтров выдачи и отдаёт всю категорию."""
+
+    def product_page(self, city_uuid, category_slug, page, per_page, facets=Facets()):
+        return super().product_page(city_uuid, category_slug, page, per_page)
+
+
+def crawl(catalog, settings=None, **filters):
+    crawler = get_crawler(ProductsSpider, {
+        'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor',
+        **(settings or {}),
+    })
+    spider = ProductsSpider.from_crawler(
+        crawler,
+        cities=catalog.cities[0]['uuid'],
+        categories=catalog.categories[0]['slug'],
+        **filters,
+    )
+    downloader = MockDownloader(catalog)
+    return spider, downloader, run_spider(spider, downloader)
+
+
+def test_facets_round_trip_through_query():
+    facets = Facets.from_arguments(brand='Фанагория,Инкерман', country='Франция', in_stock='yes', price='500-')
+
+    assert Facets.from_query(parse_query(facets.query())) == facets
+    assert not Facets.from_arguments()
+
+
+def test_server_side_filters_cost_requests_per_match(catalog):
+    _, _, full = crawl(catalog)
+    spider, _, result = crawl(catalog, **FILTERS)
+    matches = len(catalog.matching(catalog.cities[0]['uuid'], catalog.categories[0]['slug'], spider.facets))
+
+    assert 0 < result.items['ProductRecord'] == matches < full.items['ProductRecord']
+    # total и вся выдача одним запросом, дальше по карточке на совпадение
+    assert result.requests == matches + 2
+
+
+def test_crawl_closes_when_server_ignores_filters():
+    catalog = IgnoringFiltersCatalog(products=1000)
+    with pytest.raises(CloseSpider) as closed:
+        crawl(catalog, **FILTERS)
+
+    assert closed.value.reason == 'facets_ignored'
+
+
+def test_brand_ignored_by_server_closes_crawl_on_cards():
+    # Бренд в выдаче не виден: расхождения копятся по карточкам
+    catalog = IgnoringFiltersCatalog(products=1000)
+    with pytest.raises(CloseSpider):
+        crawl(catalog, brand='Фанагория')
+
+
+def test_client_side_fallback_when_server_ignores_filters():
+    catalog = IgnoringFiltersCatalog(products=1000)
+    # Закрытие отключено: фильтры применяются на клиенте
+    spider, _, result = crawl(catalog, settings={'FACETS_IGNORED_RATIO': 0}, **FILTERS)
+    expected = len(catalog.matching(catalog.cities[0]['uuid'], catalog.categories[0]['slug'], spider.facets))
+    stats = spider.crawler.stats
+
+    assert result.items['ProductRecord'] == expected
+    assert stats.get_value('facets/filtered/listing') > 0
+    # Бренд виден только в карточке
+    assert stats.get_value('facets/mismatch/brand') == stats.get_value('facets/filtered/card')
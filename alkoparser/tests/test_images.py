@@ -0,0 +1,40 @@
+from scrapy import Request, Spider
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from alkoparser.pipelines import ProductImagesPipeline
+
+
+def pipeline(tmp_path):
+    crawler = get_crawler(Spider, {
+        'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor',
+        'FILES_STORE': str(tmp_path / 'images'),
+        'IMAGES_INDEX_FILE': str(tmp_path / 'images_index.sqlite'),
+    })
+    return ProductImagesPipeline.from_crawler(crawler)
+
+
+def download(images, url: str, body: bytes) -> str:
+    """Путь, который конвейер вернёт для загруженной картинки, как в FilesPipeline.media_downloaded."""
+    request = Request(url)
+    response = Response(url, body=body)
+    path = images.file_path(request, response=response)
+    images.file_downloaded(response, request, None)
+    return path
+
+
+def test_duplicate_content_points_to_stored_file(tmp_path):
+    images = pipeline(tmp_path)
+    first = download(images, 'https://cdn.example/a/bottle.png', b'bottle')
+    second = download(images, 'https://cdn.example/b/bottle.jpeg', b'bottle')
+
+    assert first == second and first.endswith('.png')
+    assert (tmp_path / 'images' / first).exists()
+    assert images.stats.get_value('images/duplicate_content') == 1
+    images.index.close()
+
+    # В следующем запуске тот же файл находится по индексу
+    again = pipeline(tmp_path)
+    assert download(again, 'https://cdn.example/c/bottle.webp', b'bottle') == first
+    assert not (tmp_path / 'images' / first).with_suffix('.webp').exists()
+    again.index.close()
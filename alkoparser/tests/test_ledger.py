@@ -0,0 +1,54 @@
+import json
+import subprocess
+
+from alkoparser.ledger import compare
+
+from .helpers import scrapy_command, scrapy_env
+
+
+def ledger_run(items_per_minute: float, reason: str = 'finished', spider: str = 'products', **arguments) -> dict:
+    return {
+        'time': '2026-10-19T00:00:00+00:00', 'spider': spider, 'reason': reason, 'arguments': arguments,
+        'settings_fingerprint': 'abc', 'stats': {'items_per_minute': items_per_minute, 'item_scraped_count': 100},
+        'derived': {}, 'latency': {},
+    }
+
+
+def rows(report: list) -> dict:
+    return {name: (base, regression) for name, value, base, change, regression in report}
+
+
+def test_slow_run_is_a_regression_against_the_median():
+    history = [ledger_run(1000.0), ledger_run(1100.0), ledger_run(900.0)]
+
+    assert rows(compare(ledger_run(800.0), history)) == {'items_per_minute': (1000.0, True)}
+    assert rows(compare(ledger_run(950.0), history)) == {'items_per_minute': (1000.0, False)}
+
+
+def test_baseline_skips_unfinished_and_other_runs():
+    history = [
+        ledger_run(1000.0),
+        # Прерванный обход, другой паук и другие аргументы в базу не идут
+        ledger_run(10.0, reason='shutdown'),
+        ledger_run(10.0, reason='closespider_timeout'),
+        ledger_run(10.0, spider='totals'),
+        ledger_run(10.0, city='moskva'),
+    ]
+
+    assert rows(compare(ledger_run(800.0), history)) == {'items_per_minute': (1000.0, True)}
+    assert compare(ledger_run(800.0), [ledger_run(10.0, reason='shutdown')]) == []
+
+
+def test_ledger_command_exits_with_1_on_regression(tmp_path):
+    ledger = tmp_path / 'perf_ledger.jsonl'
+
+    def exit_code(*runs: dict) -> int:
+        ledger.write_text(''.join(json.dumps(run) + '\n' for run in runs), encoding='utf-8')
+        command = scrapy_command(tmp_path, 'ledger', '-f', str(ledger))
+        return subprocess.run(command, cwd=tmp_path, env=scrapy_env(), capture_output=True, timeout=60).returncode
+
+    history = [ledger_run(1000.0), ledger_run(1000.0)]
+    assert exit_code(*history, ledger_run(800.0)) == 1
+    assert exit_code(*history, ledger_run(1000.0)) == 0
+    # База из одних прерванных запусков — сравнивать не с чем
+    assert exit_code(ledger_run(1000.0, reason='shutdown'), ledger_run(800.0)) == 0
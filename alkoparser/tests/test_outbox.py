@@ -0,0 +1,58 @@
+import time
+
+from alkoparser.outbox import Outbox
+
+
+def fill(outbox: Outbox, count: int, at: float | None = None):
+    for i in range(count):
+        outbox.append({'time': at or time.time(), 'key': f'p{i}'})
+    outbox.commit()
+
+
+def test_offsets_are_per_consumer_and_never_go_back(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.sqlite')
+    fill(outbox, 5)
+
+    batch = outbox.read('webhook', 2)
+    assert [event_id for event_id, _ in batch] == [1, 2]
+    outbox.ack('webhook', batch[-1][0])
+    # Запоздалое подтверждение старой пачки смещение не откатывает
+    outbox.ack('webhook', 1)
+
+    assert [event_id for event_id, _ in outbox.read('webhook')] == [3, 4, 5]
+    assert len(outbox.read('file')) == 5
+    assert outbox.consumers() == {'webhook': 2}
+
+
+def test_unacknowledged_batch_is_delivered_again(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.sqlite')
+    fill(outbox, 3)
+    first = outbox.read('consumer')
+    # Потребитель упал до подтверждения
+    outbox.close()
+
+    reopened = Outbox(tmp_path / 'outbox.sqlite')
+    assert reopened.read('consumer') == first
+    reopened.ack('consumer', first[-1][0])
+    assert reopened.read('consumer') == []
+
+
+def test_prune_keeps_events_until_every_consumer_has_them(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.sqlite')
+    fill(outbox, 4)
+    outbox.ack('fast', 4)
+    outbox.ack('slow', 1)
+
+    assert outbox.prune(['fast', 'slow']) == 1
+    assert [event_id for event_id, _ in outbox.read('slow')] == [2, 3, 4]
+    assert outbox.prune([]) == 0
+
+
+def test_prune_drops_events_older_than_retention(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.sqlite')
+    fill(outbox, 3, at=time.time() - 10 * 86400)
+    fill(outbox, 2)
+
+    # Без потребителей журнал ограничен только сроком хранения
+    assert outbox.prune([], max_age=7 * 86400) == 3
+    assert outbox.last_id() == 5 and len(outbox.read('late')) == 2
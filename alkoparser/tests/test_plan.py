@@ -0,0 +1,77 @@
+import json
+
+from scrapy.settings import Settings
+
+from alkoparser.commands.plan import Command
+from alkoparser.targets import resolve_categories
+
+
+def test_all_categories_skip_overlapping_showcases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    categories = [{'slug': slug, 'city_uuid': city} for city in ('a', 'b') for slug in ('vino', 'skidki', 'pivo')]
+    (tmp_path / 'categories.json').write_text(json.dumps(categories), encoding='utf-8')
+
+    assert resolve_categories('all', []) == ['vino', 'pivo']
+    # Явно названная витрина обходится
+    assert resolve_categories('vino,skidki', []) == ['vino', 'skidki']
+
+
+def test_workers_share_the_site_rate():
+    command = Command()
+    command.settings = Settings({
+        'DOWNLOAD_DELAY': 1, 'AUTOTHROTTLE_ENABLED': True, 'AUTOTHROTTLE_START_DELAY': 2,
+        'AUTOTHROTTLE_MAX_DELAY': 60, 'AUTOTHROTTLE_TARGET_CONCURRENCY': 1.0,
+    })
+
+    assert command._shared_rate(4) == {
+        'DOWNLOAD_DELAY': 4.0, 'AUTOTHROTTLE_START_DELAY': 8.0,
+        'AUTOTHROTTLE_MAX_DELAY': 240.0, 'AUTOTHROTTLE_TARGET_CONCURRENCY': 0.25,
+    }
+
+
+def test_parts_merge_into_json_array_or_jsonlines(tmp_path):
+    parts = [tmp_path / 'part-0.jsonl', tmp_path / 'part-1.jsonl', tmp_path / 'part-2.jsonl']
+    parts[0].write_text('{"RPC": "a"}\n{"RPC": "b"}\n', encoding='utf-8')
+    parts[2].write_text('{"RPC": "c"}\n', encoding='utf-8')
+
+    assert Command._merge_parts(parts, tmp_path / 'result.json') == 3
+    assert [row['RPC'] for row in json.loads((tmp_path / 'result.json').read_text(encoding='utf-8'))] == ['a', 'b', 'c']
+    assert Command._merge_parts(parts, tmp_path / 'result.jsonl') == 3
+    assert (tmp_path / 'result.jsonl').read_text(encoding='utf-8').count('\n') == 3
+    assert Command._merge_parts([], tmp_path / 'empty.json') == 0
+    assert json.loads((tmp_path / 'empty.json').read_text(encoding='utf-8')) == []
+
+
+def test_worker_journals_are_private_and_merged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    command = Command()
+    command.settings = Settings({
+        'VALIDATION_QUARANTINE_FILE': 'quarantine.jsonl', 'DEADLETTER_FILE': '',
+        'PERF_LEDGER_FILE': 'perf_ledger.jsonl', 'PROFILER_DIR': 'profiles',
+    })
+    workdir = tmp_path / 'plan'
+    workdir.mkdir()
+    (tmp_path / 'perf_ledger.jsonl').write_text('{"run": "old"}\n', encoding='utf-8')
+
+    overrides = [command._prepare_worker_files(workdir, index) for index in range(2)]
+    # Выключенный журнал остаётся выключенным, остальные у каждого рабочего свои
+    assert set(overrides[0]) == {'VALIDATION_QUARANTINE_FILE', 'PERF_LEDGER_FILE', 'PROFILER_DIR'}
+    assert overrides[0]['VALIDATION_QUARANTINE_FILE'] != overrides[1]['VALIDATION_QUARANTINE_FILE']
+
+    for index, paths in enumerate(overrides):
+        with open(paths['PERF_LEDGER_FILE'], 'a', encoding='utf-8') as ledger:
+            ledger.write(json.dumps({'run': index}) + '\n')
+        with open(paths['VALIDATION_QUARANTINE_FILE'], 'w', encoding='utf-8') as quarantine:
+            quarantine.write(json.dumps({'worker': index}) + '\n')
+        profiles = workdir / f'profiles-{index}'
+        profiles.mkdir()
+        (profiles / 'products-20260101-000000.svg').write_text('<svg/>', encoding='utf-8')
+    for index in range(2):
+        command._merge_worker_files(workdir, index, ledger_seen=1)
+
+    ledger = (tmp_path / 'perf_ledger.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['run'] for line in ledger] == ['old', 0, 1]
+    assert len((tmp_path / 'quarantine.jsonl').read_text(encoding='utf-8').splitlines()) == 2
+    assert sorted(path.name for path in (tmp_path / 'profiles').iterdir()) == [
+        'worker-0-products-20260101-000000.svg', 'worker-1-products-20260101-000000.svg',
+    ]
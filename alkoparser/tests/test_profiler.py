@@ -0,0 +1,35 @@
+import signal
+
+from scrapy import Spider
+from scrapy.utils.test import get_crawler
+
+from alkoparser.profiler import SamplingProfiler
+
+
+def make_profiler():
+    crawler = get_crawler(Spider, {
+        'PROFILER_TOGGLE_SIGNAL': 'SIGUSR2',
+        'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor',
+    })
+    return SamplingProfiler.from_crawler(crawler), Spider('test')
+
+
+def test_closed_profiler_restores_handlers_and_ignores_toggle():
+    previous = signal.getsignal(signal.SIGUSR2)
+    first, spider = make_profiler()
+    second, _ = make_profiler()
+
+    first.spider_opened(spider)
+    # Второй обход процесса сигналы не перехватывает
+    second.spider_opened(spider)
+    assert signal.getsignal(signal.SIGUSR2) == first._toggle
+    second.spider_closed(spider, 'finished')
+    assert signal.getsignal(signal.SIGUSR2) == first._toggle
+
+    first.spider_closed(spider, 'finished')
+    assert signal.getsignal(signal.SIGUSR2) == previous
+    assert signal.getsignal(signal.SIGALRM) == signal.SIG_DFL
+    assert SamplingProfiler.active is None
+
+    first._toggle(signal.SIGUSR2, None)
+    assert not first.running
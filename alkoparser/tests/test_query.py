@@ -0,0 +1,59 @@
+import json
+from types import SimpleNamespace
+
+from scrapy import Spider
+from scrapy.utils.test import get_crawler
+
+from alkoparser.query import FeedDoneMarker, QueryService, mark_feed_done
+
+
+def product(rpc: str) -> str:
+    return json.dumps({'RPC': rpc, 'price_data': {'current': 100.0}, 'metadata': {'Город UUID': 'c'}})
+
+
+def test_feed_is_reloaded_only_when_marked_done(tmp_path):
+    feed = tmp_path / 'result.json'
+    service = QueryService(feed)
+
+    # Обход пишет JSON-массив: обрывок без отметки не читается
+    feed.write_text('[\n' + product('a') + ',\n', encoding='utf-8')
+    assert not service.reload_if_changed()
+
+    feed.write_text('[\n' + product('a') + ',\n' + product('b') + '\n]', encoding='utf-8')
+    mark_feed_done(feed, reason='finished')
+    assert service.reload_if_changed()
+    assert len(service.index) == 2
+
+    # Следующий обход переписывает файл: прежняя отметка к нему не подходит
+    feed.write_text('[\n' + product('c') + ',\n', encoding='utf-8')
+    assert not service.reload_if_changed()
+    assert len(service.index) == 2
+
+
+def test_unfinished_crawl_is_not_served(tmp_path):
+    feed = tmp_path / 'result.json'
+    service = QueryService(feed)
+    feed.write_text(product('a') + '\n', encoding='utf-8')
+    mark_feed_done(feed, reason='shutdown')
+
+    assert not service.reload_if_changed()
+    assert not service.reload_if_changed(force=True)
+    assert len(service.index) == 0
+
+    mark_feed_done(feed, reason='finished')
+    assert service.reload_if_changed()
+    assert len(service.index) == 1
+
+
+def test_extension_marks_local_feeds(tmp_path):
+    crawler = get_crawler(Spider, {'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'})
+    crawler.spider = Spider('products')
+    marker = FeedDoneMarker.from_crawler(crawler)
+    feed = tmp_path / 'result.jsonl'
+    feed.write_text(product('a') + '\n', encoding='utf-8')
+
+    marker.feed_slot_closed(SimpleNamespace(uri=feed.as_uri(), itemcount=1))
+    marker.feed_slot_closed(SimpleNamespace(uri='s3://bucket/result.jsonl', itemcount=1))
+
+    done = json.loads((tmp_path / 'result.jsonl.done').read_text(encoding='utf-8'))
+    assert done['items'] == 1 and done['size'] == feed.stat().st_size
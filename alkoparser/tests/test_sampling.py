@@ -0,0 +1,65 @@
+from alkoparser.mockserver import SyntheticCatalog
+from alkoparser.spiders.products import ProductsSpider
+
+from .helpers import MockDownloader, make_spider, run_spider
+
+
+class OverlappingCatalog(SyntheticCatalog):
+    """Каталог со «скидками»: категория из товаров двух других, как skidki на сайте."""
+
+    def __init__(self, products: int):
+        super().__init__(products=products, categories=[
+            {'name': 'Крепкое', 'slug': 'krepkoe'}, {'name': 'Вино', 'slug': 'vino'},
+            {'name': 'Скидки', 'slug': 'skidki'},
+        ])
+
+    def category_range(self, category_slug: str) -> tuple:
+        if category_slug == 'skidki':
+            return self._bounds[0][0], self._bounds[1][1]
+        return super().category_range(category_slug)
+
+
+def sample(catalog, categories: str):
+    spider = make_spider(ProductsSpider, cities=catalog.cities[0]['uuid'], categories=categories,
+                         mode='sample', seed='1')
+    summaries = []
+    original = spider.parse_product_page
+
+    def parse_product_page(response):
+        for output in original(response):
+            if type(output).__name__ == 'SampleStatsItem':
+                summaries.append(output)
+            yield output
+
+    # Сводки нужны целиком, а run_spider только считает товары по типам
+    spider.parse_product_page = parse_product_page
+    return spider, run_spider(spider, MockDownloader(catalog)), summaries
+
+
+def test_card_shared_by_strata_completes_both():
+    catalog = OverlappingCatalog(products=400)
+    spider, result, summaries = sample(catalog, 'krepkoe,skidki')
+
+    assert {summary['category_slug'] for summary in summaries} == {'krepkoe', 'skidki'}
+    assert not any(summary['partial'] for summary in summaries)
+    assert not spider.strata
+    shared = spider.crawler.stats.get_value('sample/shared_cards')
+    assert shared > 0
+    # Общая карточка запрошена один раз
+    cards = sum(summary['sample_size'] for summary in summaries) - shared
+    assert result.items['ProductRecord'] == cards
+
+
+def test_incomplete_strata_are_flushed_as_partial():
+    catalog = OverlappingCatalog(products=400)
+    spider = make_spider(ProductsSpider, cities=catalog.cities[0]['uuid'], categories='vino', mode='sample')
+    rows = catalog.product_page(catalog.cities[0]['uuid'], 'vino', 1, 1000)['results']
+    drawn = spider._draw_sample(rows, catalog.cities[0]['uuid'], 'vino')
+
+    # Первая карточка пришла, остальные отброшены до колбэка
+    assert not spider._sample_observe({'city_uuid': catalog.cities[0]['uuid'], 'category_slug': 'vino',
+                                       'product_slug': drawn[0]['slug']}, excluded=True)
+    [summary] = spider._flush_strata(None)
+
+    assert summary['partial'] and summary['excluded'] == 1 and summary['failed'] == 0
+    assert not spider.strata
@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from alkoparser.mockserver import SyntheticCatalog
+from alkoparser.spiders.categories import CategoriesSpider
+from alkoparser.spiders.cities import CitiesSpider
+from alkoparser.spiders.products import ProductsSpider
+
+from .helpers import (
+    CITIES, GROWTH_FACTOR, GROWTH_TOLERANCE, MAX_KB_PER_PRODUCT, MAX_MS_PER_CARD, PRODUCTS,
+    MockDownloader, make_spider, run_scrapy, run_spider,
+)
+
+
+def crawl_products(products: int, cities: int, trace_memory: bool = False):
+    catalog = SyntheticCatalog(products=products)
+    spider = make_spider(
+        ProductsSpider,
+        cities=','.join(city['uuid'] for city in catalog.cities[:cities]),
+        categories=','.join(category['slug'] for category in catalog.categories),
+    )
+    return run_spider(spider, MockDownloader(catalog), trace_memory=trace_memory)
+
+
+@pytest.fixture(scope='module')
+def timed():
+    """Обход на малом и большом каталоге с замером времени паука."""
+    return crawl_products(PRODUCTS, CITIES), crawl_products(PRODUCTS * GROWTH_FACTOR, CITIES)
+
+
+@pytest.fixture(scope='module')
+def traced():
+    """Те же обходы под tracemalloc: он замедляет код в разы, поэтому отдельно от
+    замера времени и по одному городу — рост памяти зависит от размера каталога."""
+    return (crawl_products(PRODUCTS, 1, trace_memory=True),
+            crawl_products(PRODUCTS * GROWTH_FACTOR, 1, trace_memory=True))
+
+
+def test_cities_spider_walks_all_pages(catalog):
+    downloader = MockDownloader(catalog)
+    result = run_spider(make_spider(CitiesSpider), downloader)
+
+    assert result.items['CitiesItem'] == len(catalog.cities) == 60
+    assert downloader.requests['/web-api/v1/city'] == 3
+
+
+def test_categories_spider_covers_every_city(catalog, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'cities_uuid.json').write_text(json.dumps(catalog.cities, ensure_ascii=False), encoding='utf-8')
+
+    result = run_spider(make_spider(CategoriesSpider), MockDownloader(catalog))
+
+    assert result.requests == len(catalog.cities)
+    assert result.items['CategoriesItem'] == len(catalog.cities) * len(catalog.categories)
+
+
+def test_products_spider_yields_every_card(catalog, timed):
+    result, _ = timed
+
+    assert result.items['ProductRecord'] == PRODUCTS * CITIES
+    # Справочник магазинов: каждый магазин не больше одного раза
+    assert result.items['StoresItem'] <= sum(len(catalog.stores(city['uuid'])) for city in catalog.cities[:CITIES])
+
+
+def test_products_spider_throughput_budget(timed):
+    _, result = timed
+
+    ms_per_card = result.spider_seconds * 1000 / result.items['ProductRecord']
+    assert ms_per_card <= MAX_MS_PER_CARD, f"{ms_per_card:.3f} мс на карточку"
+
+
+def test_products_spider_memory_budget(traced):
+    _, result = traced
+
+    kb_per_product = result.peak_bytes / 1024 / (PRODUCTS * GROWTH_FACTOR)
+    assert kb_per_product <= MAX_KB_PER_PRODUCT, f"{kb_per_product:.1f} КБ на товар"
+
+
+def test_products_spider_cpu_grows_linearly(timed):
+    small, large = timed
+
+    per_card_small = small.spider_seconds / small.items['ProductRecord']
+    per_card_large = large.spider_seconds / large.items['ProductRecord']
+    assert per_card_large <= per_card_small * GROWTH_TOLERANCE, (
+        f"время на карточку выросло в {per_card_large / per_card_small:.2f} раза "
+        f"при росте каталога в {GROWTH_FACTOR} раза"
+    )
+
+
+def test_products_spider_memory_grows_linearly(traced):
+    small, large = traced
+
+    growth = large.peak_bytes / small.peak_bytes
+    assert growth <= GROWTH_FACTOR * GROWTH_TOLERANCE, (
+        f"пик памяти вырос в {growth:.2f} раза при росте каталога в {GROWTH_FACTOR} раза"
+    )
+
+
+def engine_crawl(mock_api, workdir, products: int) -> dict:
+    """Обход настоящим движком: планировщик карточек, фильтр повторов, middleware и конвейеры."""
+    catalog = SyntheticCatalog(products=products)
+    workdir.mkdir()
+    return run_scrapy(
+        workdir, 'crawl', 'products',
+        '-a', f"cities={catalog.cities[0]['uuid']}",
+        '-a', f"categories={','.join(category['slug'] for category in catalog.categories)}",
+        settings={'ALKOTEKA_BASE_URL': mock_api(catalog), 'MEMUSAGE_CHECK_INTERVAL_SECONDS': '0.5'},
+    )
+
+
+def test_engine_crawl_keeps_card_queue_off_heap(mock_api, tmp_path):
+    small = engine_crawl(mock_api, tmp_path / 'small', PRODUCTS)
+    large = engine_crawl(mock_api, tmp_path / 'large', PRODUCTS * GROWTH_FACTOR)
+
+    for stats, products in ((small, PRODUCTS), (large, PRODUCTS * GROWTH_FACTOR)):
+        # Каждая карточка прошла через дисковую очередь CardScheduler и конвейер проверки
+        assert stats['scheduler/enqueued/cards'] == stats['scheduler/dequeued/cards'] == products
+        assert stats['validation/ok'] == products
+        assert stats.get('log_count/ERROR', 0) == 0
+
+    kb_per_product = (large['memusage/max'] - small['memusage/max']) / 1024 / (PRODUCTS * (GROWTH_FACTOR - 1))
+    assert kb_per_product <= MAX_KB_PER_PRODUCT, f"{kb_per_product:.1f} КБ на товар"
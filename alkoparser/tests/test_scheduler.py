@@ -0,0 +1,56 @@
+from alkoparser.scheduler import CardQueue
+from alkoparser.spiders.products import ProductsSpider
+
+from .helpers import make_spider
+
+
+def card(slug: str, priority: int = 0) -> tuple:
+    return slug, 'city', 'vino', f'https://alkoteka.com/product/vino/{slug}', priority
+
+
+def drain(queue: CardQueue) -> list:
+    slugs = []
+    while (record := queue.pop()) is not None:
+        slugs.append(record[0])
+    return slugs
+
+
+def test_higher_priority_overtakes_buffered_cards(tmp_path):
+    queue = CardQueue(tmp_path / 'cards', buffer_size=2)
+    for record in (card('low-1'), card('low-2'), card('high', 5), card('low-3'), card('top', 9)):
+        queue.push(record)
+
+    # low-1 и low-2 в буфере, остальные ушли на диск
+    assert len(queue.buffer) == 2 and len(queue.disk) == 3
+    assert drain(queue) == ['top', 'high', 'low-1', 'low-2', 'low-3']
+    assert len(queue) == 0
+
+
+def test_records_keep_product_url(tmp_path):
+    queue = CardQueue(tmp_path / 'cards', buffer_size=1)
+    queue.push(card('a'))
+    queue.push(card('b'))
+
+    assert [queue.pop(), queue.pop()] == [card('a'), card('b')]
+
+
+def test_close_and_resume_under_jobdir(tmp_path):
+    queue = CardQueue(tmp_path / 'cards', buffer_size=2)
+    for record in (card('a'), card('b', 3), card('c'), card('d', 3)):
+        queue.push(record)
+    queue.close()
+
+    assert (tmp_path / 'cards' / 'active.json').exists() and (tmp_path / 'cards' / 'buffer.json').exists()
+    resumed = CardQueue(tmp_path / 'cards', buffer_size=2)
+    assert len(resumed) == 4
+    assert drain(resumed) == ['b', 'd', 'a', 'c']
+    resumed.close()
+    assert len(CardQueue(tmp_path / 'cards')) == 0
+
+
+def test_card_request_restores_product_url():
+    spider = make_spider(ProductsSpider)
+    request = spider.card_request(*card('a', 2)[:3], priority=2, product_url=card('a')[3])
+
+    assert request.priority == 2
+    assert request.meta['product_url'] == 'https://alkoteka.com/product/vino/a'
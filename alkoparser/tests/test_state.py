@@ -0,0 +1,28 @@
+from alkoparser.outbox import Outbox
+from alkoparser.state import StateStore
+
+
+def test_two_processes_write_one_state_file(tmp_path):
+    # Два соединения — как два рабочих scrapy plan с общим файлом в каталоге запуска
+    first = StateStore(tmp_path / 'state.sqlite', timeout=0.1)
+    second = StateStore(tmp_path / 'state.sqlite', timeout=0.1)
+    for i in range(100):
+        first.set(f'a{i}', {'price': i})
+        second.set(f'b{i}', {'price': i})
+
+    assert len(first) == len(second) == 200
+    first.close()
+    second.close()
+
+
+def test_outbox_pipelines_of_two_processes_interleave(tmp_path):
+    first, second = Outbox(tmp_path / 'outbox.sqlite', timeout=0.1), Outbox(tmp_path / 'outbox.sqlite', timeout=0.1)
+    states = [StateStore(outbox.path, table='outbox_state', db=outbox.db) for outbox in (first, second)]
+    for i in range(50):
+        for outbox, state in zip((first, second), states):
+            outbox.append({'key': i})
+            state.set(f'{outbox is first}|{i}', {'price': i})
+
+    assert first.last_id() == 100
+    first.close()
+    second.close()
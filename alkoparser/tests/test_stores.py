@@ -0,0 +1,40 @@
+from alkoparser.spiders.products import ProductsSpider
+
+from .helpers import make_spider
+
+
+def card(*stores) -> dict:
+    return {'availability': {'stores': [{'quantity': '5 шт', 'title': 'Магазин', **store} for store in stores]}}
+
+
+def test_stores_without_uuid_are_skipped():
+    spider = make_spider(ProductsSpider)
+    stores, new = spider._parse_stores(card({'uuid': 'a'}, {'uuid': ''}, {}), 'city')
+
+    assert [store['uuid'] for _, store, _ in stores] == ['a']
+    assert spider.crawler.stats.get_value('stores/missing_uuid') == 2
+    [item] = spider._new_stores('city', new)
+    assert [store['uuid'] for store in item['stores']] == ['a']
+
+
+def test_store_ids_are_stable_and_json_safe():
+    assert ProductsSpider.store_id('a') == ProductsSpider.store_id('a') != ProductsSpider.store_id('b')
+    assert 0 <= ProductsSpider.store_id('a') < 2 ** 53
+
+
+def test_colliding_store_ids_are_resolved_per_city(monkeypatch):
+    spider = make_spider(ProductsSpider)
+    # Все магазины без соли получают один номер
+    monkeypatch.setattr(ProductsSpider, 'store_id', staticmethod(lambda uuid, salt=0: salt))
+
+    stores, new = spider._parse_stores(card({'uuid': 'a'}, {'uuid': 'b'}), 'city')
+    assert [store_id for store_id, _, _ in stores] == [0, 1]
+    assert len(new) == 2
+    assert spider.crawler.stats.get_value('stores/id_collisions') == 1
+
+    # Следующие карточки получают те же номера и новых магазинов не дают
+    stores, new = spider._parse_stores(card({'uuid': 'b'}, {'uuid': 'a'}), 'city')
+    assert [store_id for store_id, _, _ in stores] == [1, 0] and not new
+    # В другом городе номера независимы
+    stores, _ = spider._parse_stores(card({'uuid': 'b'}), 'other')
+    assert [store_id for store_id, _, _ in stores] == [0]
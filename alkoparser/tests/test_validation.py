@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from scrapy.exceptions import DropItem
+from scrapy.utils.test import get_crawler
+
+from alkoparser.pipelines import ValidationPipeline
+
+
+def product(rpc: str, price: float, original: float = 0.0, section: str = 'Вино') -> dict:
+    discount = f"Скидка {round((1 - price / original) * 100, 1)}%" if original > price else ""
+    return {
+        'RPC': rpc, 'url': f'https://alkoteka.com/product/{rpc}', 'title': rpc, 'section': [section],
+        'price_data': {'current': price, 'original': original, 'sale_tag': discount},
+        'stock': {'in_stock': True, 'count': 1},
+        'metadata': {'Город UUID': 'city'},
+    }
+
+
+def make_pipeline(tmp_path, **settings):
+    crawler = get_crawler(settings_dict={
+        'VALIDATION_STATE_FILE': str(tmp_path / 'state.sqlite'),
+        'VALIDATION_QUARANTINE_FILE': str(tmp_path / 'quarantine.jsonl'),
+        'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor',
+        **settings,
+    })
+    return ValidationPipeline.from_crawler(crawler)
+
+
+def run(pipeline, items: list) -> list:
+    passed = []
+    for item in items:
+        try:
+            passed.append(pipeline.process_item(item, None))
+        except DropItem:
+            pass
+    return passed
+
+
+def broken(**changes) -> dict:
+    item = product('a', 1000.0)
+    for path, value in changes.items():
+        *parents, name = path.split('__')
+        target = item
+        for parent in parents:
+            target = target[parent]
+        target[name] = value
+    return item
+
+
+@pytest.mark.parametrize('item, reasons', [
+    (broken(price_data__current=0.0), ['price:zero']),
+    (broken(RPC=''), ['RPC:missing']),
+    (broken(price_data__sale_tag='Скидка 10%'), ['sale_tag:without_discount']),
+    (broken(stock__count=-3), ['stock:negative']),
+    (broken(price_data__current=0.0, RPC=''), ['RPC:missing', 'price:zero']),
+])
+def test_broken_products_are_dropped_into_quarantine(tmp_path, item, reasons):
+    pipeline = make_pipeline(tmp_path)
+    with pytest.raises(DropItem):
+        pipeline.process_item(item, None)
+    pipeline.close_spider(None)
+
+    record = json.loads((tmp_path / 'quarantine.jsonl').read_text(encoding='utf-8'))
+    assert record['reasons'] == reasons and 'flagged' not in record
+    assert record['item']['url'] == item['url']
+    assert pipeline.stats.get_value('validation/quarantined') == 1
+    for code in reasons:
+        assert pipeline.stats.get_value(f'validation/reason/{code}') == 1
+
+
+def test_non_product_spiders_leave_no_files(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    item = {'uuid': 'city', 'name': 'Москва', 'slug': 'moskva'}
+    assert pipeline.process_item(item, None) is item
+    pipeline.close_spider(None)
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_promo_and_its_end_are_not_jumps(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    run(pipeline, [product('a', 1000.0)])
+    # Скидка 40%: прежняя цена стала зачёркнутой
+    run(pipeline, [product('a', 600.0, original=1000.0)])
+    run(pipeline, [product('a', 1000.0)])
+
+    assert pipeline.stats.get_value('validation/flagged/price:jump') is None
+    assert pipeline.stats.get_value('validation/price_change/explained') == 2
+
+
+def test_jump_is_flagged_but_not_dropped_by_default(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    run(pipeline, [product('a', 1000.0)])
+    passed = run(pipeline, [product('a', 3000.0)])
+    pipeline.close_spider(None)
+
+    assert len(passed) == 1
+    assert pipeline.stats.get_value('validation/flagged/price:jump') == 1
+    record = json.loads((tmp_path / 'quarantine.jsonl').read_text(encoding='utf-8'))
+    assert record['flagged'] and record['reasons'] == ['price:jump']
+
+
+@pytest.mark.parametrize('quarantine', [False, True])
+def test_unchanged_prices_do_not_shrink_category_spread(tmp_path, quarantine):
+    pipeline = make_pipeline(tmp_path, VALIDATION_PRICE_MIN_SAMPLES=5, VALIDATION_QUARANTINE_ANOMALIES=quarantine)
+    base = [product(f'p{i}', 1000.0) for i in range(50)]
+    run(pipeline, base)
+    # Цены, которые колеблются на ±40%, и много товаров без изменений
+    run(pipeline, [product(f'p{i}', 1000.0 * (1.4 if i % 2 else 0.6)) for i in range(10)] + base[10:])
+
+    assert pipeline.moments['Вино'][0] == 10
+    passed = run(pipeline, [product('p10', 1450.0)])
+    assert len(passed) == 1